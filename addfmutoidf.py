@@ -9,10 +9,10 @@ then parses that using the parseidf module.
 
 The output is printed to stdout.
 '''
-import polygons
-import itertools
-
-reload(polygons)
+import geometrymemo
+import surfacevertices
+import contextlib
+import string
 
 
 # some helper functions for creating ids and idfs
@@ -52,6 +52,9 @@ def contains(idf, *obj):
     """find an idf object that matches the elements in obj,
     obj may be shorter than the element being searched for.
     return True if such an object was found, otherwise False"""
+    index = idf.__dict__.get('_contents_index')
+    if index is not None:
+        return index.contains(obj)
     key = obj[0].upper()
     if key in idf.idfobjects:
         for o in idf.idfobjects[key]:
@@ -76,23 +79,54 @@ def ensure_contains(idf, *obj):
         key = obj[0].upper()
         newobj = idf.newidfobject(key)
         newobj.obj = [key] + list(obj[1:])
+        index = idf.__dict__.get('_contents_index')
+        if index is not None:
+            index.add(newobj.obj)
         return idf
 
 
-def add_fmu_to_idf(idf):
-    '''set up the file for FMU export'''
-    return ensure_contains(idf,
-                           'ExternalInterface',
-                           'FunctionalMockupUnitExport')
-
+class ContentsIndex(object):
+    """a hash index of the (upper-cased) leading fields of the objects
+    in an idf, so that `contains` doesn't need to scan all the objects
+    of a class on each call.
+    the prefix tuples are collected per class and prefix length the first
+    time they are needed and updated as `ensure_contains` adds objects."""
+    def __init__(self, idf):
+        self.idf = idf
+        self.prefixes = {}  # KEY -> {length: set(prefix tuples)}
 
-def produce_edd(idf):
-    '''make sure the .edd file is written'''
-    return ensure_contains(idf,
-                           'Output:EnergyManagementSystem',
-                           'Verbose',
-                           'Verbose',
-                           'ErrorsOnly')
+    def contains(self, obj):
+        key = obj[0].upper()
+        if key not in self.idf.idfobjects:
+            return False
+        return tuple(map(upper, obj)) in self.prefixes_for(key, len(obj))
+
+    def prefixes_for(self, key, length):
+        by_length = self.prefixes.setdefault(key, {})
+        if length not in by_length:
+            by_length[length] = set(
+                tuple(map(upper, o.obj[:length]))
+                for o in self.idf.idfobjects[key]
+                if len(o.obj) >= length)
+        return by_length[length]
+
+    def add(self, fields):
+        key = fields[0].upper()
+        for length, prefixes in self.prefixes.get(key, {}).items():
+            if len(fields) >= length:
+                prefixes.add(tuple(map(upper, fields[:length])))
+
+
+@contextlib.contextmanager
+def indexed_contents(idf):
+    """use a ContentsIndex for `contains` and `ensure_contains` calls on
+    idf while in the with-block. the idf should not be changed by other
+    means while the index is in use."""
+    idf.__dict__['_contents_index'] = ContentsIndex(idf)
+    try:
+        yield idf
+    finally:
+        del idf.__dict__['_contents_index']
 
 
 def exterior_walls(idf):
@@ -150,574 +184,300 @@ def sane(id):
 
 def area(obj):
     '''returns the area of a surface'''
-    start_index = obj.objls.index('Number_of_Vertices') + 1
-    vertices = obj.obj[start_index:]
-    polygon = zip(map(float, vertices[::3]),
-                  map(float, vertices[1::3]),
-                  map(float, vertices[2::3]))
+    polygon = surfacevertices.vertices(obj)
     try:
-        return polygons.area(polygon)
+        return geometrymemo.area(polygon)
     except:
         print 'addfmutoidf.area - ERROR:', polygon
         raise
 
 
-def add_outside_surface_temperature(idf):
-    '''
-    add the necessary objects to output the surface temperatures
-    as an fmu. Also, output them as normal variables.
-    '''
-    idf = ensure_contains(idf,
-                          'Output:Variable', '*',
-                          'Surface Outside Face Temperature',
-                          'timestep')
-    idf = ensure_contains(idf,
-                          'Output:Variable', '*',
-                          'Surface Inside Face Temperature',
-                          'timestep')
-    for wall in exterior_walls(idf):
-        idf = ensure_contains(
-            idf,
-            'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-            '%s' % id(wall),
-            'Surface Outside Face Temperature',
-            '%s::Outside Surface Temperature' % id(wall))
-    for roof in roofs(idf):
-        idf = ensure_contains(
-            idf,
-            'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-            '%s' % id(roof),
-            'Surface Outside Face Temperature',
-            '%s::Outside Surface Temperature' % id(roof))
-    return idf
-
-
-def add_average_outside_surface_temperature(idf):
-    """
-    adds the necessary objects to output the average surface
-    temperatures of walls (including windows).
-    this includes:
-        - ems sensors for walls and windows
-        - a global variable (awtX) per wall
-        - output variables (for debugging?)
-        - FMU output variables for the global variables
-        - a program calling manager
-        - a program
-        - a routine for each wall to update the value
-    """
-    # ems sensors for walls
-    for wall in exterior_walls(idf):
-        idf = ensure_contains(
-            idf,
-            'EnergyManagementSystem:Sensor',
-            'w%i' % id_map(id(wall)),
-            id(wall),
-            'Surface Outside Face Temperature')
-    # ems sensors for windows
-    for window in idf.idfobjects['FENESTRATIONSURFACE:DETAILED']:
-        idf = ensure_contains(
-            idf,
-            'EnergyManagementSystem:Sensor',
-            'f%i' % id_map(id(window)),
-            id(window),
-            'Surface Outside Face Temperature')
-    return idf
-
-
-def add_zone_ideal_loads_energy(idf):
-    """add fmu output of
-       -   Zone Ideal Loads Zone Total Heating Energy
-       -   Zone Ideal Loads Zone Total Cooling Energy
-    """
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:GlobalVariable',
-        'gv_the')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:OutputVariable',
-        'GV Total Heating Energy',
-        'gv_the',
-        'Averaged',
-        'ZoneTimestep',
-        '',
-        'C')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'GV Total Heating Energy',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-        'EMS',
-        'GV Total Heating Energy',
-        'SINGLE_ZONE::Total Heating Energy')
-
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:GlobalVariable',
-        'gv_tce')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:OutputVariable',
-        'GV Total Cooling Energy',
-        'gv_tce',
-        'Averaged',
-        'ZoneTimestep',
-        '',
-        'C')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'GV Total Cooling Energy',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-        'EMS',
-        'GV Total Cooling Energy',
-        'SINGLE_ZONE::Total Cooling Energy')
-
-    for zone in zones(idf):
-        zid = id(zone)
-        if is_lowex(idf):
-            idf = lowex_total_heating_energy(idf, zid)
-        else:
-            idf = hvac_template_total_heating_energy(idf, zid)
-            idf = ensure_contains(
-                idf,
-                'Output:Variable',
-                '*',
-                'Zone Ideal Loads Zone Total Heating Energy',
-                'timestep')
-            idf = ensure_contains(
-                idf,
-                'Output:Variable',
-                '*',
-                'Zone Ideal Loads Zone Total Cooling Energy',
-                'timestep')
-
-    # program calling manager, program, update routines for the zhe, zce vars
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:ProgramCallingManager',
-        'update_zhe_every_timestep',
-        'BeginTimestepBeforePredictor',
-        'update_zhe_variables',
-        'update_zce_variables')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:Program',
-        'update_zhe_variables',
-        'SET gv_the = 0',
-        *['SET gv_the = gv_the + zhe%i' % id_map(id(zone))
-          for zone in zones(idf)])
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:Program',
-        'update_zce_variables',
-        'SET gv_tce = 0',
-        *['SET gv_tce = gv_tce + zce%i' % id_map(id(zone))
-          for zone in zones(idf)])
-    return idf
-
-
 def is_lowex(idf):
     """True, if the model uses the HVAC template for Ideal Loads"""
     return contains(idf, 'EnergyManagementSystem:OutputVariable',
                     '%s Total Heating Energy {J}' % id(zones(idf)[0]))
 
 
-def hvac_template_total_heating_energy(idf, zid):
-    """Use the variables from the HVAC Template to create the fmu
-    export variable for Total Heating/Cooling Energy.
-    zhe stands for Zone Heating Energy
-    zce stands for Zone Cooling Energy"""
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:Sensor',
-        'zhe%i' % id_map(zid),
-        zid + 'ZONEHVAC:IDEALLOADSAIRSYSTEM',
-        'Zone Ideal Loads Zone Total Heating Energy')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:Sensor',
-        'zce%i' % id_map(zid),
-        zid + 'ZONEHVAC:IDEALLOADSAIRSYSTEM',
-        'Zone Ideal Loads Zone Total Cooling Energy')
-    return idf
-
-
-def lowex_total_heating_energy(idf, zid):
-    """Use the ems variables from the LowEx Template to create the fmu
-    export variable for Total Heating/Cooling Energy"""
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-        'EMS',
-        '%s Total Heating Energy' % zid,
-        '%s::Total Heating Energy' % zid)
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-        'EMS',
-        '%s Total Cooling Energy' % zid,
-        '%s::Total Cooling Energy' % zid)
-    return idf
-
-
-def add_zone_mean_air_temperature(idf):
-    """add fmu output of
-       - Mean Air Temperature
-    for each zone.
-    """
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Mean Air Temperature',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:GlobalVariable',
-        'gv_mat')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:OutputVariable',
-        'GV Mean Air Temperature',
-        'gv_mat',
-        'Averaged',
-        'ZoneTimestep',
-        '',
-        'C')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'GV Mean Air Temperature',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-        'EMS',
-        'GV Mean Air Temperature',
-        'SINGLE_ZONE::Mean Air Temperature')
-
-    for zone in zones(idf):
-        zid = id(zone)
-        idf = ensure_contains(
-            idf,
-            'EnergyManagementSystem:Sensor',
-            'zmat%i' % id_map(zid),
-            zid,
-            'Zone Mean Air Temperature')
-
-    # program calling manager, program, update routines for the zmat vars
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:ProgramCallingManager',
-        'update_zmat_every_timestep',
-        'BeginTimestepBeforePredictor',
-        'update_zmat_variables')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:Program',
-        'update_zmat_variables',
-        'SET gv_mat = 0',
-        *['SET gv_mat = gv_mat + zmat%i / %i' % (id_map(id(zone)), len(zones(idf)))
-          for zone in zones(idf)])
-    return idf
-
-
-def add_ventilation_volume_flow_rate(idf):
-    """add fmu output of 'Zone Ventilation Standard Density Volume Flow Rate'
-    for each zone."""
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Ventilation Standard Density Volume Flow Rate',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:GlobalVariable',
-        'gv_vvfr')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:OutputVariable',
-        'GV Ventilation Volume Flow Rate',
-        'gv_vvfr',
-        'Averaged',
-        'ZoneTimestep',
-        '',
-        'C')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'GV Ventilation Volume Flow Rate',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:From:Variable',
-        'EMS',
-        'GV Ventilation Volume Flow Rate',
-        'SINGLE_ZONE::Ventilation Volume Flow Rate')
-
-    for zone in zones(idf):
-        zid = id(zone)
-        idf = ensure_contains(
-            idf,
-            'EnergyManagementSystem:Sensor',
-            'zvvfr%i' % id_map(zid),
-            zid,
-            'Zone Ventilation Standard Density Volume Flow Rate')
-
-    # program calling manager, program, update routines for the zmat vars
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:ProgramCallingManager',
-        'update_vvfr_every_timestep',
-        'BeginTimestepBeforePredictor',
-        'update_vvfr_variables')
-    idf = ensure_contains(
-        idf,
-        'EnergyManagementSystem:Program',
-        'update_vvfr_variables',
-        'SET gv_vvfr = 0',
-        *['SET gv_vvfr = gv_vvfr + zvvfr%i / %i' % (id_map(id(zone)), len(zones(idf)))
-          for zone in zones(idf)])
-    return idf
-
-
-def add_occupation_actuator(idf):
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'Occupation::Actuator',  # EnergyPlus Variable Name
-        'OCCUPATIONSCHEDULE',  # Actuated Component Unique Name
-        'Schedule:Compact',  # Actuated Component Type
-        'Schedule Value',  # Actuated Component Control Type
-        'SINGLE_ZONE::Occupation',  # FMU Variable Name
-        '0')  # Initial Value
-    return idf
-
-
-def add_weather_actuators(idf):
-    """add the actuators for the weather interface to CitySim"""
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimOutdoorDryBulb',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Outdoor Dry Bulb',  # Actuated Component Control Type
-        'Outdoor Drybulb',  # FMU Variable Name
-        '0')  # Initial Value
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimOutdoorDewPoint',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Outdoor Dew Point',  # Actuated Component Control Type
-        'Outdoor Dewpoint',  # FMU Variable Name
-        '0')  # Initial Value
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimOutdoorRelativeHumidity',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Outdoor Relative Humidity',  # Actuated Component Control Type
-        'Outdoor Relative Humidity',  # FMU Variable Name
-        '0')  # Initial Value
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimDiffuseSolar',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Diffuse Solar',  # Actuated Component Control Type
-        'Diffuse Solar',  # FMU Variable Name
-        '0')  # Initial Value
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimDirectSolar',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Direct Solar',  # Actuated Component Control Type
-        'Direct Solar',  # FMU Variable Name
-        '0')  # Initial Value
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimWindSpeed',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Wind Speed',  # Actuated Component Control Type
-        'Wind Speed',  # FMU Variable Name
-        '0')  # Initial Value
-    idf = ensure_contains(
-        idf,
-        'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-        'CitySimWindDirection',  # EnergyPlus Variable Name
-        'Environment',  # Actuated Component Unique Name
-        'Weather Data',  # Actuated Component Type
-        'Wind Direction',  # Actuated Component Control Type
-        'Wind Direction',  # FMU Variable Name
-        '0')  # Initial Value
-    return idf
-
-
-def add_output_variables(idf):
-    '''
-    Add some default output variables that we want to see in all simulations.
-    FIXME: this is a quick hack because I have no time to debug why the
-    Settings.xml in the %APPDATA% folder is not being honoured...
-    '''
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'People Total Heating Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Lights Total Heating Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Electric Equipment Total Heating Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Facility Total Produced Electric Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Infiltration Total Heat Loss Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Ventilation Total Heat Loss Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Surface Inside Face Conduction Heat Loss Rate',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Surface Inside Face Conduction Heat Gain Rate',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Surface Inside Face Temperature',
-        'hourly')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Windows Total Heat Gain Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Windows Total Heat Loss Energy',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Surface Outside Face Outdoor Air Wind Speed',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Site Direct Solar Radiation Rate per Area',
-        'RunPeriod')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Ideal Loads Zone Total Heating Energy',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Zone Ideal Loads Zone Total Cooling Energy',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Site Outdoor Air Drybulb Temperature',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Site Outdoor Air Dewpoint Temperature',
-        'timestep')
-    idf = ensure_contains(
-        idf,
-        'Output:Variable',
-        '*',
-        'Site Diffuse Solar Radiation Rate per Area',
-        'timestep')
-    return idf
-
-
-def add_lwr_fmi(idf):
-    """
-    add fmi variables per surface to accept TEnv and HEnv.
-    add a program to pass those variables on to the LWR actuators.
-    """
-    for surface in itertools.chain(exterior_walls(idf), roofs(idf)):
-        sid = id(surface)
-        vid = id_map(sid)
-        idf = ensure_contains(
-            idf,
-            'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-            'henv%i' % vid,  # EnergyPlus Variable Name
-            sid,  # Actuated Component Unique Name
-            'Surface',  # Actuated Component Type
-            'Exterior Surface Environment Radiation Coefficient',  # noqa Actuated Component Control Type
-            '%s::Henv' % sid,  # FMU Variable Name
-            '0.0')  # Initial Value
-        idf = ensure_contains(
-            idf,
-            'ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
-            'tenv%i' % vid,  # EnergyPlus Variable Name
-            sid,  # Actuated Component Unique Name
-            'Surface',  # Actuated Component Type
-            'Exterior Surface Environment Temperature For Radiation Exchange',  # noqa Actuated Component Control Type
-            '%s::Tenv' % sid,  # FMU Variable Name
-            '0.0')  # Initial Value
-    return idf
+# The FMU interface to CitySim, as a list of (scope, objects). For each item
+# in the scope (see collect_scopes), each of the objects is added to the idf
+# (unless already contained). The fields of the objects are templates for
+# str.format with these keys:
+#   - name: the Name of the surface or zone
+#   - vid: a short unique id for the name (see id_map)
+#   - nzones: the number of zones in the idf
+# a (scope, template) tuple as a field expands to one field per item of the
+# scope (used for the EMS programs summing up the zones).
+INTERFACE = [
+    # set up the file for FMU export
+    ('global', [
+        ('ExternalInterface', 'FunctionalMockupUnitExport'),
+        # make sure the .edd file is written
+        ('Output:EnergyManagementSystem', 'Verbose', 'Verbose', 'ErrorsOnly'),
+        # output the surface temperatures as an fmu and as normal variables
+        ('Output:Variable', '*', 'Surface Outside Face Temperature',
+         'timestep'),
+        ('Output:Variable', '*', 'Surface Inside Face Temperature',
+         'timestep')]),
+    ('wall', [
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         '{name}', 'Surface Outside Face Temperature',
+         '{name}::Outside Surface Temperature')]),
+    ('roof', [
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         '{name}', 'Surface Outside Face Temperature',
+         '{name}::Outside Surface Temperature')]),
+    # ems sensors for the average surface temperatures of walls and windows
+    ('wall', [
+        ('EnergyManagementSystem:Sensor', 'w{vid}', '{name}',
+         'Surface Outside Face Temperature')]),
+    ('window', [
+        ('EnergyManagementSystem:Sensor', 'f{vid}', '{name}',
+         'Surface Outside Face Temperature')]),
+    # Zone Ideal Loads Zone Total Heating / Cooling Energy
+    ('global', [
+        ('EnergyManagementSystem:GlobalVariable', 'gv_the'),
+        ('EnergyManagementSystem:OutputVariable', 'GV Total Heating Energy',
+         'gv_the', 'Averaged', 'ZoneTimestep', '', 'C'),
+        ('Output:Variable', '*', 'GV Total Heating Energy', 'timestep'),
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         'EMS', 'GV Total Heating Energy',
+         'SINGLE_ZONE::Total Heating Energy'),
+        ('EnergyManagementSystem:GlobalVariable', 'gv_tce'),
+        ('EnergyManagementSystem:OutputVariable', 'GV Total Cooling Energy',
+         'gv_tce', 'Averaged', 'ZoneTimestep', '', 'C'),
+        ('Output:Variable', '*', 'GV Total Cooling Energy', 'timestep'),
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         'EMS', 'GV Total Cooling Energy',
+         'SINGLE_ZONE::Total Cooling Energy')]),
+    # the LowEx template provides ems variables for the zone energy
+    ('lowex_zone', [
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         'EMS', '{name} Total Heating Energy',
+         '{name}::Total Heating Energy'),
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         'EMS', '{name} Total Cooling Energy',
+         '{name}::Total Cooling Energy')]),
+    # else use the variables from the HVAC Template.
+    # zhe stands for Zone Heating Energy, zce for Zone Cooling Energy
+    ('hvac_template_zone', [
+        ('EnergyManagementSystem:Sensor', 'zhe{vid}',
+         '{name}ZONEHVAC:IDEALLOADSAIRSYSTEM',
+         'Zone Ideal Loads Zone Total Heating Energy'),
+        ('EnergyManagementSystem:Sensor', 'zce{vid}',
+         '{name}ZONEHVAC:IDEALLOADSAIRSYSTEM',
+         'Zone Ideal Loads Zone Total Cooling Energy'),
+        ('Output:Variable', '*', 'Zone Ideal Loads Zone Total Heating Energy',
+         'timestep'),
+        ('Output:Variable', '*', 'Zone Ideal Loads Zone Total Cooling Energy',
+         'timestep')]),
+    ('global', [
+        ('EnergyManagementSystem:ProgramCallingManager',
+         'update_zhe_every_timestep', 'BeginTimestepBeforePredictor',
+         'update_zhe_variables', 'update_zce_variables'),
+        ('EnergyManagementSystem:Program', 'update_zhe_variables',
+         'SET gv_the = 0', ('zone', 'SET gv_the = gv_the + zhe{vid}')),
+        ('EnergyManagementSystem:Program', 'update_zce_variables',
+         'SET gv_tce = 0', ('zone', 'SET gv_tce = gv_tce + zce{vid}'))]),
+    # Zone Mean Air Temperature
+    ('global', [
+        ('Output:Variable', '*', 'Zone Mean Air Temperature', 'timestep'),
+        ('EnergyManagementSystem:GlobalVariable', 'gv_mat'),
+        ('EnergyManagementSystem:OutputVariable', 'GV Mean Air Temperature',
+         'gv_mat', 'Averaged', 'ZoneTimestep', '', 'C'),
+        ('Output:Variable', '*', 'GV Mean Air Temperature', 'timestep'),
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         'EMS', 'GV Mean Air Temperature',
+         'SINGLE_ZONE::Mean Air Temperature')]),
+    ('zone', [
+        ('EnergyManagementSystem:Sensor', 'zmat{vid}', '{name}',
+         'Zone Mean Air Temperature')]),
+    ('global', [
+        ('EnergyManagementSystem:ProgramCallingManager',
+         'update_zmat_every_timestep', 'BeginTimestepBeforePredictor',
+         'update_zmat_variables'),
+        ('EnergyManagementSystem:Program', 'update_zmat_variables',
+         'SET gv_mat = 0',
+         ('zone', 'SET gv_mat = gv_mat + zmat{vid} / {nzones}'))]),
+    # Zone Ventilation Standard Density Volume Flow Rate
+    ('global', [
+        ('Output:Variable', '*',
+         'Zone Ventilation Standard Density Volume Flow Rate', 'timestep'),
+        ('EnergyManagementSystem:GlobalVariable', 'gv_vvfr'),
+        ('EnergyManagementSystem:OutputVariable',
+         'GV Ventilation Volume Flow Rate', 'gv_vvfr', 'Averaged',
+         'ZoneTimestep', '', 'C'),
+        ('Output:Variable', '*', 'GV Ventilation Volume Flow Rate',
+         'timestep'),
+        ('ExternalInterface:FunctionalMockupUnitExport:From:Variable',
+         'EMS', 'GV Ventilation Volume Flow Rate',
+         'SINGLE_ZONE::Ventilation Volume Flow Rate')]),
+    ('zone', [
+        ('EnergyManagementSystem:Sensor', 'zvvfr{vid}', '{name}',
+         'Zone Ventilation Standard Density Volume Flow Rate')]),
+    ('global', [
+        ('EnergyManagementSystem:ProgramCallingManager',
+         'update_vvfr_every_timestep', 'BeginTimestepBeforePredictor',
+         'update_vvfr_variables'),
+        ('EnergyManagementSystem:Program', 'update_vvfr_variables',
+         'SET gv_vvfr = 0',
+         ('zone', 'SET gv_vvfr = gv_vvfr + zvvfr{vid} / {nzones}'))]),
+    # the actuators for the weather interface to CitySim and occupation:
+    # EnergyPlus Variable Name, Actuated Component Unique Name,
+    # Actuated Component Type, Actuated Component Control Type,
+    # FMU Variable Name, Initial Value
+    ('global', [
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimOutdoorDryBulb', 'Environment', 'Weather Data',
+         'Outdoor Dry Bulb', 'Outdoor Drybulb', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimOutdoorDewPoint', 'Environment', 'Weather Data',
+         'Outdoor Dew Point', 'Outdoor Dewpoint', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimOutdoorRelativeHumidity', 'Environment', 'Weather Data',
+         'Outdoor Relative Humidity', 'Outdoor Relative Humidity', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimDiffuseSolar', 'Environment', 'Weather Data',
+         'Diffuse Solar', 'Diffuse Solar', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimDirectSolar', 'Environment', 'Weather Data',
+         'Direct Solar', 'Direct Solar', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimWindSpeed', 'Environment', 'Weather Data',
+         'Wind Speed', 'Wind Speed', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'CitySimWindDirection', 'Environment', 'Weather Data',
+         'Wind Direction', 'Wind Direction', '0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'Occupation::Actuator', 'OCCUPATIONSCHEDULE', 'Schedule:Compact',
+         'Schedule Value', 'SINGLE_ZONE::Occupation', '0')]),
+    # some default output variables that we want to see in all simulations.
+    # FIXME: this is a quick hack because I have no time to debug why the
+    # Settings.xml in the %APPDATA% folder is not being honoured...
+    ('global', [
+        ('Output:Variable', '*', variable, frequency)
+        for variable, frequency in [
+            ('People Total Heating Energy', 'RunPeriod'),
+            ('Lights Total Heating Energy', 'RunPeriod'),
+            ('Electric Equipment Total Heating Energy', 'RunPeriod'),
+            ('Facility Total Produced Electric Energy', 'RunPeriod'),
+            ('Zone Infiltration Total Heat Loss Energy', 'RunPeriod'),
+            ('Zone Ventilation Total Heat Loss Energy', 'RunPeriod'),
+            ('Surface Inside Face Conduction Heat Loss Rate', 'RunPeriod'),
+            ('Surface Inside Face Conduction Heat Gain Rate', 'RunPeriod'),
+            ('Surface Inside Face Temperature', 'hourly'),
+            ('Zone Windows Total Heat Gain Energy', 'RunPeriod'),
+            ('Zone Windows Total Heat Loss Energy', 'RunPeriod'),
+            ('Surface Outside Face Outdoor Air Wind Speed', 'timestep'),
+            ('Site Direct Solar Radiation Rate per Area', 'RunPeriod'),
+            ('Zone Ideal Loads Zone Total Heating Energy', 'timestep'),
+            ('Zone Ideal Loads Zone Total Cooling Energy', 'timestep'),
+            ('Site Outdoor Air Drybulb Temperature', 'timestep'),
+            ('Site Outdoor Air Dewpoint Temperature', 'timestep'),
+            ('Site Diffuse Solar Radiation Rate per Area', 'timestep')]]),
+    # fmi variables per surface to accept TEnv and HEnv for the LWR actuators
+    ('surface', [
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'henv{vid}', '{name}', 'Surface',
+         'Exterior Surface Environment Radiation Coefficient',
+         '{name}::Henv', '0.0'),
+        ('ExternalInterface:FunctionalMockupUnitExport:To:Actuator',
+         'tenv{vid}', '{name}', 'Surface',
+         'Exterior Surface Environment Temperature For Radiation Exchange',
+         '{name}::Tenv', '0.0')]),
+]
+
+
+class ItemFields(dict):
+    """the values available to the templates in INTERFACE for an item.
+    vid is only looked up when a template uses it, so the ids are handed
+    out in the same order as the objects are added."""
+    def __missing__(self, key):
+        if key == 'vid' and 'name' in self:
+            self['vid'] = id_map(self['name'])
+            return self['vid']
+        raise KeyError(key)
+
+
+def collect_scopes(idf):
+    """walk the surfaces and zones of the idf once and return the items
+    for each scope used in INTERFACE, as {scope: [ItemFields]}"""
+    walls = [id(wall) for wall in exterior_walls(idf)]
+    roofs_ = [id(roof) for roof in roofs(idf)]
+    windows = [id(window)
+               for window in idf.idfobjects['FENESTRATIONSURFACE:DETAILED']]
+    zones_ = [id(zone) for zone in zones(idf)]
+    lowex = zones_ and is_lowex(idf)
+    nzones = len(zones_)
+
+    def items(names):
+        return [ItemFields(name=name, nzones=nzones) for name in names]
+    return {'global': [ItemFields(nzones=nzones)],
+            'wall': items(walls),
+            'roof': items(roofs_),
+            'surface': items(walls + roofs_),
+            'window': items(windows),
+            'zone': items(zones_),
+            'lowex_zone': items(zones_ if lowex else []),
+            'hvac_template_zone': items([] if lowex else zones_)}
+
+
+def expand_interface(scopes, interface=INTERFACE):
+    """yield the fields of each object described by the interface"""
+    formatter = string.Formatter()
+    for scope, objects in interface:
+        for item in scopes[scope]:
+            for template in objects:
+                fields = []
+                for field in template:
+                    if isinstance(field, tuple):
+                        field_scope, field_template = field
+                        fields.extend(
+                            formatter.vformat(field_template, (), i)
+                            for i in scopes[field_scope])
+                    else:
+                        fields.append(formatter.vformat(field, (), item))
+                yield fields
+
+
+def fmu_variable(fields):
+    """return a manifest entry for the FMU variable defined by the fields
+    of an ExternalInterface:FunctionalMockupUnitExport:* object or None if
+    fields doesn't define an FMU variable."""
+    key = fields[0].upper()
+    if key == 'EXTERNALINTERFACE:FUNCTIONALMOCKUPUNITEXPORT:FROM:VARIABLE':
+        return {'name': fields[3],
+                'causality': 'output',
+                'key_value': fields[1],
+                'variable_name': fields[2]}
+    elif key == 'EXTERNALINTERFACE:FUNCTIONALMOCKUPUNITEXPORT:TO:ACTUATOR':
+        return {'name': fields[5],
+                'causality': 'input',
+                'ems_name': fields[1],
+                'component_name': fields[2],
+                'component_type': fields[3],
+                'control_type': fields[4],
+                'initial_value': fields[6]}
+    return None
+
+
+def generate_interface(idf, interface=INTERFACE):
+    """add the objects described by the interface to the idf and return
+    a manifest of the FMU variables of the interface (a list of dicts in
+    the order they are defined, see fmu_variable)."""
+    manifest = []
+    with indexed_contents(idf):
+        for fields in expand_interface(collect_scopes(idf), interface):
+            ensure_contains(idf, *fields)
+            variable = fmu_variable(fields)
+            if variable:
+                manifest.append(variable)
+    return manifest
+
+
+def manifest_json(manifest):
+    """serialize the manifest returned by generate_interface"""
+    import json
+    return json.dumps({'variables': manifest}, indent=2, sort_keys=True)
 
 
 def process_idf(idf):
@@ -726,15 +486,5 @@ def process_idf(idf):
     with the idf file augmented with the information necessary to produce
     an FMU.
     """
-    idf = add_fmu_to_idf(idf)
-    idf = produce_edd(idf)
-    idf = add_outside_surface_temperature(idf)
-    idf = add_average_outside_surface_temperature(idf)
-    idf = add_zone_ideal_loads_energy(idf)
-    idf = add_zone_mean_air_temperature(idf)
-    idf = add_ventilation_volume_flow_rate(idf)
-    idf = add_weather_actuators(idf)
-    idf = add_occupation_actuator(idf)
-    idf = add_output_variables(idf)
-    idf = add_lwr_fmi(idf)
+    generate_interface(idf)
     return idf
@@ -0,0 +1,49 @@
+'''
+benchmark_shading.py
+
+Time shading.simplify on a synthetic facade grid: `columns` facades side by
+side, each a stack of `storeys` rectangular shading surfaces, added in
+random order. After simplifying, each facade is a single surface.
+
+usage: python benchmarks/benchmark_shading.py [columns [storeys [idd_path]]]
+
+The idd_path defaults to testing/Energy+.idd in the package.
+'''
+import os
+import sys
+import time
+from StringIO import StringIO
+
+PACKAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE)
+
+import iddregistry  # noqa
+import shading  # noqa
+import shadingstore  # noqa
+from test_shading import facade_grid  # noqa
+
+
+def benchmark(columns, storeys, idd_path):
+    '''simplify the facade grid, returns (seconds, surfaces left)'''
+    idf = iddregistry.read_idf('', idd_path)
+    shadingstore.shading_store(idf).extend(facade_grid(columns, storeys))
+    stdout = sys.stdout
+    sys.stdout = StringIO()  # simplify prints every merge
+    try:
+        start = time.time()
+        shading.simplify(idf)
+        seconds = time.time() - start
+    finally:
+        sys.stdout = stdout
+    return seconds, len(shadingstore.shading_surfaces(idf))
+
+
+if __name__ == '__main__':
+    columns = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    storeys = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    idd_path = (sys.argv[3] if len(sys.argv) > 3
+                else os.path.join(PACKAGE, 'testing', 'Energy+.idd'))
+    seconds, left = benchmark(columns, storeys, idd_path)
+    print '%i x %i surfaces: %.2fs, %i surfaces left' % (
+        columns, storeys, seconds, left)
+    assert left == columns, 'expected one surface per facade'
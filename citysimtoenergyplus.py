@@ -7,10 +7,19 @@ concerned with geometry, materials and construction.
 '''
 import numpy as np
 from . import polygons
+from . import coplanar
+from . import geometrycheck
+from . import idfindex
+from . import idfclone
+from . import lod
+from . import shadingstore
+from . import surfacevertices
 reload(polygons)
 
 
-def extractidf(citysim, building, template):
+def extractidf(citysim, building, template, max_distance=None,
+               min_solid_angle=None, min_height_ratio=None,
+               near_distance=None, far_distance=None):
     '''
     this is the main entry point to the module.
     citysim: a lxml.etree.ElementTree containing the CitySim scene.
@@ -19,6 +28,10 @@ def extractidf(citysim, building, template):
     template: a eppy.IDF object representing the template to add the geometry
         to. the template may contain HVAC etc. extractidf only knows a
         single zone called "SINGLE_ZONE".
+    max_distance, min_solid_angle, min_height_ratio: select the other
+        buildings exported as shading, see select_neighbours.
+    near_distance, far_distance: the distances beyond which the shading
+        buildings are simplified, see shading_levels.
     '''
     building_xml = find_building(building, citysim)
     idf = idf_from_template(template)
@@ -28,7 +41,8 @@ def extractidf(citysim, building, template):
     add_walls(building_xml, idf, constructions)
     add_roofs(building_xml, idf, constructions)
     add_windows(building_xml, idf)
-    add_shading(citysim, building_xml, idf)
+    add_shading(citysim, building_xml, idf, max_distance, min_solid_angle,
+                min_height_ratio, near_distance, far_distance)
     return idf
 
 
@@ -49,51 +63,209 @@ def add_zones(building_xml, idf):
     zone.Z_Origin = 0
 
 
-def add_shading(citysim, building_xml, idf):
-    shading_buildings = [s for s in citysim.findall('/*/Building')
-                         if not s.get('id') == building_xml.get('id')]
-    for building in shading_buildings:
+def add_shading(citysim, building_xml, idf, max_distance=None,
+                min_solid_angle=None, min_height_ratio=None,
+                near_distance=None, far_distance=None):
+    """the walls of the other buildings and all roofs are added as shading
+    surfaces to the compact shading store of the idf (see
+    shadingstore.py). only the other buildings chosen by select_neighbours
+    are exported. the buildings beyond near_distance / far_distance are
+    exported as simplified envelopes, see shading_levels."""
+    buildings = citysim.findall('/*/Building')
+    neighbours = set(select_neighbours(buildings, building_xml, max_distance,
+                                       min_solid_angle, min_height_ratio))
+    envelopes = {}
+    for building, level in shading_levels(neighbours, building_xml,
+                                          near_distance,
+                                          far_distance).items():
+        if level != lod.DETAILED:
+            envelopes[building] = (level, lod.envelope(
+                building_vertices(building), level))
+    surfaces = []
+    for building in buildings:
+        if building not in neighbours:
+            continue
+        if building in envelopes:
+            level, (walls, roof, floor) = envelopes[building]
+            for i, wall in enumerate(walls):
+                name = 'ShadingB%sL%iW%i' % (building.get('id'), level, i)
+                surfaces.append((name, name, wall))
+            continue
         for surface_xml in building.findall('Zone/Wall'):
-            vertices = [v for v in surface_xml.getchildren()
-                        if v.tag.startswith('V')]
-            npvertices = [np.array((float(v.get('x')),
-                                    float(v.get('y')),
-                                    float(v.get('z'))))
-                          for v in vertices]
-            if np.isnan(polygons.np_poly_area(npvertices)):
-                print 'not exporting', surface_xml.get('id')
-                continue  # don't export bad shading...
-
-            shading = idf.newidfobject('SHADING:BUILDING:DETAILED')
-            shading.Name = 'ShadingB%sW%s' % (building.get('id'),
-                                              surface_xml.get('id'))
-            shading.Number_of_Vertices = len(vertices)
-            for v in vertices:
-                shading.obj.append(v.get('x'))
-                shading.obj.append(v.get('y'))
-                shading.obj.append(v.get('z'))
+            surfaces.append(('ShadingB%sW%s' % (building.get('id'),
+                                                surface_xml.get('id')),
+                             surface_xml.get('id'),
+                             surface_vertices(surface_xml)))
 	# JK - adds the Roofs as shading for all buildings including the co-simulated one
-    shading_buildings = [s for s in citysim.findall('/*/Building')]
-    for building in shading_buildings:
+    for building in buildings:
+        if (building not in neighbours
+                and not building.get('id') == building_xml.get('id')):
+            continue
+        if building in envelopes:
+            level, (walls, roof, floor) = envelopes[building]
+            name = 'ShadingB%sL%iR' % (building.get('id'), level)
+            surfaces.append((name, name, roof))
+            continue
         for surface_xml in building.findall('Zone/Roof'):
-            vertices = [v for v in surface_xml.getchildren()
-                        if v.tag.startswith('V')]
-            npvertices = [np.array((float(v.get('x')),
-                                    float(v.get('y')),
-                                    float(v.get('z'))))
-                          for v in vertices]
-            if np.isnan(polygons.np_poly_area(npvertices)):
-                print 'not exporting', surface_xml.get('id')
-                continue  # don't export bad shading...
-
-            shading = idf.newidfobject('SHADING:BUILDING:DETAILED')
-            shading.Name = 'ShadingB%sR%s' % (building.get('id'),
-                                              surface_xml.get('id'))
-            shading.Number_of_Vertices = len(vertices)
-            for v in vertices:
-                shading.obj.append(v.get('x'))
-                shading.obj.append(v.get('y'))
-                shading.obj.append(v.get('z'))
+            surfaces.append(('ShadingB%sR%s' % (building.get('id'),
+                                                surface_xml.get('id')),
+                             surface_xml.get('id'),
+                             surface_vertices(surface_xml)))
+    # repair the shading and leave out what can't be repaired
+    report, repaired = geometrycheck.check_polygons(
+        [polygon for name, label, polygon in surfaces], repair=True)
+    good = []
+    for (name, label, _), polygon, flags in zip(surfaces, repaired,
+                                                report.remaining):
+        if flags & geometrycheck.INVALID:
+            print 'not exporting', label
+            continue  # don't export bad shading...
+        good.append((name, polygon))
+    shadingstore.shading_store(idf).extend(good)
+
+
+def shading_levels(buildings, building_xml, near_distance=None,
+                   far_distance=None):
+    """return a dict mapping each of the buildings to its level of detail
+    as shading for building_xml (see lod.level), from the distances
+    between the bounding boxes and the heights above the ground of
+    building_xml."""
+    if near_distance is None and far_distance is None:
+        return dict((building, lod.DETAILED) for building in buildings)
+    lower, upper = building_bounds(building_xml)
+    levels = {}
+    for building in buildings:
+        bounds = building_bounds(building)
+        if np.isnan(bounds[0]).any():
+            levels[building] = lod.DETAILED  # no surfaces
+            continue
+        levels[building] = lod.level(lod.distance(bounds, (lower, upper)),
+                                     bounds[1][2] - lower[2],
+                                     upper[2] - lower[2],
+                                     near_distance, far_distance)
+    return levels
+
+
+def select_neighbours(buildings, building_xml, max_distance=None,
+                      min_solid_angle=None, min_height_ratio=None):
+    """
+    return the buildings (other than building_xml) that are exported as
+    shading for building_xml, in the order of `buildings`. with all the
+    parameters None, these are all the other buildings. distances are
+    horizontal, between the bounding boxes of the buildings:
+        max_distance: the buildings further away than this (in m) are
+            dropped.
+        min_solid_angle: the buildings that subtend a smaller solid angle
+            (in sr) seen from the middle of the footprint of building_xml
+            are dropped. the solid angle is approximated by
+            width * height / distance ** 2 with the diagonal of the
+            bounding box, the height above the ground of building_xml and
+            the distance between the middles.
+        min_height_ratio: the buildings where the height above the ground
+            of building_xml divided by the distance is smaller than this
+            are dropped.
+    """
+    others = [b for b in buildings
+              if not b.get('id') == building_xml.get('id')]
+    if (max_distance is None and min_solid_angle is None
+            and min_height_ratio is None):
+        return others
+    index = FootprintIndex(others)
+    lower, upper = building_bounds(building_xml)
+    if max_distance is None:
+        candidates = np.arange(len(others))
+    else:
+        candidates = index.near(lower, upper, max_distance)
+    gaps = np.maximum(np.maximum(index.lower[candidates, :2] - upper[:2],
+                                 lower[:2] - index.upper[candidates, :2]), 0)
+    distances = np.sqrt((gaps * gaps).sum(axis=1))
+    heights = index.upper[candidates, 2] - lower[2]
+    keep = np.ones(len(candidates), dtype=bool)
+    if max_distance is not None:
+        keep &= distances <= max_distance
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if min_height_ratio is not None:
+            keep &= ((heights > 0) & (distances == 0)) | (
+                heights / distances >= min_height_ratio)
+        if min_solid_angle is not None:
+            extents = (index.upper[candidates, :2]
+                       - index.lower[candidates, :2])
+            widths = np.sqrt((extents * extents).sum(axis=1))
+            middles = ((index.lower[candidates, :2]
+                        + index.upper[candidates, :2]) / 2
+                       - (lower[:2] + upper[:2]) / 2)
+            solid_angles = np.where(heights > 0, np.minimum(
+                widths * heights / (middles * middles).sum(axis=1),
+                2 * np.pi), 0)
+            keep &= solid_angles >= min_solid_angle
+    return [others[i] for i in sorted(candidates[keep])]
+
+
+def building_bounds(building_xml):
+    """return (lower, upper), the corners of the bounding box of the
+    vertices of all the surfaces of the CitySim building"""
+    vertices = np.array(building_vertices(building_xml),
+                        dtype=float).reshape(-1, 3)
+    if not len(vertices):
+        return np.zeros(3) + np.nan, np.zeros(3) + np.nan
+    return vertices.min(axis=0), vertices.max(axis=0)
+
+
+def building_vertices(building_xml):
+    """return the vertices of all the surfaces of the CitySim building as
+    a list of (x, y, z) tuples"""
+    return [v for surface_xml in building_xml.iterfind('Zone/*')
+            for v in surface_vertices(surface_xml)]
+
+
+class FootprintIndex(object):
+    """the bounding boxes of CitySim buildings in a grid of square cells
+    (in the x, y plane) to find the buildings near a bounding box."""
+
+    def __init__(self, buildings, cell_size=None):
+        bounds = [building_bounds(b) for b in buildings]
+        self.lower = np.array([l for l, u in bounds]).reshape(-1, 3)
+        self.upper = np.array([u for l, u in bounds]).reshape(-1, 3)
+        known = ~np.isnan(self.lower).any(axis=1)
+        if cell_size is None:
+            # about the size of a building
+            extents = (self.upper - self.lower)[known, :2].max(axis=1)
+            cell_size = np.median(extents) if len(extents) else 1.0
+        self.cell_size = max(cell_size, 1e-3)
+        self.cells = {}
+        for i in np.flatnonzero(known):
+            for cell in self.covered(self.lower[i], self.upper[i]):
+                self.cells.setdefault(cell, []).append(i)
+
+    def covered(self, lower, upper):
+        """the cells covered by the bounding box (in x, y)"""
+        first = np.floor(lower[:2] / self.cell_size).astype(int)
+        last = np.floor(upper[:2] / self.cell_size).astype(int)
+        return [(i, j) for i in range(first[0], last[0] + 1)
+                for j in range(first[1], last[1] + 1)]
+
+    def near(self, lower, upper, distance):
+        """return the (sorted) indices of the buildings in cells that
+        overlap the bounding box grown by distance: this includes all
+        buildings within that distance of the box."""
+        lower = lower - distance
+        upper = upper + distance
+        cells = np.prod(np.floor(upper[:2] / self.cell_size)
+                        - np.floor(lower[:2] / self.cell_size) + 1)
+        if not cells <= len(self.cells):
+            # checking every cell is slower than checking every building
+            return np.arange(len(self.lower))
+        found = set()
+        for cell in self.covered(lower, upper):
+            found.update(self.cells.get(cell, ()))
+        return np.array(sorted(found), dtype=int)
+
+
+def surface_vertices(surface_xml):
+    """return the vertices of a CitySim surface as a list of
+    (x, y, z) tuples"""
+    return [(float(v.get('x')), float(v.get('y')), float(v.get('z')))
+            for v in surface_xml.getchildren() if v.tag.startswith('V')]
 
 
 def add_floors(building_xml, idf, constructions):
@@ -155,6 +327,14 @@ def add_walls(building_xml, idf, constructions):
 
 
 def add_windows(building_xml, idf):
+    '''add the windows of all walls with a GlazingRatio. the walls are
+    split into convex pieces (coplanar.split) and these into parts with at
+    most four vertices (EnergyPlus allows at most four vertices for
+    windows). each part gets a window of the same shape, scaled about its
+    area centroid, so the windows stay inside concave walls too. the
+    window vertices of all walls are calculated in one go (see
+    polygons.batch_vertices_by_area_ratio).'''
+    walls = []
     for wall_xml in building_xml.findall('Zone/Wall'):
         uvalue = float(wall_xml.get('GlazingUValue', default=0))
         gvalue = float(wall_xml.get('GlazingGValue', default=0))
@@ -165,58 +345,53 @@ def add_windows(building_xml, idf):
             construction_name = 'WindowConstructionU%.2fG%.2f' % (
                 uvalue, gvalue)
             material_name = 'WindowMaterialU%.2fG%.2f' % (uvalue, gvalue)
-            construction = idf.getobject('CONSTRUCTION', construction_name)
+            construction = idfindex.getobject(idf, 'CONSTRUCTION',
+                                              construction_name)
             if not construction:
-                construction = idf.newidfobject('CONSTRUCTION')
+                construction = idfindex.newidfobject(idf, 'CONSTRUCTION')
                 construction.Name = construction_name
                 construction.obj.append(material_name)
-            material = idf.getobject('WINDOWMATERIAL:SIMPLEGLAZINGSYSTEM',
-                                     material_name)
+            material = idfindex.getobject(
+                idf, 'WINDOWMATERIAL:SIMPLEGLAZINGSYSTEM', material_name)
             if not material:
-                material = idf.newidfobject(
-                    'WINDOWMATERIAL:SIMPLEGLAZINGSYSTEM')
+                material = idfindex.newidfobject(
+                    idf, 'WINDOWMATERIAL:SIMPLEGLAZINGSYSTEM')
                 material.Name = material_name
                 material.UFactor = uvalue
                 material.Solar_Heat_Gain_Coefficient = gvalue
-            wall = idf.getobject('WALL:DETAILED', wallid)
-            wall_vertices = [float(w)
-                             for w in wall.obj[wall.Number_of_Vertices * -3:]]
-            wall_polygon = [np.array(p) for p in zip(
-                wall_vertices[::3],
-                wall_vertices[1::3],
-                wall_vertices[2::3])]
-            if len(wall_polygon) > 4:
-                raise Exception(
-                    "Can't add windows to wall (too many vertices): %s"
-                    % wall.Name)
-            window_polygon = polygons.get_vertices_by_area_ratio(
-                wall_polygon, ratio)
-            assert window_polygon, 'Could not calculate window vertices'
-            for i,vertex in enumerate(window_polygon):
-				print 'i: ', i, '\tvertex: ', vertex
-			
-            window = idf.newidfobject('FENESTRATIONSURFACE:DETAILED', windowid + "_1")
+            wall = idfindex.getobject(idf, 'WALL:DETAILED', wallid)
+            wall_polygon = polygons.drop_collinear(
+                surfacevertices.vertices(wall))
+            walls.append((wallid, windowid, construction, wall_polygon,
+                          ratio))
+    if not walls:
+        return
+    parts = []  # (wall index, polygon with at most 4 vertices)
+    for n, wall in enumerate(walls):
+        for piece in coplanar.split(wall[3]):
+            piece = np.asarray(piece, dtype=float)
+            parts.extend((n, piece[list(indices)])
+                         for indices in polygons.fan_indices(len(piece)))
+    vertices, offsets = polygons.pack([part for _, part in parts])
+    window_vertices = polygons.batch_vertices_by_area_ratio(
+        vertices, offsets, [walls[n][4] for n, _ in parts])
+    wall_windows = [[] for _ in walls]
+    for (n, _), window_polygon in zip(
+            parts, polygons.unpack(window_vertices, offsets)):
+        wall_windows[n].append(window_polygon)
+    for (wallid, windowid, construction, wall_polygon, ratio), windows in \
+            zip(walls, wall_windows):
+        for i, window_polygon in enumerate(windows):
+            name = windowid if len(windows) == 1 else '%s_%i' % (windowid,
+                                                                  i + 1)
+            window = idfindex.newidfobject(
+                idf, 'FENESTRATIONSURFACE:DETAILED', name)
             window.Surface_Type = 'Window'
             window.Construction_Name = construction.Name
             window.Building_Surface_Name = wallid
-            window.Number_of_Vertices = 3
-			
-            for i,vertex in enumerate(window_polygon):
-				if i < 3:
-					window.obj.extend(vertex)
-
-            window = idf.newidfobject('FENESTRATIONSURFACE:DETAILED', windowid + "_2")
-            window.Surface_Type = 'Window'
-            window.Construction_Name = construction.Name
-            window.Building_Surface_Name = wallid
-            window.Number_of_Vertices = 3		
-            for i,vertex in enumerate(window_polygon):			
-				if i == 0:
-					window.obj.extend(vertex)
-				if i > 1:
-					window.obj.extend(vertex)					
-				
-            print 'add_windows', len(window_polygon), len(wall_polygon)
+            window.Number_of_Vertices = len(window_polygon)
+            for vertex in window_polygon:
+                window.obj.extend(vertex)
 
 
 def add_constructions(citysim, building_xml, idf):
@@ -272,12 +447,8 @@ def find_building_by_id(building, citysim):
 def idf_from_template(template):
     '''
     cloning a whole IDF file is not as easy as I thought it
-    would be. But we can copy each object...
+    would be. the clone uses the same IDD as the template
+    (see iddregistry.py) and shares the template objects until they are
+    accessed (see idfclone.py), so the template should not be changed.
     '''
-    from eppy import modeleditor
-    idf = modeleditor.IDF()
-    idf.initnew()
-    for key in template.idfobjects.keys():
-        for value in template.idfobjects[key]:
-            idf.copyidfobject(value)
-    return idf
+    return idfclone.clone(template)
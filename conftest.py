@@ -0,0 +1,20 @@
+'''
+conftest.py
+
+pytest fixtures shared by the tests.
+'''
+import os
+import pytest
+import iddregistry
+
+
+@pytest.fixture
+def read_model():
+    '''return a function that reads testing/RevitModel.idf, a new model on
+    each call'''
+    idd_path = os.path.join('testing', 'Energy+.idd')
+
+    def read():
+        with open(os.path.join('testing', 'RevitModel.idf'), 'r') as f:
+            return iddregistry.read_idf(f.read(), idd_path)
+    return read
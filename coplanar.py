@@ -0,0 +1,392 @@
+'''
+coplanar.py
+
+Merge polygons that lie in the same plane and touch along their edges into
+as few convex polygons as possible.
+
+shading.simplify and simplifycitysimgeometry.simplify only merge vertical
+rectangles stacked on top of each other. This module handles any coplanar
+polygons: panels side by side, flat roofs made of several pieces, L-shaped
+facades. The polygons are grouped by plane first, then the union of each
+group is computed in the 2D coordinates of the plane:
+
+    for group in coplanar.group_by_plane(polygon_list, tolerance):
+        pieces = coplanar.union([polygon_list[i] for i in group], tolerance)
+
+The union is returned as convex pieces, which EnergyPlus accepts for
+shading surfaces. The vertices of the pieces are vertices of the original
+polygons, so no coordinates are moved. Vertices closer than `tolerance`
+(in metres) are considered the same.
+
+Only polygons that meet edge to edge (a vertex of one polygon may lie on
+an edge of the other) are merged. `union` returns None for groups with
+overlapping polygons or with holes in the union, these are left alone.
+'''
+import collections
+import math
+import numpy as np
+
+# vertices closer than this (in metres) are the same vertex
+TOLERANCE = 0.01
+
+
+def plane(polygon):
+    '''return (unit normal, distance of the plane from the origin) for the
+    polygon, using Newell's method. returns None for degenerate polygons.'''
+    polygon = np.asarray(polygon, dtype=float)
+    if len(polygon) < 3:
+        return None
+    # relative to the first vertex, for precision with large coordinates
+    relative = polygon - polygon[0]
+    following = np.roll(relative, -1, axis=0)
+    normal = np.array([
+        ((relative[:, 1] - following[:, 1])
+         * (relative[:, 2] + following[:, 2])).sum(),
+        ((relative[:, 2] - following[:, 2])
+         * (relative[:, 0] + following[:, 0])).sum(),
+        ((relative[:, 0] - following[:, 0])
+         * (relative[:, 1] + following[:, 1])).sum()])
+    length = math.sqrt(normal.dot(normal))
+    if length == 0:
+        return None
+    normal /= length
+    return normal, normal.dot(polygon.mean(axis=0))
+
+
+def group_by_plane(polygon_list, tolerance=TOLERANCE, keys=None):
+    '''
+    return the groups (lists of indices into polygon_list) of polygons in
+    the same plane, facing the same way. the unit normals and the distances
+    from the origin are rounded to `tolerance`. if keys is given, only
+    polygons with the same key (e.g. the zone and construction) are grouped.
+    only groups with more than one polygon are returned.
+    '''
+    groups = collections.OrderedDict()
+    for i, polygon in enumerate(polygon_list):
+        found = plane(polygon)
+        if found is None:
+            continue
+        normal, distance = found
+        key = (keys[i] if keys is not None else None,
+               tuple(int(round(c / tolerance)) for c in normal),
+               int(round(distance / tolerance)))
+        groups.setdefault(key, []).append(i)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def union(polygon_list, tolerance=TOLERANCE):
+    '''
+    return the union of the coplanar polygons as a list of convex polygons
+    (lists of vertices taken from polygon_list) or None, if the polygons
+    overlap or their union has holes.
+    '''
+    normal = plane(polygon_list[0])[0]
+    points = PlanePoints(polygon_list[0][0], normal, tolerance)
+    loops = []
+    for polygon in polygon_list:
+        loop = []
+        for vertex in polygon:
+            i = points.add(vertex)
+            if not loop or loop[-1] != i:
+                loop.append(i)
+        if len(loop) > 1 and loop[0] == loop[-1]:
+            loop.pop()
+        if len(loop) < 3 or points.signed_area(loop) <= 0:
+            # degenerate at this tolerance or facing the other way
+            return None
+        loops.append(loop)
+    points.index_segments(np.median([points.perimeter(loop) / len(loop)
+                                     for loop in loops]))
+    # the edges shared by two polygons (in opposite directions) cancel out,
+    # the remaining edges are the boundary of the union
+    edges = collections.Counter()
+    for loop in loops:
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            chain = [a] + points.between(a, b) + [b]
+            for edge in zip(chain, chain[1:]):
+                edges[edge] += 1
+    outgoing = {}
+    for (a, b), count in sorted(edges.items()):
+        remaining = count - edges.get((b, a), 0)
+        if remaining > 1:
+            return None  # overlapping polygons
+        if remaining == 1:
+            outgoing.setdefault(a, []).append(b)
+    boundaries = trace_loops(outgoing, points)
+    if boundaries is None:
+        return None
+    boundaries = [drop_collinear(loop, points) for loop in boundaries]
+    if any(len(loop) < 3 or points.signed_area(loop) <= 0
+           for loop in boundaries):
+        return None  # holes
+    # overlapping polygons don't share their edges, but cover less area
+    original = sum(points.signed_area(loop) for loop in loops)
+    merged = sum(points.signed_area(loop) for loop in boundaries)
+    perimeter = sum(points.perimeter(loop) for loop in loops)
+    if abs(original - merged) > tolerance * perimeter:
+        return None
+    pieces = []
+    for loop in boundaries:
+        convex = convex_pieces(loop, points)
+        if convex is None:
+            return None
+        pieces.extend(convex)
+    return [[points.vertices[i] for i in piece] for piece in pieces]
+
+
+def split(polygon, tolerance=TOLERANCE):
+    '''
+    return the polygon as a list of convex polygons (lists of its vertices,
+    see convex_pieces). convex polygons, degenerate polygons and polygons
+    that can't be triangulated are returned as they are.
+    '''
+    found = plane(polygon)
+    if found is None:
+        return [list(polygon)]
+    points = PlanePoints(polygon[0], found[0], tolerance)
+    loop = []
+    for vertex in polygon:
+        i = points.add(vertex)
+        if not loop or loop[-1] != i:
+            loop.append(i)
+    if len(loop) > 1 and loop[0] == loop[-1]:
+        loop.pop()
+    if len(loop) < 3 or is_convex(loop, points):
+        return [list(polygon)]
+    pieces = convex_pieces(loop, points)
+    if pieces is None:
+        return [list(polygon)]
+    return [[points.vertices[i] for i in piece] for piece in pieces]
+
+
+def trace_loops(outgoing, points):
+    '''return the closed loops of the directed edges in outgoing (a dict
+    vertex -> [next vertex, ...]). at vertices with more than one outgoing
+    edge, the loops turn left as far as possible, so polygons that only
+    touch at a corner stay separate. returns None if a loop is open.'''
+    loops = []
+    for start in sorted(outgoing):
+        while outgoing.get(start):
+            loop = [start]
+            a, b = start, outgoing[start].pop()
+            while b != start:
+                loop.append(b)
+                candidates = outgoing.get(b)
+                if not candidates:
+                    return None
+                c = max(candidates, key=lambda c: points.turn(a, b, c))
+                candidates.remove(c)
+                a, b = b, c
+            loops.append(loop)
+    return loops
+
+
+def drop_collinear(loop, points):
+    '''return the loop without the vertices that are less than the
+    tolerance away from the line through their neighbours'''
+    loop = list(loop)
+    changed = True
+    while changed and len(loop) > 3:
+        changed = False
+        for k in range(len(loop)):
+            a, b, c = loop[k - 1], loop[k], loop[(k + 1) % len(loop)]
+            if abs(points.offset(a, b, c)) <= points.tolerance:
+                del loop[k]
+                changed = True
+                break
+    return loop
+
+
+def is_convex(loop, points):
+    '''True, if no vertex of the (counter clockwise) loop is further than
+    the tolerance inside the line through its neighbours'''
+    return all(points.offset(loop[k - 1], loop[k], loop[(k + 1) % len(loop)])
+               >= -points.tolerance for k in range(len(loop)))
+
+
+def convex_pieces(loop, points):
+    '''return the loop split into convex pieces: a triangulation by ear
+    clipping, with the triangles merged back into convex polygons where
+    possible (Hertel-Mehlhorn). returns None if the loop can't be
+    triangulated.'''
+    if is_convex(loop, points):
+        return [loop]
+    pieces = triangulate(loop, points)
+    if pieces is None:
+        return None
+    merged = True
+    while merged:
+        merged = False
+        edges = {}
+        for n, piece in enumerate(pieces):
+            for edge in zip(piece, piece[1:] + piece[:1]):
+                edges[edge] = n
+        for n, piece in enumerate(pieces):
+            for a, b in zip(piece, piece[1:] + piece[:1]):
+                m = edges.get((b, a))
+                if m is None or m == n:
+                    continue
+                candidate = drop_collinear(
+                    join(piece, pieces[m], a, b), points)
+                if is_convex(candidate, points):
+                    pieces[n] = candidate
+                    del pieces[m]
+                    merged = True
+                    break
+            if merged:
+                break
+    return pieces
+
+
+def join(p, q, a, b):
+    '''join the loops p (with the edge a -> b) and q (with the edge
+    b -> a) along that edge'''
+    p = p[p.index(b):] + p[:p.index(b)]  # b ... a
+    q = q[q.index(a):] + q[:q.index(a)]  # a ... b
+    return p + q[1:-1]
+
+
+def triangulate(loop, points):
+    '''return the triangles of the (counter clockwise, simple) loop by ear
+    clipping or None'''
+    remaining = list(loop)
+    triangles = []
+    while len(remaining) > 3:
+        n = len(remaining)
+        for k in range(n):
+            a, b, c = remaining[k - 1], remaining[k], remaining[(k + 1) % n]
+            if points.offset(a, b, c) <= 0:
+                continue  # not convex at b
+            if any(points.in_triangle(p, a, b, c)
+                   for p in remaining if p not in (a, b, c)):
+                continue
+            triangles.append([a, b, c])
+            del remaining[k]
+            break
+        else:
+            return None
+    triangles.append(remaining)
+    return triangles
+
+
+class PlanePoints(object):
+    '''the vertices of a group of coplanar polygons with their coordinates
+    in the plane. vertices closer than the tolerance get the same index.'''
+
+    def __init__(self, origin, normal, tolerance):
+        self.origin = np.asarray(origin, dtype=float)
+        axis = (0, 0, 1) if abs(normal[2]) < 0.9 else (1, 0, 0)
+        self.u = np.cross(normal, axis)
+        self.u /= math.sqrt(self.u.dot(self.u))
+        self.v = np.cross(normal, self.u)  # u x v == normal
+        self.tolerance = tolerance
+        self.cells = {}  # (i, j) -> [index, ...]
+        self.xy = []
+        self.vertices = []
+        self.array = None
+        self.segment_cell = None
+        self.segment_cells = None  # (i, j) -> array of indices
+
+    def add(self, vertex):
+        '''return the index of the vertex, adding it if necessary'''
+        relative = np.asarray(vertex, dtype=float) - self.origin
+        x, y = relative.dot(self.u), relative.dot(self.v)
+        cx = int(math.floor(x / self.tolerance))
+        cy = int(math.floor(y / self.tolerance))
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for k in self.cells.get((i, j), ()):
+                    px, py = self.xy[k]
+                    if (px - x) ** 2 + (py - y) ** 2 <= self.tolerance ** 2:
+                        return k
+        self.cells.setdefault((cx, cy), []).append(len(self.xy))
+        self.xy.append((x, y))
+        self.vertices.append(vertex)
+        self.array = None
+        return len(self.xy) - 1
+
+    def index_segments(self, cell):
+        '''index the points in cells of the size `cell` (about the length
+        of an edge) for `between`. the points must all be added first.'''
+        self.array = np.array(self.xy, dtype=float).reshape(-1, 2)
+        self.segment_cell = max(cell, self.tolerance)
+        cells = {}
+        for k, (x, y) in enumerate(self.xy):
+            cells.setdefault((int(math.floor(x / self.segment_cell)),
+                              int(math.floor(y / self.segment_cell))),
+                             []).append(k)
+        self.segment_cells = dict((key, np.array(value))
+                                  for key, value in cells.items())
+
+    def candidates(self, a, b):
+        '''return the indices of the points that may be on the segment
+        a -> b (all points, if the segment is not indexed)'''
+        if self.segment_cells is None:
+            return np.arange(len(self.xy))
+        (xa, ya), (xb, yb) = self.xy[a], self.xy[b]
+        size = self.segment_cell
+        i0, i1 = [int(math.floor((min(xa, xb) - self.tolerance) / size)),
+                  int(math.floor((max(xa, xb) + self.tolerance) / size))]
+        j0, j1 = [int(math.floor((min(ya, yb) - self.tolerance) / size)),
+                  int(math.floor((max(ya, yb) + self.tolerance) / size))]
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.segment_cells):
+            return np.arange(len(self.xy))
+        found = [self.segment_cells[(i, j)]
+                 for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+                 if (i, j) in self.segment_cells]
+        return np.concatenate(found) if found else np.zeros(0, dtype=int)
+
+    def between(self, a, b):
+        '''return the indices of the points on the segment a -> b (without
+        a and b), sorted from a to b'''
+        if self.array is None:
+            self.array = np.array(self.xy, dtype=float).reshape(-1, 2)
+        candidates = self.candidates(a, b)
+        candidates = candidates[(candidates != a) & (candidates != b)]
+        xy = self.array[candidates]
+        pa = self.array[a]
+        d = self.array[b] - pa
+        t = (xy - pa).dot(d) / d.dot(d)
+        distances = ((pa + t[:, np.newaxis] * d - xy) ** 2).sum(axis=1)
+        on = (t > 0) & (t < 1) & (distances <= self.tolerance ** 2)
+        order = np.argsort(t[on])
+        return [int(i) for i in candidates[on][order]]
+
+    def signed_area(self, loop):
+        '''the area of the loop, positive if counter clockwise'''
+        total = 0.0
+        for a, b in zip(loop, loop[1:] + loop[:1]):
+            (xa, ya), (xb, yb) = self.xy[a], self.xy[b]
+            total += xa * yb - xb * ya
+        return total / 2
+
+    def perimeter(self, loop):
+        return sum(math.hypot(self.xy[b][0] - self.xy[a][0],
+                              self.xy[b][1] - self.xy[a][1])
+                   for a, b in zip(loop, loop[1:] + loop[:1]))
+
+    def offset(self, a, b, c):
+        '''the distance of b from the line a -> c, positive if a, b, c turn
+        left (counter clockwise)'''
+        (xa, ya), (xb, yb), (xc, yc) = self.xy[a], self.xy[b], self.xy[c]
+        length = math.hypot(xc - xa, yc - ya)
+        cross = (xb - xa) * (yc - yb) - (yb - ya) * (xc - xb)
+        if length == 0:
+            return 0.0 if cross == 0 else math.copysign(
+                self.tolerance * 2, cross)
+        return cross / length
+
+    def turn(self, a, b, c):
+        '''the angle turned left at b going from a over b to c'''
+        (xa, ya), (xb, yb), (xc, yc) = self.xy[a], self.xy[b], self.xy[c]
+        dx0, dy0, dx1, dy1 = xb - xa, yb - ya, xc - xb, yc - yb
+        return math.atan2(dx0 * dy1 - dy0 * dx1, dx0 * dx1 + dy0 * dy1)
+
+    def in_triangle(self, p, a, b, c):
+        '''True, if p is inside or on the (counter clockwise) triangle'''
+        (x, y) = self.xy[p]
+
+        def side(i, j):
+            (xi, yi), (xj, yj) = self.xy[i], self.xy[j]
+            return (xj - xi) * (y - yi) - (yj - yi) * (x - xi)
+        return side(a, b) >= 0 and side(b, c) >= 0 and side(c, a) >= 0
@@ -0,0 +1,109 @@
+'''
+geometrycache.py
+
+Keep the results of slow geometry operations on disk, keyed by the geometry
+they were computed from.
+
+Parameter sweeps change glazing, constructions or HVAC, but run
+removeshading.remove_extra_shading and shading.simplify on the same
+geometry over and over. `geometry_hash` computes a key from the vertices of
+the surfaces and the parameters of the operation. The vertices are rounded
+to multiples of QUANTUM first, so rounding noise (e.g. from writing and
+reading the model again) doesn't change the key. The order of the surfaces
+doesn't matter either.
+
+    key = geometrycache.geometry_hash('simplify', surfaces, (mode, tolerance))
+    result = geometrycache.load(key, cache_folder)
+    if result is None:
+        result = ...
+        geometrycache.store(key, result, cache_folder)
+
+Each result is a file in the cache folder, written with `marshal` (so
+results can only contain lists, tuples, dicts, strings and numbers). Loading
+a result touches its file. Storing a result removes the least recently used
+files if there are more than `max_entries`.
+'''
+import os
+import glob
+import hashlib
+import marshal
+import tempfile
+import numpy as np
+import iddcache
+
+# bump this when the layout of the cached data changes
+CACHE_FORMAT = 1
+CACHE_FOLDER = os.path.join(tempfile.gettempdir(),
+                            'design-performance-workflows', 'geometry')
+# vertices are rounded to multiples of this (in metres) before hashing
+QUANTUM = 1e-4
+# the number of results kept in a cache folder
+MAX_ENTRIES = 256
+
+
+def geometry_hash(operation, surfaces, parameters=(), quantum=QUANTUM):
+    '''return the key for the result of the operation (a string) with the
+    parameters (a tuple of numbers and strings) on the surfaces, an
+    iterable of (type, name, vertices).'''
+    sha1 = hashlib.sha1()
+    sha1.update(repr((operation, tuple(parameters), quantum)))
+    canonical = sorted(((('%s' % kind).upper(), ('%s' % name).upper(),
+                         vertices) for kind, name, vertices in surfaces),
+                       key=lambda surface: surface[:2])
+    for kind, name, vertices in canonical:
+        quantised = np.round(np.asarray(vertices, dtype=float).reshape(-1, 3)
+                             / quantum).astype('<i8')
+        sha1.update(('%s\0%s\0%i\0' % (kind, name, len(quantised))).encode(
+            'utf-8'))
+        sha1.update(quantised.tostring())
+    return sha1.hexdigest()
+
+
+def cache_path(key, cache_folder=None):
+    '''return the path of the cache file for the key.'''
+    if cache_folder is None:
+        cache_folder = CACHE_FOLDER
+    return os.path.join(cache_folder, '%s-%i-%i.geometry' % (
+        key, CACHE_FORMAT, marshal.version))
+
+
+def load(key, cache_folder=None):
+    '''return the result stored for the key, or None.'''
+    path = cache_path(key, cache_folder)
+    try:
+        with open(path, 'rb') as f:
+            cached_key, data = marshal.load(f)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None  # not cached yet or bad cache file
+    if cached_key != key:
+        return None
+    try:
+        os.utime(path, None)  # most recently used
+    except OSError:
+        pass
+    return data
+
+
+def store(key, data, cache_folder=None, max_entries=MAX_ENTRIES):
+    '''store the result for the key and remove the least recently used
+    results beyond max_entries.'''
+    path = cache_path(key, cache_folder)
+    iddcache.write_cache(path, (key, data))
+    evict(os.path.dirname(path), max_entries)
+
+
+def evict(cache_folder, max_entries=MAX_ENTRIES):
+    '''remove the least recently used results beyond max_entries from the
+    cache folder.'''
+    entries = []
+    for path in glob.glob(os.path.join(cache_folder, '*.geometry')):
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            pass  # removed by another process
+    entries.sort()
+    for _, path in entries[:max(len(entries) - max_entries, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,470 @@
+'''
+geometrycheck.py
+
+Find (and repair) bad polygons in a CitySim scene or an IDF before they
+are exported, all surfaces at once.
+
+Bad polygons used to be found one at a time, deep inside the geometry code
+(a nan area in citysimtoenergyplus.add_shading, "polygon not on plane" in
+removeshading). `check` looks at all the polygons (packed as in
+polygons.py) with numpy and returns a set of flags for each of them:
+
+    DEGENERATE: less than three distinct vertices or (almost) no area
+    DUPLICATE_VERTICES: consecutive vertices closer than the tolerance
+    COLLINEAR_VERTICES: vertices on the line between their neighbours
+        (eppy computes the normal from the first three vertices)
+    NON_PLANAR: vertices further than planarity_tolerance from the plane
+    SELF_INTERSECTING: edges crossing each other
+    WRONG_WINDING: the normal points into the zone (only checked for
+        polygons with a zone, the zones must be closed)
+
+`repair_vertices` removes the duplicate and collinear vertices, moves the
+vertices onto the plane and reverses wrongly wound polygons. Degenerate and
+self intersecting polygons can't be repaired.
+
+    report = geometrycheck.check_citysim(citysim, repair=True)
+    print report  # the problems found, the surfaces removed
+    report = geometrycheck.check_idf(idf)
+    report.invalid()  # the surfaces that can't be used (INVALID)
+'''
+from __future__ import division
+import collections
+import numpy as np
+import idfindex
+import polygons
+import shadingstore
+import simplifycitysimgeometry
+import surfacevertices
+
+# the distance (in m) below which vertices are the same
+TOLERANCE = 1e-4
+# the distance (in m) a vertex may be away from the plane of the polygon
+PLANARITY_TOLERANCE = 1e-3
+# the IDF objects with vertices (besides the shading surfaces)
+IDF_SURFACES = ['BUILDINGSURFACE:DETAILED',
+                'WALL:DETAILED',
+                'ROOFCEILING:DETAILED',
+                'FLOOR:DETAILED',
+                'FENESTRATIONSURFACE:DETAILED']
+
+DEGENERATE = 1
+DUPLICATE_VERTICES = 2
+COLLINEAR_VERTICES = 4
+NON_PLANAR = 8
+SELF_INTERSECTING = 16
+WRONG_WINDING = 32
+NAMES = collections.OrderedDict([(DEGENERATE, 'degenerate'),
+                                 (DUPLICATE_VERTICES, 'duplicate vertices'),
+                                 (COLLINEAR_VERTICES, 'collinear vertices'),
+                                 (NON_PLANAR, 'non-planar'),
+                                 (SELF_INTERSECTING, 'self-intersecting'),
+                                 (WRONG_WINDING, 'wrong winding')])
+# polygons with these flags can't be used as they are
+INVALID = DEGENERATE | NON_PLANAR | SELF_INTERSECTING
+# polygons with these flags can't be repaired
+UNREPAIRABLE = DEGENERATE | SELF_INTERSECTING
+
+# the rays of the winding test are tilted away from the normal by this, so
+# they don't run along the edges of boxes
+PERTURBATION = np.array([0.5773, 0.3141, 0.2718]) * 1e-3
+
+
+class Report(object):
+    '''the result of a check: flags[i] are the problems found with the
+    surface keys[i], remaining[i] the problems left after the repair (the
+    same as flags if nothing was repaired). removed are the keys of the
+    surfaces removed by the repair.'''
+
+    def __init__(self, keys, flags, remaining=None, removed=()):
+        self.keys = list(keys)
+        self.flags = flags
+        self.remaining = flags if remaining is None else remaining
+        self.removed = list(removed)
+
+    def problems(self):
+        '''return an OrderedDict mapping the keys of the surfaces with
+        problems to the names of the problems'''
+        return collections.OrderedDict(
+            (key, describe(flags)) for key, flags in zip(self.keys,
+                                                         self.flags)
+            if flags)
+
+    def invalid(self):
+        '''return the keys of the surfaces that can't be used (INVALID,
+        after the repair)'''
+        return [key for key, flags in zip(self.keys, self.remaining)
+                if flags & INVALID]
+
+    def counts(self):
+        '''return an OrderedDict mapping the names of the problems to the
+        number of surfaces with the problem'''
+        return collections.OrderedDict(
+            (name, int(((self.flags & flag) != 0).sum()))
+            for flag, name in NAMES.items())
+
+    def __str__(self):
+        lines = ['%i surfaces, %i with problems' % (
+            len(self.keys), int((self.flags != 0).sum()))]
+        lines.extend('%s: %i' % (name, count)
+                     for name, count in self.counts().items() if count)
+        lines.extend('%s: %s' % (key, ', '.join(names))
+                     for key, names in self.problems().items())
+        lines.extend('removed: %s' % (key,) for key in self.removed)
+        return '\n'.join(lines)
+
+
+def describe(flags):
+    '''return the names of the problems in flags'''
+    return [name for flag, name in NAMES.items() if flags & flag]
+
+
+def check(vertices, offsets, zones=None, tolerance=TOLERANCE,
+          planarity_tolerance=PLANARITY_TOLERANCE):
+    '''return the flags of the polygons (see polygons.pack) as an int
+    array. zones (one hashable per polygon, None for no zone) are used for
+    the WRONG_WINDING test: the polygons of a zone must enclose it.'''
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    offsets = np.asarray(offsets)
+    counts = np.diff(offsets)
+    flags = np.zeros(len(counts), dtype=int)
+    if not len(counts):
+        return flags
+    edges = polygon_edges(vertices, offsets)
+    duplicate = edges.lengths <= tolerance
+    flags[per_polygon(duplicate, edges.owner, len(counts))] |= (
+        DUPLICATE_VERTICES)
+    flags[per_polygon(collinear(vertices, edges, tolerance), edges.owner,
+                      len(counts))] |= COLLINEAR_VERTICES
+    distinct = np.bincount(edges.owner[~duplicate], minlength=len(counts))
+    newell = plane_normals(vertices, offsets, edges)
+    areas = np.sqrt((newell * newell).sum(axis=1)) / 2
+    perimeters = np.bincount(edges.owner, weights=edges.lengths,
+                             minlength=len(counts))
+    # no area: the average width (2 area / perimeter) is below tolerance
+    with np.errstate(invalid='ignore'):
+        degenerate = (distinct < 3) | ~(2 * areas > tolerance * perimeters)
+    flags[degenerate] |= DEGENERATE
+    valid = ~degenerate
+    normals = np.zeros_like(newell)
+    normals[valid] = newell[valid] / (2 * areas[valid])[:, np.newaxis]
+    centres = polygons.batch_centroids(vertices, offsets)
+    flags[valid & (plane_distances(vertices, offsets, normals, centres)
+                   > planarity_tolerance)] |= NON_PLANAR
+    flags[valid & self_intersecting(vertices, offsets, normals,
+                                    tolerance)] |= SELF_INTERSECTING
+    if zones is not None:
+        flags[wrongly_wound(vertices, offsets, normals, centres, zones,
+                            valid, tolerance)] |= WRONG_WINDING
+    return flags
+
+
+def repair_vertices(vertices, offsets, flags, tolerance=TOLERANCE):
+    '''return (vertices, offsets) of the polygons with the flags (as
+    returned by check) repaired: duplicate and collinear vertices removed,
+    non-planar polygons projected onto their plane and wrongly wound
+    polygons reversed. degenerate and self-intersecting polygons are
+    returned as they are.'''
+    vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+    offsets = np.asarray(offsets)
+    flags = np.asarray(flags)
+    fixable = (flags & UNREPAIRABLE) == 0
+    edges = polygon_edges(vertices, offsets)
+    # drop each vertex that duplicates the one before it
+    vertices, offsets = keep_vertices(
+        vertices, offsets, edges.owner,
+        ~(fixable[edges.owner] & (edges.lengths[edges.preceding]
+                                  <= tolerance)))
+    edges = polygon_edges(vertices, offsets)
+    vertices, offsets = keep_vertices(
+        vertices, offsets, edges.owner,
+        ~(fixable[edges.owner] & collinear(vertices, edges, tolerance)))
+    edges = polygon_edges(vertices, offsets)
+    vertices = vertices.copy()
+    flat = (fixable & ((flags & NON_PLANAR) != 0))[edges.owner]
+    if flat.any():
+        newell = plane_normals(vertices, offsets, edges)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normals = newell / np.sqrt(
+                (newell * newell).sum(axis=1))[:, np.newaxis]
+        centres = polygons.batch_centroids(vertices, offsets)
+        normals, centres = normals[edges.owner], centres[edges.owner]
+        heights = ((vertices - centres) * normals).sum(axis=1)
+        vertices[flat] -= heights[flat][:, np.newaxis] * normals[flat]
+    backwards = (fixable & ((flags & WRONG_WINDING) != 0))[edges.owner]
+    if backwards.any():
+        index = np.arange(len(vertices))
+        mirrored = edges.starts + edges.ends - 1 - index
+        vertices = vertices[np.where(backwards, mirrored, index)]
+    return vertices, offsets
+
+
+def check_polygons(polygon_list, zones=None, keys=None, repair=False,
+                   tolerance=TOLERANCE,
+                   planarity_tolerance=PLANARITY_TOLERANCE):
+    '''check (and repair) a list of polygons. returns (Report, polygons),
+    the polygons (repaired, if repair is True) as (n, 3) arrays. keys
+    default to the indices of the polygons.'''
+    if keys is None:
+        keys = range(len(polygon_list))
+    vertices, offsets = polygons.pack(polygon_list)
+    flags = check(vertices, offsets, zones, tolerance, planarity_tolerance)
+    if not repair or not flags.any():
+        return Report(keys, flags), polygons.unpack(vertices, offsets)
+    vertices, offsets = repair_vertices(vertices, offsets, flags, tolerance)
+    # the repaired polygons are the other way round
+    remaining = check(vertices, offsets, zones, tolerance,
+                      planarity_tolerance) & ~WRONG_WINDING
+    report = Report(keys, flags, remaining,
+                    [key for key, left in zip(keys, remaining)
+                     if left & INVALID])
+    return report, polygons.unpack(vertices, offsets)
+
+
+def check_citysim(citysim, repair=False, tolerance=TOLERANCE,
+                  planarity_tolerance=PLANARITY_TOLERANCE):
+    '''check the walls, roofs and floors of all the buildings in the
+    CitySim scene, the keys of the report are (building id, tag, surface
+    id). with repair=True, the surfaces are repaired and the surfaces that
+    are still INVALID are removed.'''
+    surfaces = [(building, surface_xml)
+                for building in citysim.findall('/*/Building')
+                for surface_xml in building.iterfind('Zone/*')
+                if surface_xml.tag in ('Wall', 'Roof', 'Floor')]
+    keys = [(building.get('id'), surface_xml.tag, surface_xml.get('id'))
+            for building, surface_xml in surfaces]
+    zones = [(building.get('id'), surface_xml.getparent().get('id'))
+             for building, surface_xml in surfaces]
+    report, repaired = check_polygons(
+        [simplifycitysimgeometry.get_polygon(surface_xml)
+         for _, surface_xml in surfaces], zones, keys, repair, tolerance,
+        planarity_tolerance)
+    if repair:
+        for (_, surface_xml), flags, remaining, polygon in zip(
+                surfaces, report.flags, report.remaining, repaired):
+            if remaining & INVALID:
+                surface_xml.getparent().remove(surface_xml)
+            elif flags:
+                simplifycitysimgeometry.set_polygon(surface_xml, polygon)
+    return report
+
+
+def check_idf(idf, repair=False, tolerance=TOLERANCE,
+              planarity_tolerance=PLANARITY_TOLERANCE):
+    '''check the surfaces (IDF_SURFACES and the shading
+    surfaces) of the idf, the keys of the report are (IDF object type,
+    name). the winding is checked for the surfaces with a Zone_Name. with
+    repair=True, the surfaces are repaired and the surfaces that are still
+    INVALID are removed.'''
+    surfaces = [(key, obj) for key in IDF_SURFACES
+                for obj in idf.idfobjects[key]]
+    zones = [obj.Zone_Name.upper() if 'Zone_Name' in obj.objls else None
+             for _, obj in surfaces]
+    surfaces.extend((shadingstore.KEY, surface)
+                    for surface in shadingstore.shading_surfaces(idf))
+    zones.extend([None] * (len(surfaces) - len(zones)))
+    keys = [(key, obj.Name) for key, obj in surfaces]
+    report, repaired = check_polygons(
+        [shadingstore.vertices(obj) for _, obj in surfaces], zones, keys,
+        repair, tolerance, planarity_tolerance)
+    if repair:
+        for (key, obj), flags, remaining, polygon in zip(
+                surfaces, report.flags, report.remaining, repaired):
+            if flags and not remaining & INVALID:
+                if key == shadingstore.KEY:
+                    shadingstore.set_vertices(obj, polygon)
+                else:
+                    surfacevertices.set_vertices(obj, polygon)
+        shadingstore.remove_shading(idf, [name for key, name
+                                          in report.removed
+                                          if key == shadingstore.KEY])
+        idfindex.removeidfobjects(idf, [(key, name) for key, name
+                                        in report.removed
+                                        if key != shadingstore.KEY])
+    return report
+
+
+Edges = collections.namedtuple(
+    'Edges', ['owner', 'starts', 'ends', 'preceding', 'following',
+              'vectors', 'lengths'])
+
+
+def polygon_edges(vertices, offsets):
+    '''return the Edges of the polygons: for each vertex the polygon it
+    belongs to (owner), the start and end of that polygon in vertices, the
+    indices of the vertices before and after it and the vector and length
+    of the edge to the vertex after it.'''
+    counts = np.diff(offsets)
+    index = np.arange(len(vertices))
+    owner = np.repeat(np.arange(len(counts)), counts)
+    starts = np.repeat(offsets[:-1], counts)
+    ends = np.repeat(offsets[1:], counts)
+    following = np.where(index + 1 == ends, starts, index + 1)
+    preceding = np.where(index == starts, ends - 1, index - 1)
+    vectors = vertices[following] - vertices
+    lengths = np.sqrt((vectors * vectors).sum(axis=1))
+    return Edges(owner, starts, ends, preceding, following, vectors,
+                 lengths)
+
+
+def per_polygon(mask, owner, count):
+    '''True for the polygons with a vertex in mask'''
+    return np.bincount(owner[mask], minlength=count) > 0
+
+
+def keep_vertices(vertices, offsets, owner, keep):
+    '''return (vertices, offsets) with only the vertices in keep'''
+    counts = np.bincount(owner[keep], minlength=len(offsets) - 1)
+    offsets = np.zeros(len(counts) + 1, dtype=int)
+    np.cumsum(counts, out=offsets[1:])
+    return vertices[keep], offsets
+
+
+def collinear(vertices, edges, tolerance):
+    '''True for the vertices closer than tolerance to the line between the
+    vertices before and after them (but not the same as either of them)'''
+    before = vertices[edges.preceding]
+    after = vertices[edges.following]
+    span = after - before
+    spans = np.sqrt((span * span).sum(axis=1))
+    products = np.cross(vertices - before, span)
+    distinct = ((edges.lengths > tolerance)
+                & (edges.lengths[edges.preceding] > tolerance)
+                & (spans > tolerance))
+    with np.errstate(invalid='ignore'):
+        return distinct & (np.sqrt((products * products).sum(axis=1))
+                           <= tolerance * spans)
+
+
+def plane_normals(vertices, offsets, edges):
+    '''return the normals of the polygons by Newell's method, twice the
+    area long, as an (m, 3) array'''
+    counts = np.diff(offsets)
+    # relative to the first vertex, for precision with large coordinates
+    relative = vertices - vertices[edges.starts]
+    products = np.cross(relative, relative[edges.following])
+    return np.column_stack([
+        np.bincount(edges.owner, weights=products[:, i],
+                    minlength=len(counts)) for i in range(3)])
+
+
+def plane_distances(vertices, offsets, normals, centres):
+    '''return the largest distance of a vertex of each polygon from the
+    plane through its centre'''
+    counts = np.diff(offsets)
+    owner = np.repeat(np.arange(len(counts)), counts)
+    distances = abs(((vertices - centres[owner]) * normals[owner]).sum(
+        axis=1))
+    largest = np.zeros(len(counts))
+    nonempty = counts > 0
+    if len(vertices):
+        largest[nonempty] = np.maximum.reduceat(distances,
+                                                offsets[:-1][nonempty])
+    return largest
+
+
+def projection_axes(normals):
+    '''return the two coordinate axes (each an int array) to project the
+    polygons onto, dropping the axis their normal is closest to'''
+    dropped = abs(normals).argmax(axis=1)
+    return (dropped + 1) % 3, (dropped + 2) % 3
+
+
+def self_intersecting(vertices, offsets, normals, tolerance):
+    '''True for the polygons with edges that cross each other (checked for
+    all pairs of edges that don't share a vertex, projected onto the plane
+    of the polygon). the polygons are grouped by their number of vertices,
+    so each group is one numpy operation.'''
+    counts = np.diff(offsets)
+    result = np.zeros(len(counts), dtype=bool)
+    first_axes, second_axes = projection_axes(normals)
+    for count in np.unique(counts[counts >= 4]):
+        chosen = np.nonzero(counts == count)[0]
+        pairs = np.array([(i, j) for i in range(count)
+                          for j in range(i + 2, count)
+                          if (j + 1) % count != i])
+        index = offsets[chosen][:, np.newaxis] + np.arange(count)
+        flat = np.column_stack([
+            vertices[index, first_axes[chosen][:, np.newaxis]].ravel(),
+            vertices[index, second_axes[chosen][:, np.newaxis]].ravel()])
+        points = flat.reshape(len(chosen), count, 2)
+        a, b = points[:, pairs[:, 0]], points[:, (pairs[:, 0] + 1) % count]
+        c, d = points[:, pairs[:, 1]], points[:, (pairs[:, 1] + 1) % count]
+        result[chosen] = (crosses(a, b, c, d, tolerance)
+                          & crosses(c, d, a, b, tolerance)).any(axis=1)
+    return result
+
+
+def crosses(a, b, c, d, tolerance):
+    '''True where c and d are on different sides of the line through a and
+    b, further than tolerance away from it'''
+    direction = b - a
+    lengths = np.sqrt((direction * direction).sum(axis=-1))
+    side_c = side(direction, c - a, tolerance * lengths)
+    side_d = side(direction, d - a, tolerance * lengths)
+    return side_c * side_d < 0
+
+
+def side(direction, vector, margin):
+    products = (direction[..., 0] * vector[..., 1]
+                - direction[..., 1] * vector[..., 0])
+    return np.where(abs(products) <= margin, 0, np.sign(products))
+
+
+def wrongly_wound(vertices, offsets, normals, centres, zones, valid,
+                  tolerance):
+    '''True for the polygons with a normal pointing into their zone: a ray
+    from the centre of the polygon along its normal crosses the other
+    polygons of the zone an odd number of times. all the pairs of polygons
+    of the same zone are tested at once.'''
+    counts = np.diff(offsets)
+    ids = {}
+    zone_ids = np.array([-1 if zone is None else ids.setdefault(zone,
+                                                                len(ids))
+                         for zone in zones], dtype=int)
+    chosen = np.nonzero(valid & (zone_ids >= 0))[0]
+    result = np.zeros(len(counts), dtype=bool)
+    if not len(chosen):
+        return result
+    # all the (source, target) pairs of polygons in the same zone
+    chosen = chosen[np.argsort(zone_ids[chosen], kind='mergesort')]
+    sizes = np.bincount(zone_ids[chosen])[zone_ids[chosen]]
+    firsts = np.searchsorted(zone_ids[chosen], zone_ids[chosen])
+    sources = np.repeat(chosen, sizes)
+    positions = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes,
+                                                   sizes)
+    targets = chosen[np.repeat(firsts, sizes) + positions]
+    other = sources != targets
+    sources, targets = sources[other], targets[other]
+    # where the rays meet the planes of the targets
+    directions = normals[sources] + PERTURBATION
+    with np.errstate(invalid='ignore', divide='ignore'):
+        distances = (((centres[targets] - centres[sources])
+                      * normals[targets]).sum(axis=1)
+                     / (directions * normals[targets]).sum(axis=1))
+    ahead = distances > tolerance
+    sources, targets = sources[ahead], targets[ahead]
+    points = (centres[sources]
+              + distances[ahead][:, np.newaxis] * directions[ahead])
+    # crossing number of the points in the targets, edge by edge
+    edge_counts = counts[targets]
+    pair = np.repeat(np.arange(len(targets)), edge_counts)
+    index = (np.repeat(offsets[:-1][targets], edge_counts)
+             + np.arange(edge_counts.sum())
+             - np.repeat(np.cumsum(edge_counts) - edge_counts, edge_counts))
+    following = np.where(index + 1 == np.repeat(offsets[1:][targets],
+                                                edge_counts),
+                         np.repeat(offsets[:-1][targets], edge_counts),
+                         index + 1)
+    first_axes, second_axes = projection_axes(normals[targets])
+    first_axes, second_axes = first_axes[pair], second_axes[pair]
+    x0, y0 = vertices[index, first_axes], vertices[index, second_axes]
+    x1, y1 = vertices[following, first_axes], vertices[following,
+                                                       second_axes]
+    px, py = points[pair, first_axes], points[pair, second_axes]
+    straddles = (y0 > py) != (y1 > py)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        crossing = straddles & (px < x0 + (py - y0) * (x1 - x0) / (y1 - y0))
+    inside = np.bincount(pair[crossing], minlength=len(targets)) % 2 == 1
+    hits = np.bincount(sources[inside], minlength=len(counts))
+    result[hits % 2 == 1] = True
+    return result
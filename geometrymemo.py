@@ -0,0 +1,176 @@
+'''
+geometrymemo.py
+
+A memo of the derived properties of polygons (area, normal, tilt, azimuth,
+rectangularity), shared by the geometry code of the package.
+
+A workflow asks for the same properties of the same surfaces over and over:
+addfmutoidf.area for every surface, shading.vertical_rectangles (through
+shading.collect_shading_walls and simplifycitysimgeometry.collect_walls)
+for every pass of the simplification, raycast.candidate_pairs for every
+building surface. The memo keeps the properties of the most recently used
+polygons, keyed by the bytes of their vertices. Only polygons with exactly
+the same vertices share their properties, so the results are the same as
+without the memo (the tilt and rectangularity tests don't tolerate
+rounding the vertices):
+
+    props = geometrymemo.properties(polygon_list)
+    props.area[i], props.tilt[i], props.rectangular[i]
+    geometrymemo.MEMO.hits, geometrymemo.MEMO.misses
+
+The properties of the polygons that are not in the memo are computed in one
+batch (see polygons.py). `area` of a single polygon that isn't in the memo
+computes only the area and adds it as a partial entry, the other properties
+are computed when `properties` asks for them.
+'''
+import collections
+import numpy as np
+import polygons
+
+# the number of polygons kept in the memo
+MAX_ENTRIES = 100000
+
+Properties = collections.namedtuple(
+    'Properties', ['area', 'normal', 'tilt', 'azimuth', 'rectangular'])
+
+
+class GeometryMemo(object):
+    '''a least recently used memo of the Properties of polygons. hits and
+    misses count the polygons found and not found in the memo.'''
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        # key -> properties, or (area,) for a polygon only `area` was asked
+        # for
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        '''forget all the polygons and reset the counters'''
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        '''return a dict with the hits, misses and size of the memo'''
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self.entries)}
+
+    def keys(self, vertices, offsets):
+        '''return the keys of the polygons (see polygons.pack): the bytes
+        of their vertices'''
+        data = vertices.astype('<f8').tostring()
+        size = 3 * np.dtype('<f8').itemsize
+        return [data[start * size:end * size]
+                for start, end in zip(offsets[:-1], offsets[1:])]
+
+    def properties(self, polygon_list):
+        '''return the Properties of the polygons, each an array with one
+        entry per polygon'''
+        vertices, offsets = polygons.pack(polygon_list)
+        keys = self.keys(vertices, offsets)
+        found = []
+        missing = collections.OrderedDict()  # key -> index of a polygon
+        for i, key in enumerate(keys):
+            entry = self.entries.pop(key, None)
+            if entry is not None and len(entry) < len(Properties._fields):
+                entry = None  # only the area, computed again with the rest
+            if entry is None:
+                missing.setdefault(key, i)
+            else:
+                self.entries[key] = entry  # most recently used
+            found.append(entry)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            computed = compute([polygon_list[i] for i in missing.values()])
+            computed = dict(zip(missing, zip(
+                computed.area, [tuple(n) for n in computed.normal],
+                computed.tilt, computed.azimuth, computed.rectangular)))
+            found = [computed[key] if entry is None else entry
+                     for key, entry in zip(keys, found)]
+            for key in missing:
+                self.entries[key] = computed[key]
+            self.evict()
+        if not found:
+            return Properties(np.zeros(0), np.zeros((0, 3)), np.zeros(0),
+                              np.zeros(0), np.zeros(0, dtype=bool))
+        columns = zip(*found)
+        return Properties(area=np.array(columns[0], dtype=float),
+                          normal=np.array(columns[1], dtype=float),
+                          tilt=np.array(columns[2], dtype=float),
+                          azimuth=np.array(columns[3], dtype=float),
+                          rectangular=np.array(columns[4], dtype=bool))
+
+    def area(self, polygon):
+        '''return the area of the polygon. for a polygon that isn't in the
+        memo, only the area is computed and added (see properties)'''
+        vertices = np.asarray(polygon, dtype='<f8').reshape(-1, 3)
+        key = vertices.tostring()
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            entry = (polygons.batch_areas(vertices, [0, len(vertices)])[0],)
+        else:
+            self.hits += 1
+        self.entries[key] = entry  # most recently used
+        self.evict()
+        return entry[0]
+
+    def evict(self):
+        '''forget the least recently used polygons beyond max_entries'''
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+def compute(polygon_list):
+    '''return the Properties of the polygons, without the memo'''
+    vertices, offsets = polygons.pack(polygon_list)
+    tilts, azimuths = polygons.batch_tilts_azimuths(vertices, offsets)
+    return Properties(area=polygons.batch_areas(vertices, offsets),
+                      normal=polygons.batch_unit_normals(vertices, offsets),
+                      tilt=tilts,
+                      azimuth=azimuths,
+                      rectangular=rectangles(vertices, offsets))
+
+
+def rectangles(vertices, offsets):
+    '''return a boolean array telling for each polygon if it has 4
+    vertices and right angles between its edges (the test of
+    eppy.geometry.surface.angle2vecs)'''
+    counts = np.diff(offsets)
+    result = np.zeros(len(counts), dtype=bool)
+    chosen = np.nonzero(counts == 4)[0]
+    if not len(chosen):
+        return result
+    index = offsets[chosen][:, np.newaxis] + np.arange(4)
+    quads = vertices[index]
+    vectors = quads - np.roll(quads, -1, axis=1)
+    following = np.roll(vectors, -1, axis=1)
+    moduli = (np.sqrt((vectors * vectors).sum(axis=2))
+              * np.sqrt((following * following).sum(axis=2)))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cosines = np.where(moduli == 0, 1.0,
+                           (vectors * following).sum(axis=2) / moduli)
+        angles = np.degrees(np.arccos(cosines))
+    result[chosen] = np.isclose(90.0, angles).all(axis=1)
+    return result
+
+
+# the memo shared by the geometry code of the package
+MEMO = GeometryMemo()
+
+
+def properties(polygon_list):
+    '''return the Properties of the polygons, from the shared memo'''
+    return MEMO.properties(polygon_list)
+
+
+def area(polygon):
+    '''return the area of the polygon, from the shared memo if it is
+    there'''
+    return MEMO.area(polygon)
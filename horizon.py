@@ -0,0 +1,111 @@
+'''
+horizon.py
+
+The far-field obstruction profile (horizon) of a building.
+
+CitySim describes the obstructions far away from the simulated buildings
+as a horizon: the elevation angle (theta) of the obstructions in each
+direction (phi). Far away buildings can be replaced by such a profile
+instead of being exported as geometry:
+
+    thetas = horizon.horizon(buildings, centre, resolution=10)
+    # thetas[i] is the elevation at phi = i * resolution
+
+Each building is reduced to the convex hull of its footprint at the height
+of its highest point. For each sector of `resolution` degrees around the
+azimuth, the elevation of a building is that of the closest point of its
+footprint in the sector, so narrow buildings between two azimuths are not
+missed.
+
+Azimuths are in degrees clockwise from north (the y axis), as in
+polygons.batch_tilts_azimuths. This module is plain Python (no numpy), so
+revittocitysim.py can use it in IronPython.
+'''
+import math
+import lod
+
+
+def horizon(buildings, centre, resolution=10.0):
+    '''return the elevation angles (in degrees, at least 0) of the horizon
+    seen from centre (x, y, z) at the azimuths 0, resolution,
+    2 * resolution... buildings is a list of buildings, each a list of
+    (x, y, z) points. buildings around the centre are ignored.'''
+    count = int(round(360.0 / resolution))
+    step = 360.0 / count
+    thetas = [0.0] * count
+    cx, cy, cz = centre
+    for points in buildings:
+        points = list(points)
+        if not points:
+            continue
+        height = max(p[2] for p in points) - cz
+        if height <= 0:
+            continue
+        footprint = [(x - cx, y - cy) for x, y in lod.convex_hull(points)]
+        if len(footprint) < 2 or contains(footprint, (0.0, 0.0)):
+            continue
+        for i in range(len(footprint)):
+            a, b = footprint[i - 1], footprint[i]
+            for k, distance in edge_distances(a, b, step):
+                theta = math.degrees(math.atan2(height, distance))
+                if theta > thetas[k % count]:
+                    thetas[k % count] = theta
+    return thetas
+
+
+def azimuth(point):
+    '''the azimuth of the (x, y) point in degrees clockwise from north, in
+    [0, 360)'''
+    return math.degrees(math.atan2(point[0], point[1])) % 360.0
+
+
+def edge_distances(a, b, step):
+    '''yield (k, distance) for the sectors k (sector k is the azimuth
+    k * step +- step / 2, k may be larger than the number of sectors) seen
+    from the origin, where distance is the shortest distance to the edge
+    from a to b in that sector. the edge must not pass through the
+    origin.'''
+    start = azimuth(a)
+    width = (azimuth(b) - start) % 360.0
+    if width > 180:
+        start, width = azimuth(b), 360.0 - width
+    edge = (b[0] - a[0], b[1] - a[1])
+    # the azimuth of the closest point of the line through the edge
+    along = (a[0] * edge[0] + a[1] * edge[1]) / (edge[0] ** 2 + edge[1] ** 2)
+    foot = start + (azimuth((a[0] - along * edge[0],
+                             a[1] - along * edge[1])) - start) % 360.0
+    first = int(math.floor((start + step / 2) / step))
+    last = int(math.floor((start + width + step / 2) / step))
+    for k in range(first, last + 1):
+        low = max(start, k * step - step / 2)
+        high = min(start + width, k * step + step / 2)
+        if high < low:
+            continue
+        candidates = [low, high]
+        if low < foot < high:
+            candidates.append(foot)
+        yield k, min(ray_distance(angle, a, edge) for angle in candidates)
+
+
+def ray_distance(angle, a, edge):
+    '''the distance from the origin to the line through a along edge, in
+    the direction of the azimuth angle'''
+    direction = (math.sin(math.radians(angle)), math.cos(math.radians(angle)))
+    denominator = cross(direction, edge)
+    if denominator == 0:
+        # along the edge: the closer end
+        return min(math.hypot(*a), math.hypot(a[0] + edge[0],
+                                              a[1] + edge[1]))
+    return abs(cross(a, edge) / denominator)
+
+
+def cross(a, b):
+    return a[0] * b[1] - a[1] * b[0]
+
+
+def contains(polygon, point):
+    '''True if the point is inside (or on) the counterclockwise convex
+    polygon'''
+    return all(cross((b[0] - a[0], b[1] - a[1]),
+                     (point[0] - a[0], point[1] - a[1])) >= 0
+               for a, b in zip(polygon, polygon[1:] + polygon[:1]))
@@ -0,0 +1,98 @@
+'''
+iddcache.py
+
+Keep a pre-parsed copy of the EnergyPlus IDD file on disk.
+
+Parsing the Energy+.idd file with eppy takes a few seconds, which is paid
+again in every fresh process (each batch worker, each VisTrails session).
+The parsed IDD (the `block` and `idd_info` eppy needs) only consist of lists,
+dicts and strings, so they can be written out with `marshal` and loaded
+again in a fraction of the time.
+
+The cache files are named after the SHA-1 of the IDD file contents, so
+editing or replacing an IDD file automatically results in a new cache entry.
+The hash of each IDD file is remembered together with its mtime and size,
+so the file is only re-hashed when it changes on disk.
+'''
+import os
+import hashlib
+import marshal
+import tempfile
+
+# bump this when the layout of the cached data changes
+CACHE_FORMAT = 1
+CACHE_FOLDER = os.path.join(tempfile.gettempdir(),
+                            'design-performance-workflows', 'idd')
+
+# abspath -> (mtime, size, sha1)
+_hashes = {}
+
+
+def idd_hash(idd_path):
+    '''return the SHA-1 of the contents of the IDD file. The result is
+    remembered for as long as the mtime and size of the file don't change.'''
+    idd_path = os.path.abspath(idd_path)
+    stat = os.stat(idd_path)
+    known = _hashes.get(idd_path)
+    if known and known[:2] == (stat.st_mtime, stat.st_size):
+        return known[2]
+    sha1 = hashlib.sha1()
+    with open(idd_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    digest = sha1.hexdigest()
+    _hashes[idd_path] = (stat.st_mtime, stat.st_size, digest)
+    return digest
+
+
+def cache_path(idd_path, cache_folder=None):
+    '''return the path of the cache file for the IDD file.'''
+    if cache_folder is None:
+        cache_folder = CACHE_FOLDER
+    return os.path.join(cache_folder, '%s-%i-%i.idd' % (
+        idd_hash(idd_path), CACHE_FORMAT, marshal.version))
+
+
+def load_idd(idd_path, cache_folder=None):
+    '''return the tuple (block, idd_info) for the IDD file, as expected by
+    `eppy.modeleditor.IDF.setidd`. The cache is used if possible, else the
+    IDD file is parsed and the cache is updated.'''
+    path = cache_path(idd_path, cache_folder)
+    digest = idd_hash(idd_path)
+    try:
+        with open(path, 'rb') as f:
+            cached_digest, block, idd_info = marshal.load(f)
+        if cached_digest == digest:
+            return block, idd_info
+    except (IOError, EOFError, ValueError, TypeError):
+        pass  # not cached yet or bad cache file - just parse the IDD
+    block, idd_info = parse_idd(idd_path)
+    write_cache(path, (digest, block, idd_info))
+    return block, idd_info
+
+
+def parse_idd(idd_path):
+    '''parse the IDD file with eppy, returning (block, idd_info)'''
+    from eppy.EPlusInterfaceFunctions import parse_idd
+    block, commlst, idd_info = parse_idd.extractidddata(idd_path)
+    return block, idd_info
+
+
+def write_cache(path, data):
+    '''write the data to a temporary file and move it into place, so
+    other processes never see a half-written cache file.'''
+    folder = os.path.dirname(path)
+    tmp_path = None
+    try:
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=folder)
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        # caching is only an optimisation - e.g. another process got there
+        # first (rename fails on Windows) or the folder is read-only
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
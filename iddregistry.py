@@ -0,0 +1,105 @@
+'''
+iddregistry.py
+
+Keep several parsed IDD files in memory at the same time.
+
+eppy stores the IDD on the IDF class itself (`IDF.setiddname`), so the first
+IDD file set wins for the whole process. Since eppy only ever looks up
+`iddname`, `idd_info` and `block` through the class of the model, we can
+create a subclass of IDF for each IDD file and bind the (cached, see
+iddcache.py) parsed IDD to that subclass. Models read with different
+subclasses can then use different EnergyPlus versions side by side.
+
+The registry is keyed by (version, hash) of the IDD file, so the same IDD
+file is only loaded once per process, no matter how many paths point to it.
+'''
+import os
+import re
+import sys
+import iddcache
+
+# (version, sha1) -> subclass of eppy.modeleditor.IDF
+_registry = {}
+
+
+def idf_class(idd_path):
+    '''return a subclass of eppy.modeleditor.IDF bound to the IDD file.
+    Instantiate it like the IDF class itself.'''
+    idd_path = fs_path(idd_path)
+    key = (idd_version(idd_path), iddcache.idd_hash(idd_path))
+    if key not in _registry:
+        from eppy.modeleditor import IDF
+        block, idd_info = iddcache.load_idd(idd_path)
+        name = 'IDF_%s' % key[0].replace('.', '_')
+        _registry[key] = type(name, (IDF,), {'iddname': idd_path,
+                                             'idd_info': idd_info,
+                                             'block': block})
+    return _registry[key]
+
+
+def read_idf(idf_text, idd_path):
+    '''return an IDF object for the contents of an IDF file, using the
+    IDD file `idd_path`.'''
+    from StringIO import StringIO
+    return idf_class(idd_path)(StringIO(idf_text))
+
+
+def idd_path_of(idf):
+    '''return the path to the IDD file used for the IDF object or None if
+    it is not known.'''
+    iddname = getattr(idf, 'iddname', None)
+    if is_path(iddname):
+        return iddname
+    return None
+
+
+def find_idd(version):
+    '''return the path to a registered IDD file for the model version
+    (e.g. "8.1") or None if no such IDD file was loaded yet.'''
+    if version:
+        for (idd_version_, sha1), cls in sorted(_registry.items()):
+            if same_version(idd_version_, version):
+                return cls.iddname
+    return None
+
+
+def registered():
+    '''return a list of (version, sha1, idd_path) for the loaded IDD files'''
+    return [(version, sha1, cls.iddname)
+            for (version, sha1), cls in sorted(_registry.items())]
+
+
+def idd_version(idd_path):
+    '''return the version string of the IDD file, as found on the
+    first line ("!IDD_Version 8.2.0").'''
+    with open(idd_path, 'r') as f:
+        line = f.readline().strip()
+    if not line.startswith('!IDD_Version'):
+        return '0'
+    return line.split()[-1]
+
+
+def model_version(idf_text):
+    '''return the Version Identifier of an IDF file (string contents) or
+    None if the model does not contain a Version object.'''
+    match = re.search(r'^\s*Version\s*,\s*([0-9.]+)\s*;', idf_text,
+                      re.IGNORECASE | re.MULTILINE)
+    if match:
+        return match.group(1)
+    return None
+
+
+def same_version(va, vb):
+    '''compare versions on major and minor number only ("8.2.0" == "8.2")'''
+    return va.split('.')[:2] == vb.split('.')[:2]
+
+
+def is_path(value):
+    return isinstance(value, basestring) and os.path.isfile(value)
+
+
+def fs_path(path):
+    '''eppy expects IDD paths to be of type str.'''
+    if isinstance(path, unicode):
+        return path.encode(sys.getfilesystemencoding() or 'utf-8')
+    return path
@@ -0,0 +1,136 @@
+'''
+idfclone.py
+
+Cheap copy-on-write clones of eppy IDF models.
+
+Cloning a template by copying each object with `IDF.copyidfobject` rebuilds
+every object from the IDD (field names and all), so extracting each building
+of a district from the same HVAC template pays for the whole template every
+time. `clone` instead shares the objects of each class with the template and
+only copies a class the first time it is accessed on the clone:
+
+    idf = idfclone.clone(template)
+    idf.idfobjects['ZONE']  # the zones are copied now, the rest is shared
+
+Both `idf.idfobjects` and `idf.model.dt` are copy-on-write, so all of eppy's
+methods work on the clone as usual. Copied objects reuse the field names of
+the template objects, so copying a class is cheap too.
+
+The template becomes copy-on-write too: after cloning, it copies each class
+before handing it out, so changes to the template (new, removed or changed
+objects) don't reach its clones and the other way round. Only references
+to template objects taken before cloning still point at the shared objects.
+'''
+import copy
+from StringIO import StringIO
+
+
+def clone(template):
+    '''return a copy of the IDF object `template`, sharing the objects of
+    each class with the template until the class is accessed.'''
+    idf = template.__class__()
+    idf.idfname = StringIO('')
+    objects, dt = snapshot(template.idfobjects), snapshot(template.model.dt)
+    cow = CopyOnWrite(objects, dt)
+    idf.model = copy.copy(template.model)
+    idf.model.dt = cow.dt
+    idf.idfobjects = cow.idfobjects
+    # the template copies what it changes from now on, too
+    own = CopyOnWrite(objects, dt)
+    template.idfobjects = own.idfobjects
+    template.model.dt = own.dt
+    import shadingstore
+    store = shadingstore.stored(template)
+    if store is not None:
+        store.attach(template)
+        store.copy_to(idf)
+    return idf
+
+
+def snapshot(objects):
+    '''return a dict KEY -> tuple of the objects of the class, for the
+    idfobjects or model.dt of a model (without copying the classes a clone
+    shares)'''
+    return dict((key, tuple(value))
+                for key, value in dict.iteritems(objects))
+
+
+def peek(objects, key):
+    '''return the objects stored for key in idfobjects (or model.dt), a
+    list or a tuple, without copying them. The result must not be changed.'''
+    if isinstance(objects, SharedObjects):
+        return objects.peek(key)
+    return objects[key]
+
+
+def copy_bunch(bunch):
+    '''return a copy of an eppy object (EpBunch) that shares the field names
+    with the original. Only use this for objects of models with the same
+    IDD. Same as the copy made by eppy.modeleditor.addthisbunch, minus
+    building the field names from the IDD.'''
+    return bunch.__class__(copy.copy(bunch.obj), bunch.objls, bunch.objidd)
+
+
+class CopyOnWrite(object):
+    '''the shared state of the copy-on-write idfobjects and model.dt
+    dicts of a clone'''
+
+    def __init__(self, idfobjects, dt):
+        '''idfobjects and dt are snapshots of the template (see snapshot),
+        so objects added to or removed from the template later don't show
+        up here'''
+        self.shared = set(idfobjects.keys())
+        self.idfobjects = SharedObjects(self, idfobjects)
+        self.dt = SharedObjects(self, dt)
+
+    def materialize(self, key):
+        '''copy the objects of the class key from the template'''
+        if key not in self.shared:
+            return
+        self.shared.discard(key)
+        bunches = []
+        for bunch in self.idfobjects.peek(key):
+            bunches.append(copy_bunch(bunch))
+        dict.__setitem__(self.idfobjects, key, bunches)
+        dict.__setitem__(self.dt, key, [bunch.obj for bunch in bunches])
+
+
+class SharedObjects(dict):
+    '''a dict of KEY -> [objects] that calls `owner.materialize(key)`
+    before handing out the list of objects of a class (e.g. to copy it
+    from the template first, see CopyOnWrite)'''
+
+    def __init__(self, owner, items):
+        super(SharedObjects, self).__init__(items)
+        self.owner = owner
+
+    def __getitem__(self, key):
+        self.owner.materialize(key)
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        self.owner.materialize(key)
+        dict.__setitem__(self, key, value)
+
+    def peek(self, key):
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def __copy__(self):
+        return dict((key, self[key]) for key in self)
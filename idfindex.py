@@ -0,0 +1,252 @@
+'''
+idfindex.py
+
+An index of the objects in an eppy IDF model by (class, upper-cased Name).
+
+eppy's `IDF.getobject` scans all the objects of a class, which makes
+looking up each surface of a district model quadratic. The index is built
+lazily per class the first time a class is looked up and is kept up to
+date by the functions in this module, which are drop-in replacements for
+the IDF methods of the same name:
+
+    obj = idfindex.getobject(idf, 'WALL:DETAILED', 'Wall11')
+    obj = idfindex.newidfobject(idf, 'CONSTRUCTION')
+    obj = idfindex.copyidfobject(idf, other_obj)
+    idfindex.removeidfobject(idf, obj)
+
+Objects created with `newidfobject` usually get their Name after they are
+created, so they are only added to the index when their class is looked up
+next. If the number of objects of a class changed behind the index's back
+(e.g. by calling `idf.newidfobject` directly), that class is re-indexed.
+Renaming objects that are already indexed is not tracked - call
+`reindex(idf)` after doing so.
+
+For changing many objects at once there are bulk versions that rebuild the
+list of each affected class only once:
+
+    idfindex.removeidfobjects(idf, [('SHADING:BUILDING:DETAILED', 'S1'), ...])
+    idfindex.mergeidf(left, right)
+'''
+import idfclone
+
+
+def index(idf):
+    '''return the IdfIndex for the IDF object, creating it if necessary.'''
+    result = idf.__dict__.get('_idfindex')
+    if result is None or result.idf is not idf:
+        result = IdfIndex(idf)
+        idf.__dict__['_idfindex'] = result
+    return result
+
+
+def reindex(idf):
+    '''forget the index of the IDF object, it will be rebuilt on demand.'''
+    idf.__dict__.pop('_idfindex', None)
+
+
+def getobject(idf, key, name):
+    '''return the object of class `key` with the Name `name` or None
+    (same as `IDF.getobject`, but O(1)).'''
+    return index(idf).getobject(key, name)
+
+
+def newidfobject(idf, key, aname=''):
+    '''add a new object to the IDF (see `IDF.newidfobject`).'''
+    return index(idf).newidfobject(key, aname)
+
+
+def copyidfobject(idf, idfobject):
+    '''add a copy of `idfobject` to the IDF (see `IDF.copyidfobject`) and
+    return the copy.'''
+    return index(idf).copyidfobject(idfobject)
+
+
+def removeidfobject(idf, idfobject):
+    '''remove `idfobject` from the IDF (see `IDF.removeidfobject`).'''
+    return index(idf).removeidfobject(idfobject)
+
+
+def removeidfobjects(idf, keys_names):
+    '''remove all objects whose (class, Name) is in `keys_names`, an
+    iterable of (key, name) pairs (e.g. rows of a CSV file). Returns the
+    list of removed objects.'''
+    names = {}  # KEY -> set(NAME)
+    for key, name in keys_names:
+        names.setdefault(key.upper(), set()).add(('%s' % name).upper())
+    removed = []
+    for key, remove in names.items():
+        removed.extend(remove_named(idf, key, remove))
+    return removed
+
+
+def mergeidf(left, right):
+    '''add copies of the objects in `right` to `left`. Objects in `right`
+    replace the objects of the same class and Name in `left` (if the same
+    Name appears more than once in `right`, the last one wins). Objects
+    without a Name field are just added, except for unique objects (e.g.
+    Version, Timestep): the last one in `right` replaces the one in `left`.
+    Returns `left`.'''
+    import shadingstore
+    shadingstore.flush(right)
+    same_idd = left.idd_info is right.idd_info
+    for key in right.idfobjects.keys():
+        key = key.upper()
+        objects = idfclone.peek(right.idfobjects, key)
+        if not objects:
+            continue
+        if is_unique(objects[0]):
+            objects = objects[-1:]
+            del left.idfobjects[key][:]
+            del left.model.dt[key][:]
+        # NAME -> last object with that NAME, unnamed objects in order
+        last = {}
+        for obj in objects:
+            name = object_name(obj)
+            if name is not None:
+                last[name] = obj
+        remove_named(left, key, set(last.keys()))
+        for obj in objects:
+            name = object_name(obj)
+            if name is None or last[name] is obj:
+                if same_idd:
+                    copy = idfclone.copy_bunch(obj)
+                    left.idfobjects[key].append(copy)
+                    left.model.dt[key].append(copy.obj)
+                else:
+                    left.copyidfobject(obj)
+        index(left).forget(key)
+    return left
+
+
+def remove_named(idf, key, names):
+    '''remove the objects of class `key` with an upper-cased Name in the set
+    `names`, rebuilding the list of objects of that class only once.
+    Returns the list of removed objects.'''
+    key = key.upper()
+    objects = idf.idfobjects[key]
+    removed = [obj for obj in objects if object_name(obj) in names]
+    if removed:
+        removed_ids = set(map(id, removed))
+        objects[:] = [obj for obj in objects if id(obj) not in removed_ids]
+        removed_ids = set(id(obj.obj) for obj in removed)
+        dt = idf.model.dt[key]
+        dt[:] = [obj for obj in dt if id(obj) not in removed_ids]
+        index(idf).forget(key)
+    return removed
+
+
+def object_name(idfobject):
+    '''return the upper-cased Name of the object or None if the object
+    has no Name field.'''
+    if 'Name' not in idfobject.objls:
+        return None
+    return ('%s' % idfobject.Name).upper()
+
+
+def is_unique(idfobject):
+    '''True if the IDD allows only one object of the class of the object
+    (unique-object).'''
+    return bool(idfobject.objidd) and 'unique-object' in idfobject.objidd[0]
+
+
+class IdfIndex(object):
+    '''maps (class, upper-cased Name) to the objects of an IDF. Use the
+    module level functions instead of instantiating this directly.'''
+
+    def __init__(self, idf):
+        self.idf = idf
+        self.names = {}  # KEY -> {NAME: [obj, ...]}, in idfobjects order
+        self.pending = {}  # KEY -> [obj, ...] created, but not indexed yet
+        self.counts = {}  # KEY -> number of objects the index knows about
+
+    def objects(self, key):
+        return self.idf.idfobjects[key]
+
+    def forget(self, key):
+        '''drop the index of a class, it is rebuilt on the next lookup'''
+        key = key.upper()
+        self.names.pop(key, None)
+        self.pending.pop(key, None)
+        self.counts.pop(key, None)
+
+    def names_for(self, key):
+        '''return the {NAME: [obj, ...]} dict for the class, making sure it
+        is up to date'''
+        key = key.upper()
+        names = self.names.get(key)
+        if names is None or self.counts[key] != len(self.objects(key)):
+            return self.build(key)
+        for obj in self.pending.pop(key, []):
+            self.add(names, obj)
+        return names
+
+    def build(self, key):
+        names = {}
+        for obj in self.objects(key):
+            self.add(names, obj)
+        self.names[key] = names
+        self.pending.pop(key, None)
+        self.counts[key] = len(self.objects(key))
+        return names
+
+    def add(self, names, obj):
+        name = object_name(obj)
+        if name is not None:
+            names.setdefault(name, []).append(obj)
+
+    def getobject(self, key, name):
+        name = ('%s' % name).upper()
+        found = self.names_for(key).get(name)
+        if not found:
+            return None
+        if object_name(found[0]) != name:
+            # an indexed object was renamed - start over for this class
+            found = self.build(key.upper()).get(name)
+            if not found:
+                return None
+        return found[0]
+
+    def newidfobject(self, key, aname=''):
+        key = key.upper()
+        obj = self.idf.newidfobject(key, aname)
+        if key in self.names:
+            self.pending.setdefault(key, []).append(obj)
+            self.counts[key] += 1
+        return obj
+
+    def copyidfobject(self, idfobject):
+        key = idfobject.key.upper()
+        self.idf.copyidfobject(idfobject)
+        obj = self.objects(key)[-1]
+        if key in self.names:
+            self.pending.setdefault(key, []).append(obj)
+            self.counts[key] += 1
+        return obj
+
+    def removeidfobject(self, idfobject):
+        key = idfobject.key.upper()
+        if key in self.names and self.counts[key] == len(self.objects(key)):
+            self.counts[key] -= 1
+            pending = self.pending.get(key, [])
+            if any(obj is idfobject for obj in pending):
+                self.pending[key] = [o for o in pending if o is not idfobject]
+            else:
+                self.discard(self.names[key], idfobject)
+        return self.idf.removeidfobject(idfobject)
+
+    def discard(self, names, idfobject):
+        if not self.discard_from(names, object_name(idfobject), idfobject):
+            # renamed after indexing - look for it under all names
+            for name in names.keys():
+                if self.discard_from(names, name, idfobject):
+                    break
+
+    def discard_from(self, names, name, idfobject):
+        found = names.get(name, [])
+        for i, obj in enumerate(found):
+            if obj is idfobject:
+                del found[i]
+                if not found:
+                    del names[name]
+                return True
+        return False
@@ -0,0 +1,102 @@
+'''
+idfwriter.py
+
+Write an eppy IDF model to a file handle without building the whole model
+as one string first.
+
+`IDF.idfstr()` concatenates the `repr` of every object into a single string
+(quadratically, even), so for district models with tens of thousands of
+shading surfaces writing the model needs twice the memory of the model and
+takes longer than the simulation setup itself. `write_idf` produces exactly
+the same bytes, but formats the objects one by one and hands them to the
+file in buffered chunks:
+
+    with open(idf_path, 'w') as out:
+        idfwriter.write_idf(idf, out)
+
+The field comments ("    !- Vertex 1 Xcoordinate") only depend on the
+class of an object, so they are formatted once per class and reused.
+'''
+import idfclone
+import shadingstore
+
+# width the value part of each line is padded to (see EpBunch.__repr__)
+VALUE_WIDTH = 26
+BUFFER_SIZE = 1 << 16
+
+# KEY -> (objls, ['    !- Comment', ...])
+_comments = {}
+
+
+def write_idf(idf, out, buffer_size=BUFFER_SIZE):
+    '''write the IDF object to the file handle `out`. The output is the
+    same as `out.write(idf.idfstr())`.'''
+    if getattr(idf, 'outputtype', 'standard') != 'standard':
+        # the other output types post-process the whole string anyway
+        out.write(idf.idfstr())
+        return
+    chunk = []
+    size = 0
+    for text in idf_chunks(idf):
+        chunk.append(text)
+        size += len(text)
+        if size >= buffer_size:
+            out.write(''.join(chunk))
+            chunk = []
+            size = 0
+    out.write(''.join(chunk))
+
+
+def idf_chunks(idf):
+    '''yield the text of the IDF object, one object at a time.'''
+    store = shadingstore.stored(idf)
+    for objname in idf.model.dtls:
+        for obj in idfclone.peek(idf.idfobjects, objname):
+            yield format_object(obj)
+        if store is not None and objname == shadingstore.KEY:
+            # the surfaces eppy would see after flushing the store
+            for i in range(len(store)):
+                yield format_fields(store.fields(i), store.objls)
+
+
+def format_object(obj):
+    '''return the same string as `obj.__repr__()` for an EpBunch.'''
+    if min(len(obj.obj), len(obj.objls)) < 2:
+        # degenerate objects, let eppy deal with these
+        return obj.__repr__()
+    return format_fields(obj.obj, obj.objls)
+
+
+def format_fields(values, objls):
+    '''format the field values of an object with the field names objls
+    (at least two of each) like eppy does.'''
+    nlines = min(len(values), len(objls))
+    comments = field_comments(values[0], objls)
+    lines = ['\n', (str(values[0]) + ',').ljust(VALUE_WIDTH)]
+    for i in range(1, nlines - 1):
+        lines.append('\n')
+        lines.append(('    ' + str(values[i]) + ',').ljust(VALUE_WIDTH))
+        lines.append(comments[i])
+    last = nlines - 1
+    if last == len(values) - 1:
+        lines.append('\n')
+        lines.append(('    ' + str(values[last]) + ';').ljust(VALUE_WIDTH))
+    else:
+        # eppy drops the values that have no field name
+        lines.append('\n')
+        lines.append(('    ' + str(values[last]) + ',').ljust(VALUE_WIDTH))
+    lines.append(comments[last])
+    lines.append('\n')
+    return ''.join(lines)
+
+
+def field_comments(key, objls):
+    '''return the comments for each field in objls, the field names of an
+    object of the class `key`'''
+    # eppy gives every object its own (but equal) list of field names
+    known = _comments.get(key.upper())
+    if known is None or known[0] != objls:
+        known = (objls, ['    !- %s' % comm.replace('_', ' ')
+                         for comm in objls])
+        _comments[key.upper()] = known
+    return known[1]
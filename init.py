@@ -93,10 +93,12 @@ class CastToCitySimXml(NotCacheable, Module):
 class Idf(NotCacheable, Module):
     """Wraps an eppy IDF3 object for use in the VisTrails system.
 
-    the default EnergyPlus IDD file will be used if none is
-    specified. This is done by looking through $PATH to find
-    the EnergyPlus executable and use the `Energy+.idd` file
-    in the same folder.
+    if no IDD file is specified, an IDD file already loaded for the
+    version of the model is used, else the default EnergyPlus IDD file.
+    This is done by looking through $PATH to find the EnergyPlus
+    executable and use the `Energy+.idd` file in the same folder.
+    Models with different IDD files can be used side by side
+    (see iddregistry.py).
 
     CONVENTION: ports with type Idf exchange eppy.IDF instances."""
     _input_ports = [
@@ -104,7 +106,8 @@ class Idf(NotCacheable, Module):
               signature='basic:Path',
               optional=True),
         IPort(name='idd',
-              signature='basic:Path'),
+              signature='basic:Path',
+              optional=True),
     ]
     _output_ports = [OPort(name='idf',
                            signature=signature('Idf'))]  # noqa
@@ -114,22 +117,16 @@ class Idf(NotCacheable, Module):
         self.idf = None
 
     def compute(self):
-        from eppy.modeleditor import IDF, IDDAlreadySetError
-        from StringIO import StringIO
+        import iddregistry
 
         idf = self.force_get_input('idf', None)
-        idd = self.get_input('idd').name
-
-        try:
-            IDF.setiddname(idd)
-        except IDDAlreadySetError:
-            pass
-
         if idf:
-            idf_file = open(idf.name, 'r')
+            with open(idf.name, 'r') as f:
+                idf_text = f.read()
         else:
-            idf_file = StringIO('')
-        self.idf = IDF(idf_file)
+            idf_text = ''
+        idd = force_get_path(self, 'idd', None) or find_model_idd(idf_text)
+        self.idf = iddregistry.read_idf(idf_text, idd)
         self.set_output('idf', self.idf)
 
 
@@ -175,20 +172,15 @@ class GenerateIdf(NotCacheable, Module):
 
     def compute(self):
         import requests
-        from eppy.modeleditor import IDF, IDDAlreadySetError
-        from StringIO import StringIO
+        import iddregistry
 
         url = self.get_input('url')
         snapshot = self.get_input('snapshot')
         r = requests.post(url, etree.tostring(snapshot))
         if r.ok:
-            idf_file = StringIO(r.text.strip().replace('\r\n', '\n'))
-            idd = force_get_path(self, 'idd', find_idd())
-            try:
-                IDF.setiddname(idd)
-            except IDDAlreadySetError:
-                pass
-            self.idf = IDF(idf_file)
+            idf_text = r.text.strip().replace('\r\n', '\n')
+            idd = force_get_path(self, 'idd', None) or find_model_idd(idf_text)
+            self.idf = iddregistry.read_idf(idf_text, idd)
             self.set_output('idf', self.idf)
         else:
             raise Exception('Could not request IDF from BIM')
@@ -198,20 +190,23 @@ class AddFmuToIdfLwr(NotCacheable, Module):
     """ Augment the IDF file with the information necessary for EnergyPlusToFMU
     and implement the CitySim/EnergyPlus interface. Includes the interface
     for LWR (replaces AddFmuToIdf)
+
+    The manifest output lists the FMU variables of the interface as JSON.
     """
     _input_ports = [IPort(
         name='idf',
         signature=signature('Idf'))]
-    _output_ports = [OPort(
-        name='idf',
-        signature=signature('Idf'))]
+    _output_ports = [
+        OPort(name='idf', signature=signature('Idf')),
+        OPort(name='manifest', signature='basic:String', optional=True)]
 
     def compute(self):
         import addfmutoidf
         reload(addfmutoidf)
         idf = self.get_input('idf')
-        idf = addfmutoidf.process_idf(idf)
+        manifest = addfmutoidf.generate_interface(idf)
         self.set_output('idf', idf)
+        self.set_output('manifest', addfmutoidf.manifest_json(manifest))
 
 
 class RunEnergyPlus(NotCacheable, Module):
@@ -232,8 +227,9 @@ class RunEnergyPlus(NotCacheable, Module):
 
     def compute(self):
         import shutil
+        import idfwriter
         idf = self.get_input('idf')
-        idd_path = force_get_path(self, 'idd', find_idd())
+        idd_path = force_get_path(self, 'idd', None) or idd_of(idf)
         epw_path = self.get_input('epw').name
         energyplus_path = force_get_path(self, 'energyplus', find_energyplus())
         tmp = tempfile.mkdtemp(
@@ -241,7 +237,7 @@ class RunEnergyPlus(NotCacheable, Module):
             + "_RunEnergyPlus_")
         idf_path = os.path.join(tmp, 'in.idf')
         with open(idf_path, 'w') as out:
-            out.write(idf.idfstr())
+            idfwriter.write_idf(idf, out)
         shutil.copy(idd_path, tmp)
         shutil.copyfile(epw_path, os.path.join(tmp, 'in.epw'))
         copy_list = self.force_get_input('copy_list', None)
@@ -410,6 +406,9 @@ class EnergyPlusToFmu(NotCacheable, Module):
 
     """Run the EnergyPlusToFMU.py script. Use VisTrails
     variables to configure where the script is.
+
+    if no IDD file is specified, the IDD file the model was read
+    with is used.
     """
     _input_ports = [
         IPort(
@@ -417,19 +416,20 @@ class EnergyPlusToFmu(NotCacheable, Module):
             signature=signature('Idf')),
         IPort(name='epw_path', signature='basic:Path'),
         IPort(name='EnergyPlusToFmu_path', signature='basic:Path'),
-        IPort(name='idd_path', signature='basic:Path')]
+        IPort(name='idd_path', signature='basic:Path', optional=True)]
     _output_ports = [
         OPort(name='fmu_path', signature='basic:Path')]
 
     def compute(self):
+        import idfwriter
         try:
             ep2fmu_path = self.get_input('EnergyPlusToFmu_path').name
-            idd_path = self.get_input('idd_path').name
             idf = self.get_input('idf')
+            idd_path = force_get_path(self, 'idd_path', None) or idd_of(idf)
             epw_path = self.get_input('epw_path').name
             idf_fd, idf_path = tempfile.mkstemp(suffix='.idf')
             with os.fdopen(idf_fd, 'w') as idf_file:
-                idf_file.write(idf.idfstr())
+                idfwriter.write_idf(idf, idf_file)
             cwd = tempfile.gettempdir()
             call_args = ['python', ep2fmu_path,
                          '-i', idd_path,
@@ -446,13 +446,35 @@ class EnergyPlusToFmu(NotCacheable, Module):
 
 class RevitToCitySim(NotCacheable, Module):
     """Extract a CitySim scene from Revit using the RPS
-    (see also r2cs_server.py)"""
-
+    (see also r2cs_server.py)
+
+    The shading buildings further away than near_distance are exported as
+    the convex hull of their footprint, beyond far_distance as a box (see
+    lod.py). Those further away than horizon_distance make up the far
+    field obstructions instead, every horizon_resolution degrees (see
+    horizon.py)."""
+    _input_ports = [IPort(name='near_distance',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='far_distance',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='horizon_distance',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='horizon_resolution',
+                          signature='basic:Float',
+                          optional=True)]
     _output_ports = [('citysim_xml', basic.String)]
 
     def compute(self):
         import urllib2
         url = 'http://localhost:8014/revittocitysim'
+        for name in ('near_distance', 'far_distance', 'horizon_distance',
+                     'horizon_resolution'):
+            value = self.force_get_input(name, None)
+            if value is not None:
+                url += '/%s=%r' % (name, value)
         content = urllib2.urlopen(url).read()
         self.set_output('citysim_xml', content)
 
@@ -629,8 +651,7 @@ class AddOutputVariable(NotCacheable, Module):
     _output_ports = [('idf', basic.String)]
 
     def compute(self):
-        from eppy.modeleditor import IDF, IDDAlreadySetError
-        from StringIO import StringIO
+        import iddregistry
 
         idf_as_string = self.getInputFromPort('idf')
         key = self.getInputFromPort('key')
@@ -638,12 +659,7 @@ class AddOutputVariable(NotCacheable, Module):
         frequency = self.getInputFromPort('frequency')
         idd_path = self.getInputFromPort('idd_path')
 
-        try:
-            IDF.setiddname(idd_path.name)
-        except IDDAlreadySetError:
-            pass
-
-        idf = IDF(StringIO(idf_as_string))
+        idf = iddregistry.read_idf(idf_as_string, idd_path.name)
 
         output_variable = idf.newidfobject('OUTPUT:VARIABLE')
         output_variable.Key_Value = key
@@ -710,13 +726,35 @@ class CitySimToEnergyPlus(NotCacheable, Module):
     Uses the CitySim building id to find the building to
     extract and uses a template for the single zone HVAC
     system added. The script adds the materials and
-    constructions and surfaces to the template."""
+    constructions and surfaces to the template.
+
+    The other buildings are exported as shading, unless they are further
+    away than max_distance (in m), subtend less than min_solid_angle (in
+    sr) or their height divided by their distance is less than
+    min_height_ratio (see citysimtoenergyplus.select_neighbours). The
+    buildings further away than near_distance are exported as the convex
+    hull of their footprint, beyond far_distance as a box (see lod.py)."""
     _input_ports = [IPort(name='citysim',
                           signature=signature('CitySimXml')),
                     IPort(name='building',
                           signature='basic:String'),
                     IPort(name='template',
-                          signature=signature('Idf'))]
+                          signature=signature('Idf')),
+                    IPort(name='max_distance',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='min_solid_angle',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='min_height_ratio',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='near_distance',
+                          signature='basic:Float',
+                          optional=True),
+                    IPort(name='far_distance',
+                          signature='basic:Float',
+                          optional=True)]
     _output_ports = [OPort(name='idf',
                            signature=signature('Idf'))]
 
@@ -727,7 +765,12 @@ class CitySimToEnergyPlus(NotCacheable, Module):
         building = self.get_input('building')
         template = self.get_input('template')
         idf = citysimtoenergyplus.extractidf(
-            citysim=citysim, building=building, template=template)
+            citysim=citysim, building=building, template=template,
+            max_distance=self.force_get_input('max_distance', None),
+            min_solid_angle=self.force_get_input('min_solid_angle', None),
+            min_height_ratio=self.force_get_input('min_height_ratio', None),
+            near_distance=self.force_get_input('near_distance', None),
+            far_distance=self.force_get_input('far_distance', None))
         self.set_output('idf', idf)
 
 
@@ -782,10 +825,11 @@ class WriteIdf(NotCacheable, Module):
     _output_ports = [OPort(name='idf', signature=signature('Idf'))]
 
     def compute(self):
+        import idfwriter
         idf = self.get_input('idf')
         fpath = self.get_input('file').name
         with open(fpath, 'w') as out:
-            out.write(idf.idfstr())
+            idfwriter.write_idf(idf, out)
         self.set_output('idf', idf)
 
 
@@ -839,13 +883,10 @@ class MergeIdf(NotCacheable, Module):
     _output_ports = [OPort(name='idf', signature=signature('Idf'))]
 
     def compute(self):
+        import idfindex
         left = self.get_input('left')
         right = self.get_input('right')
-        for obj_type in right.idfobjects.keys():
-            for obj in right.idfobjects[obj_type]:
-                if left.getobject(obj_type, obj.Name):
-                    left.removeidfobject(left.getobject(obj_type, obj.Name))
-                left.copyidfobject(obj)
+        idfindex.mergeidf(left, right)
         self.set_output('idf', left)
 
 
@@ -857,12 +898,13 @@ class RemoveIdfObject(NotCacheable, Module):
     _output_ports = [OPort(name='idf', signature=signature('Idf'))]
 
     def compute(self):
+        import idfindex
         idf = self.get_input('idf')
         type_name = self.get_input('type_name')
         name = self.get_input('name')
-        obj = idf.getobject(type_name, name)
+        obj = idfindex.getobject(idf, type_name, name)
         if obj:
-            idf.removeidfobject(obj)
+            idfindex.removeidfobject(idf, obj)
         self.set_output('idf', idf)
 
 
@@ -878,16 +920,13 @@ class RemoveIdfObjectList(NotCacheable, Module):
 
     def compute(self):
         import csv
+        import idfindex
 
         idf = self.get_input('idf')
         csv_path = self.get_input('csv_path').name
 
         with open(csv_path, 'r') as f:
-            csv_reader = csv.reader(f)
-            for key, name in csv_reader:
-                obj = idf.getobject(key, name)
-                if obj:
-                    idf.removeidfobject(obj)
+            idfindex.removeidfobjects(idf, csv.reader(f))
         self.set_output('idf', idf)
 
 
@@ -934,26 +973,64 @@ class RelativePath(NotCacheable, Module):
 
 class SimplifyShading(NotCacheable, Module):
     """Simplify shading surfaces in the EnergyPlus model
-    by joining rectangular adjacent, coplanar surfaces"""
+    by joining rectangular adjacent, coplanar surfaces.
+
+    mode is either 'stacks' (merge rectangles stacked on top of each
+    other) or 'coplanar' (merge any surfaces in the same plane that share
+    edges into convex surfaces). tolerance is the distance (in metres)
+    below which vertices are considered the same.
+
+    with cache set, the simplified shading is kept on disk and reused for
+    the same shading geometry (see geometrycache.py)."""
     _input_ports = [IPort(name='idf',
-                          signature=signature('Idf'))]
+                          signature=signature('Idf')),
+                    IPort(name='mode',
+                          signature='basic:String',
+                          optional=True,
+                          default='stacks'),
+                    IPort(name='tolerance',
+                          signature='basic:Float',
+                          optional=True,
+                          default=0.01),
+                    IPort(name='cache',
+                          signature='basic:Boolean',
+                          optional=True,
+                          default=False)]
     _output_ports = [OPort(name='idf',
                            signature=signature('Idf'))]
 
     def compute(self):
+        import geometrycache
         import shading
         reload(shading)
         idf = self.get_input('idf')
-        idf = shading.simplify(idf)
+        cache_folder = None
+        if self.get_input('cache'):
+            cache_folder = geometrycache.CACHE_FOLDER
+        idf = shading.simplify(idf,
+                               mode=self.get_input('mode'),
+                               tolerance=self.get_input('tolerance'),
+                               cache_folder=cache_folder)
         self.set_output('idf', idf)
 
 
 class SimplifyCitySimGeometry(NotCacheable, Module):
     """Simplify CitySimXml geometry by joining rectangular adjacent,
     coplanar surfaces that have the same construction and belong to
-    the same Zone in the same Building."""
+    the same Zone in the same Building.
+
+    see SimplifyShading for mode and tolerance, in the 'coplanar' mode
+    roofs are merged too."""
     _input_ports = [IPort(name='citysim_xml',
-                          signature=signature('CitySimXml'))]
+                          signature=signature('CitySimXml')),
+                    IPort(name='mode',
+                          signature='basic:String',
+                          optional=True,
+                          default='stacks'),
+                    IPort(name='tolerance',
+                          signature='basic:Float',
+                          optional=True,
+                          default=0.01)]
     _output_ports = [OPort(name='citysim_xml',
                            signature=signature('CitySimXml'))]
 
@@ -961,10 +1038,67 @@ class SimplifyCitySimGeometry(NotCacheable, Module):
         import simplifycitysimgeometry
         reload(simplifycitysimgeometry)
         citysim_xml = self.get_input('citysim_xml')
-        citysim_xml = simplifycitysimgeometry.simplify(citysim_xml)
+        citysim_xml = simplifycitysimgeometry.simplify(
+            citysim_xml,
+            mode=self.get_input('mode'),
+            tolerance=self.get_input('tolerance'))
         self.set_output('citysim_xml', citysim_xml)
 
 
+class CheckIdfGeometry(NotCacheable, Module):
+    """Check the surfaces (building surfaces, windows and shading) of the
+    EnergyPlus model for degenerate, non-planar, self-intersecting and
+    wrongly wound polygons and duplicate or collinear vertices (see
+    geometrycheck.py).
+
+    with repair set, the problems are repaired where possible and the
+    surfaces that can't be repaired are removed. report lists the problems
+    found."""
+    _input_ports = [IPort(name='idf',
+                          signature=signature('Idf')),
+                    IPort(name='repair',
+                          signature='basic:Boolean',
+                          optional=True,
+                          default=False)]
+    _output_ports = [OPort(name='idf',
+                           signature=signature('Idf')),
+                     OPort(name='report',
+                           signature='basic:String')]
+
+    def compute(self):
+        import geometrycheck
+        reload(geometrycheck)
+        idf = self.get_input('idf')
+        report = geometrycheck.check_idf(idf,
+                                         repair=self.get_input('repair'))
+        self.set_output('idf', idf)
+        self.set_output('report', str(report))
+
+
+class CheckCitySimGeometry(NotCacheable, Module):
+    """Check the walls, roofs and floors of the CitySim scene, see
+    CheckIdfGeometry."""
+    _input_ports = [IPort(name='citysim_xml',
+                          signature=signature('CitySimXml')),
+                    IPort(name='repair',
+                          signature='basic:Boolean',
+                          optional=True,
+                          default=False)]
+    _output_ports = [OPort(name='citysim_xml',
+                           signature=signature('CitySimXml')),
+                     OPort(name='report',
+                           signature='basic:String')]
+
+    def compute(self):
+        import geometrycheck
+        reload(geometrycheck)
+        citysim_xml = self.get_input('citysim_xml')
+        report = geometrycheck.check_citysim(
+            citysim_xml, repair=self.get_input('repair'))
+        self.set_output('citysim_xml', citysim_xml)
+        self.set_output('report', str(report))
+
+
 def find_idd():
     """find the default IDD file."""
     try:
@@ -979,6 +1113,22 @@ def find_idd():
         raise Exception('Could not find default Energy+.idd')
 
 
+def find_model_idd(idf_text):
+    """find the IDD file to use for the contents of an IDF file: an IDD
+    file already loaded for the same EnergyPlus version or else the
+    default IDD file."""
+    import iddregistry
+    version = iddregistry.model_version(idf_text)
+    return iddregistry.find_idd(version) or find_idd()
+
+
+def idd_of(idf):
+    """return the path of the IDD file the eppy IDF object was read with,
+    falling back to the default IDD file."""
+    import iddregistry
+    return iddregistry.idd_path_of(idf) or find_idd()
+
+
 def find_energyplus():
     """find the default EnergyPlus executable"""
     import distutils.spawn
@@ -1023,6 +1173,8 @@ _modules = [
     AddOutputVariable,
     AddOutputVariableList,
     CastToCitySimXml,
+    CheckCitySimGeometry,
+    CheckIdfGeometry,
     CitySimToEnergyPlus,
     CitySimXml,
     EnergyPlusToFmu,
@@ -0,0 +1,142 @@
+'''
+lod.py
+
+Level of detail (LOD) envelopes for the buildings exported as shading.
+
+Far away buildings don't need every wall and roof to shade the simulated
+(target) building. Each shading building gets a level:
+
+    DETAILED: all its surfaces (level 0)
+    HULL: a prism over the convex hull of its footprint (level 1)
+    SECTORS: a prism with one wall per orientation sector (level 2), e.g.
+        a box aligned with the axes for 4 sectors
+
+`level` chooses the level from the distance to the target building. The
+distances are scaled by the height of the shading building relative to the
+target building, so tall buildings keep their detail further away.
+`envelope` returns the walls, roof and floor of the simplified building.
+Polygons are lists of (x, y, z) tuples, counterclockwise seen from outside.
+
+This module is plain Python (no numpy), so revittocitysim.py can use it in
+IronPython.
+'''
+import math
+
+DETAILED = 0
+HULL = 1
+SECTORS = 2
+# the number of orientation sectors of the SECTORS level
+SECTOR_COUNT = 4
+
+
+def level(distance, height, target_height, near_distance=None,
+          far_distance=None):
+    '''return the level of detail of a shading building `distance` away
+    from the target building. the building is DETAILED up to
+    near_distance, HULL up to far_distance and SECTORS beyond, with both
+    distances scaled by height / target_height. None disables a level.'''
+    scale = 1.0
+    if target_height > 0 and height > 0:
+        scale = float(height) / target_height
+    if far_distance is not None and distance > far_distance * scale:
+        return SECTORS
+    if near_distance is not None and distance > near_distance * scale:
+        return HULL
+    return DETAILED
+
+
+def bounds(points):
+    '''return (lower, upper), the corners of the bounding box of the
+    points as (x, y, z) tuples'''
+    points = list(points)
+    return (tuple(min(p[i] for p in points) for i in range(3)),
+            tuple(max(p[i] for p in points) for i in range(3)))
+
+
+def distance(a, b):
+    '''return the horizontal distance between the bounding boxes a and b
+    (as returned by bounds), 0 if they overlap'''
+    gaps = [max(a[0][i] - b[1][i], b[0][i] - a[1][i], 0) for i in range(2)]
+    return math.sqrt(gaps[0] ** 2 + gaps[1] ** 2)
+
+
+def envelope(points, level, sector_count=SECTOR_COUNT):
+    '''return (walls, roof, floor) of the envelope of the points (all the
+    vertices of a building) at the level (HULL or SECTORS): a prism over
+    the footprint from the lowest to the highest point.'''
+    points = list(points)
+    if level == SECTORS:
+        footprint = sector_footprint(points, sector_count)
+    else:
+        footprint = convex_hull(points)
+    lower, upper = bounds(points)
+    return prism(footprint, lower[2], upper[2])
+
+
+def convex_hull(points):
+    '''return the convex hull of the points in the x, y plane as a
+    counterclockwise list of (x, y) (monotone chain).'''
+    points = sorted(set((float(p[0]), float(p[1])) for p in points))
+    if len(points) < 3:
+        return points
+
+    def turn(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    def half(points):
+        chain = []
+        for p in points:
+            while len(chain) >= 2 and turn(chain[-2], chain[-1], p) <= 0:
+                chain.pop()
+            chain.append(p)
+        return chain[:-1]
+    return half(points) + half(reversed(points))
+
+
+def sector_footprint(points, sector_count=SECTOR_COUNT):
+    '''return the smallest polygon around the points in the x, y plane
+    with its edges facing sector_count directions evenly spread around the
+    circle (starting with -y), as a counterclockwise list of (x, y). edges
+    of length 0 are left out.'''
+    points = [(float(p[0]), float(p[1])) for p in points]
+    angles = [2 * math.pi * k / sector_count - math.pi / 2
+              for k in range(sector_count)]
+    normals = [(math.cos(a), math.sin(a)) for a in angles]
+    offsets = [max(n[0] * p[0] + n[1] * p[1] for p in points)
+               for n in normals]
+    footprint = []
+    for k in range(sector_count):
+        # the corner between the edges k and k + 1
+        (a, b), c = normals[k], offsets[k]
+        (d, e), f = normals[(k + 1) % sector_count], offsets[
+            (k + 1) % sector_count]
+        det = a * e - b * d
+        corner = ((c * e - b * f) / det, (a * f - c * d) / det)
+        if not footprint or not close(corner, footprint[-1]):
+            footprint.append(corner)
+    if len(footprint) > 1 and close(footprint[0], footprint[-1]):
+        footprint.pop()
+    return footprint
+
+
+def close(a, b, tolerance=1e-9):
+    return abs(a[0] - b[0]) <= tolerance and abs(a[1] - b[1]) <= tolerance
+
+
+def prism(footprint, bottom, top):
+    '''return (walls, roof, floor) of the prism over the counterclockwise
+    footprint from z=bottom to z=top.'''
+    walls = []
+    for i in range(len(footprint)):
+        (x0, y0), (x1, y1) = footprint[i], footprint[(i + 1) % len(footprint)]
+        walls.append([(x1, y1, top), (x0, y0, top), (x0, y0, bottom),
+                      (x1, y1, bottom)])
+    roof = [(x, y, top) for x, y in footprint]
+    floor = [(x, y, bottom) for x, y in reversed(footprint)]
+    return walls, roof, floor
+
+
+def area(footprint):
+    '''return the area of the footprint, a list of (x, y)'''
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1)
+                   in zip(footprint, footprint[1:] + footprint[:1]))) / 2.0
@@ -19,6 +19,8 @@ NOTES:
 '''
 import itertools
 from lxml import etree
+import idfindex
+import shadingstore
 
 
 def map_ep_geom(citysim, idf):
@@ -49,10 +51,10 @@ def find_surface(surface, idf):
     Floors - the same as the surface tag! and also the  ShadingSurfaces...
     '''
     ep_id = surface.tag + surface.get('id')
-    obj = (idf.getobject('BUILDINGSURFACE:DETAILED', ep_id)
-           or idf.getobject('WALL:DETAILED', ep_id)
-           or idf.getobject('ROOFCEILING:DETAILED', ep_id)
-           or idf.getobject('FLOOR:DETAILED', ep_id))
+    obj = (idfindex.getobject(idf, 'BUILDINGSURFACE:DETAILED', ep_id)
+           or idfindex.getobject(idf, 'WALL:DETAILED', ep_id)
+           or idfindex.getobject(idf, 'ROOFCEILING:DETAILED', ep_id)
+           or idfindex.getobject(idf, 'FLOOR:DETAILED', ep_id))
     if obj:
         return obj
     else:
@@ -60,7 +62,7 @@ def find_surface(surface, idf):
         shading_id = 'ShadingB%sW%s' % (
             surface.getparent().getparent().get('id'),
             surface.get('id'))
-        return idf.getobject('SHADING:BUILDING:DETAILED', shading_id)
+        return shadingstore.find_shading(idf, shading_id)
 
 
 def update_vertices(surface_xml, obj):
@@ -68,10 +70,7 @@ def update_vertices(surface_xml, obj):
     remove the CitySim vertices and replace them with those
     from the IDF object!
     '''
-    obj_vertex_data = obj.obj[obj.objls.index('Number_of_Vertices')+1:]
-    obj_vertices = zip(obj_vertex_data[0::3],
-                       obj_vertex_data[1::3],
-                       obj_vertex_data[2::3])
+    obj_vertices = shadingstore.vertices(obj)
     # delete old vertices
     for v in surface_xml.getchildren():
         if v.tag.startswith('V'):
@@ -8,6 +8,7 @@ A bunch of functions I found here:
 
 for finding the area of a 3d polygon.
 '''
+import collections
 import numpy as np
 
 
@@ -23,17 +24,7 @@ def det(a):
 
 # unit normal vector of plane defined by points a, b, and c
 def unit_normal(a, b, c):
-    x = det([[1, a[1], a[2]],
-             [1, b[1], b[2]],
-             [1, c[1], c[2]]])
-    y = det([[a[0], 1, a[2]],
-             [b[0], 1, b[2]],
-             [c[0], 1, c[2]]])
-    z = det([[a[0], a[1], 1],
-             [b[0], b[1], 1],
-             [c[0], c[1], 1]])
-    magnitude = (x ** 2 + y ** 2 + z ** 2) ** .5
-    return (x / magnitude, y / magnitude, z / magnitude)
+    return np_unit_normal(a, b, c)
 
 
 # dot product of vectors a and b
@@ -55,83 +46,222 @@ def cross(a, b):
 
 # area of polygon poly
 def area(poly):
-    if len(poly) < 3:  # not a plane - no area
-        return 0.0
-
-    total = [0.0, 0.0, 0.0]
-    for i in range(len(poly)):
-        vi1 = poly[i]
-        if i == len(poly) - 1:
-            vi2 = poly[0]
-        else:
-            vi2 = poly[i + 1]
-        prod = cross(vi1, vi2)
-        total[0] += prod[0]
-        total[1] += prod[1]
-        total[2] += prod[2]
-    result = dot(total, unit_normal(poly[0], poly[1], poly[2]))
-    return abs(result / 2.0)
+    return np_poly_area(poly)
 
 
 # here are some numpy equivalents:
 def np_poly_area(poly):
     '''area of polygon, poly, copied from here:
     http://oco-carbon.com/coding/python-and-energyplus-polygon-areas-in-3d-space
+    (now a wrapper for batch_areas)
     '''
-    if len(poly) < 3:  # not a polygon - no area
-        return 0
-    total = [0, 0, 0]
-    N = len(poly)
-    for i in range(N):
-        vi1 = poly[i]
-        vi2 = poly[(i+1) % N]
-        prod = np.cross(vi1, vi2)
-        total[0] += prod[0]
-        total[1] += prod[1]
-        total[2] += prod[2]
-    result = np.dot(total, np_unit_normal(poly[0], poly[1], poly[2]))
-    return abs(result/2)
+    return batch_areas(*pack([poly]))[0]
 
 
 # unit normal vector of plane defined by points a, b, and c
 def np_unit_normal(a, b, c):
-    x = np.linalg.det([[1, a[1], a[2]],
-                       [1, b[1], b[2]],
-                       [1, c[1], c[2]]])
-    y = np.linalg.det([[a[0], 1, a[2]],
-                       [b[0], 1, b[2]],
-                       [c[0], 1, c[2]]])
-    z = np.linalg.det([[a[0], a[1], 1],
-                       [b[0], b[1], 1],
-                       [c[0], c[1], 1]])
-    magnitude = (x**2 + y**2 + z**2)**.5
-    return (x/magnitude, y/magnitude, z/magnitude)
+    return tuple(batch_unit_normals(*pack([(a, b, c)]))[0])
+
+
+# batch versions: the polygons are given as a flat (n, 3) array of all the
+# vertices and an array of offsets: polygon i is vertices[offsets[i]:
+# offsets[i + 1]]. Use pack to create these from a list of polygons.
+PolygonProperties = collections.namedtuple(
+    'PolygonProperties', ['area', 'normal', 'centroid', 'tilt', 'azimuth'])
+
+
+def pack(polygons):
+    '''return (vertices, offsets) for a list of polygons, each a sequence
+    of (x, y, z)'''
+    counts = [len(polygon) for polygon in polygons]
+    offsets = np.zeros(len(counts) + 1, dtype=int)
+    np.cumsum(counts, out=offsets[1:])
+    vertices = np.array([v for polygon in polygons for v in polygon],
+                        dtype=float).reshape(-1, 3)
+    return vertices, offsets
+
+
+def unpack(vertices, offsets):
+    '''return the list of polygons (each an (n, 3) array)'''
+    return [vertices[start:end] for start, end in zip(offsets[:-1],
+                                                      offsets[1:])]
+
+
+def batch_unit_normals(vertices, offsets, last=False):
+    '''return the unit normals of the planes defined by the first three
+    vertices of each polygon as an (m, 3) array (nan for polygons with less
+    than three vertices or collinear points). with last=True, use the first,
+    second and last vertex instead (as eppy.geometry.surface does).'''
+    offsets = np.asarray(offsets)
+    counts = np.diff(offsets)
+    normals = np.empty((len(counts), 3))
+    normals.fill(np.nan)
+    ok = counts >= 3
+    a = offsets[:-1][ok]
+    b = a + 1
+    c = offsets[1:][ok] - 1 if last else a + 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = np.cross(vertices[b] - vertices[a], vertices[c] - vertices[a])
+        normals[ok] = n / np.sqrt((n * n).sum(axis=1))[:, np.newaxis]
+    return normals
+
+
+def batch_areas(vertices, offsets):
+    '''return the areas of the polygons (0 for polygons with less than three
+    vertices, nan if the first three vertices are collinear)'''
+    offsets = np.asarray(offsets)
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+    nonempty = counts > 0
+    # relative to the first vertex of each polygon, for precision with large
+    # (e.g. geo-referenced) coordinates
+    relative = vertices - vertices[np.repeat(starts, counts)]
+    following = np.arange(1, len(vertices) + 1)
+    following[offsets[1:][nonempty] - 1] = starts[nonempty]
+    products = np.cross(relative, relative[following % max(len(vertices), 1)])
+    totals = np.zeros((len(counts), 3))
+    if len(vertices):
+        totals[nonempty] = np.add.reduceat(products, starts[nonempty])
+    with np.errstate(invalid='ignore'):
+        areas = abs((totals * batch_unit_normals(vertices, offsets)).sum(
+            axis=1)) / 2
+    areas[counts < 3] = 0.0
+    return areas
+
+
+def batch_centroids(vertices, offsets):
+    '''return the centroids of the polygons (the average of the vertices)
+    as an (m, 3) array'''
+    offsets = np.asarray(offsets)
+    counts = np.diff(offsets)
+    nonempty = counts > 0
+    centroids = np.empty((len(counts), 3))
+    centroids.fill(np.nan)
+    if len(vertices):
+        centroids[nonempty] = (np.add.reduceat(vertices,
+                                               offsets[:-1][nonempty])
+                               / counts[nonempty][:, np.newaxis])
+    return centroids
+
+
+def batch_area_centroids(vertices, offsets):
+    '''return the area centroids of the (planar) polygons as an (m, 3)
+    array (the average of the vertices for polygons without an area)'''
+    offsets = np.asarray(offsets)
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+    nonempty = counts > 0
+    centroids = batch_centroids(vertices, offsets)
+    if not len(vertices):
+        return centroids
+    first = vertices[np.repeat(starts, counts)]
+    relative = vertices - first
+    following = np.arange(1, len(vertices) + 1)
+    following[offsets[1:][nonempty] - 1] = starts[nonempty]
+    following = relative[following]
+    # the triangles (first, vertex, following vertex), weighted by their
+    # area along the normal of the polygon (Newell's method)
+    products = np.cross(relative, following)
+    totals = np.zeros((len(counts), 3))
+    totals[nonempty] = np.add.reduceat(products, starts[nonempty])
+    weights = (products * np.repeat(totals, counts, axis=0)).sum(axis=1)
+    moments = np.zeros((len(counts), 3))
+    moments[nonempty] = np.add.reduceat(
+        (relative + following) / 3 * weights[:, np.newaxis],
+        starts[nonempty])
+    sums = np.zeros(len(counts))
+    sums[nonempty] = np.add.reduceat(weights, starts[nonempty])
+    ok = sums > 0
+    centroids[ok] = (vertices[starts[ok]]
+                     + moments[ok] / sums[ok][:, np.newaxis])
+    return centroids
+
+
+def batch_tilts_azimuths(vertices, offsets):
+    '''return the tilt and azimuth (in degrees) of the polygons, as
+    calculated by eppy.geometry.surface.tilt and azimuth'''
+    normals = batch_unit_normals(vertices, offsets, last=True)
+    with np.errstate(invalid='ignore'):
+        # eppy uses a zero normal for degenerate polygons
+        small = ~(np.sqrt((normals * normals).sum(axis=1)) >= 0.00000001)
+        normals[small] = 0.0
+        tilts = np.degrees(np.arccos(np.clip(normals[:, 2], -1.0, 1.0)))
+        tilts[small] = 0.0
+        horizontal = np.sqrt(normals[:, 0] ** 2 + normals[:, 1] ** 2)
+        cos_azimuth = np.where(horizontal > 0,
+                               normals[:, 1] / np.where(horizontal > 0,
+                                                        horizontal, 1), 1.0)
+        azimuths = np.degrees(np.arccos(np.clip(cos_azimuth, -1.0, 1.0)))
+    azimuths = np.where(normals[:, 0] < 0, 360 - azimuths, azimuths)
+    return tilts, azimuths
+
+
+def batch_properties(vertices, offsets):
+    '''return the PolygonProperties (area, normal, centroid, tilt,
+    azimuth) of all the polygons, each an array with one entry per polygon'''
+    tilts, azimuths = batch_tilts_azimuths(vertices, offsets)
+    return PolygonProperties(area=batch_areas(vertices, offsets),
+                             normal=batch_unit_normals(vertices, offsets),
+                             centroid=batch_centroids(vertices, offsets),
+                             tilt=tilts,
+                             azimuth=azimuths)
+
+
+def batch_vertices_by_area_ratio(vertices, offsets, ratios):
+    '''return the vertices of the polygons scaled about their area
+    centroids (see batch_area_centroids) so that the area of polygon i is
+    ratios[i] times the original area (the linear scale factor is
+    sqrt(ratio)). ratios may also be a single number. the offsets of the
+    result are the same as the input. the result stays inside convex
+    polygons only (see coplanar.split for concave ones).'''
+    offsets = np.asarray(offsets)
+    counts = np.diff(offsets)
+    factors = np.sqrt(np.asarray(ratios, dtype=float) * np.ones(len(counts)))
+    centroids = np.repeat(batch_area_centroids(vertices, offsets), counts,
+                          axis=0)
+    factors = np.repeat(factors, counts)[:, np.newaxis]
+    return centroids + factors * (vertices - centroids)
+
+
+def drop_collinear(polygon, tolerance=1e-9):
+    '''return the polygon (an (n, 3) array) without the vertices that lie
+    on the line between their neighbours'''
+    polygon = np.asarray(polygon, dtype=float)
+    keep = list(range(len(polygon)))
+    changed = True
+    while changed and len(keep) > 3:
+        changed = False
+        for i in range(len(keep)):
+            a = polygon[keep[i - 1]]
+            b = polygon[keep[i]]
+            c = polygon[keep[(i + 1) % len(keep)]]
+            n = np.cross(b - a, c - b)
+            scale = np.sqrt((b - a).dot(b - a) * (c - b).dot(c - b))
+            if np.sqrt(n.dot(n)) <= tolerance * max(scale, tolerance):
+                del keep[i]
+                changed = True
+                break
+    return polygon[keep]
+
+
+def fan_indices(count, max_vertices=4):
+    '''split a convex polygon with `count` vertices into polygons with at
+    most `max_vertices` vertices, fanning out from the first vertex.
+    returns a list of tuples of vertex indices.'''
+    if count <= max_vertices:
+        return [tuple(range(count))]
+    parts = []
+    start = 1
+    while start < count - 1:
+        end = min(start + max_vertices - 2, count - 1)
+        parts.append((0,) + tuple(range(start, end + 1)))
+        start = end
+    return parts
 
 
 def get_vertices_by_area_ratio(original_vertices, ratio, epsilon=0.001):
     '''return a new set of vertices with a given area ratio to the original
-    polygon'''
-    new_vertices = [p.copy() for p in original_vertices]
-    pm = sum(original_vertices) / len(original_vertices)
-    step = 0.5  # valid steps: 0..1
-
-    def calc_ratio(new_poly, old_poly):
-        return np_poly_area(new_poly) / np_poly_area(old_poly)
-
-    def do_step(poly, pm, step):
-        return [p + step*(pm-p) for p in poly]
-
-    loop_count = 0
-    max_loop_count = 1000
-    while True:
-        new_vertices = do_step(original_vertices, pm, step)
-        current_ratio = calc_ratio(new_vertices, original_vertices)
-        if abs(current_ratio - ratio) < epsilon:
-            return new_vertices
-        if loop_count > max_loop_count:
-            return None  # didn't converge?
-        if current_ratio > ratio:
-            step += step/2  # decrease polygon area
-        else:
-            step -= step/2  # increase polygon area
-        loop_count += 1
+    polygon (scaled about its area centroid). epsilon is not used
+    anymore, the result is exact.'''
+    vertices, offsets = pack([original_vertices])
+    return list(batch_vertices_by_area_ratio(vertices, offsets, ratio))
@@ -99,13 +99,17 @@ class RevitToCitySimEventHandler(IExternalEventHandler):
     def get_revittocitysim(self, args, request, uiApplication):
         '''
         returns an xml serialization of the ModelSnapshot object
-        corresponding to the active document.
+        corresponding to the active document. the args can set the
+        distances of the shading buildings and the far field obstructions,
+        e.g. /revittocitysim/near_distance=50/horizon_distance=500
+        (see revittocitysim.export_options).
         '''
         content_type = 'application/xml'
         try:
             snapshot = self.take_snapshot(uiApplication)
             reload(revittocitysim)
-            xml = revittocitysim.build_citysim_xml(snapshot)
+            xml = revittocitysim.build_citysim_xml(
+                snapshot, **revittocitysim.export_options(args))
             return (200, content_type, xml)
         except:
             return (404, 'text/plain',
@@ -0,0 +1,383 @@
+'''
+raycast.py
+
+Find the first polygon hit by each of a large number of rays.
+
+removeshading.py needs to know which surface a ray from every building
+surface to every shading surface hits first. Testing each ray against each
+polygon is O(rays * polygons) Python calls. A Scene instead splits the
+(convex) polygons into triangles and puts them in a bounding volume
+hierarchy (BVH). Rays are traced in packets: each node of the BVH is
+tested against all the rays of the packet that reach it at once, and the
+triangles in the leaves are intersected with those rays in one vectorised
+Moller-Trumbore test:
+
+    scene = raycast.Scene(polygon_list)
+    hits, ts = scene.first_hits(origins, directions, exclude)
+
+`hits[i]` is the index of the first polygon hit by ray i (or -1) and
+`ts[i]` the distance along the ray in units of directions[i].
+
+`hits_between` traces the rays between grids of sample points on the
+polygons (see `sample_points`) and can spread the work over a pool of
+processes. Each worker gets a copy of the scene once, when it starts.
+
+`candidate_pairs` finds the (source, target) pairs of polygons that can
+see each other at all, from their planes and bounds only, so that the rays
+of the other pairs aren't traced.
+'''
+import multiprocessing
+import numpy as np
+import geometrymemo
+import polygons
+
+# the maximum number of triangles in a leaf of the BVH
+LEAF_SIZE = 8
+# the number of rays traced together, limits the memory used
+PACKET_SIZE = 1 << 16
+# tolerance for hits on the edges of triangles (barycentric coordinates)
+EDGE_TOLERANCE = 1e-9
+# rays (nearly) parallel to a triangle don't hit it (the cosine of the
+# angle between the ray and the normal of the triangle)
+PARALLEL_TOLERANCE = 1e-12
+# polygons closer than this (in m) to the plane of another polygon are
+# behind it (see candidate_pairs)
+CULL_TOLERANCE = 1e-6
+# the number of (plane, vertex) distances computed together
+BLOCK_SIZE = 1 << 20
+# the scene and targets of a worker process (see hits_between)
+_worker = {}
+
+
+def triangulate(polygon_list):
+    '''return (v0, v1, v2, owners): the corners of the triangles of the
+    convex polygons in polygon_list as (n, 3) arrays (fanned from the first
+    vertex of each polygon) and the index of the polygon of each
+    triangle.'''
+    v0, v1, v2, owners = [], [], [], []
+    for i, polygon in enumerate(polygon_list):
+        polygon = np.asarray(polygon, dtype=float).reshape(-1, 3)
+        for k in range(1, len(polygon) - 1):
+            v0.append(polygon[0])
+            v1.append(polygon[k])
+            v2.append(polygon[k + 1])
+            owners.append(i)
+    if not owners:
+        empty = np.zeros((0, 3))
+        return empty, empty, empty, np.zeros(0, dtype=int)
+    return np.array(v0), np.array(v1), np.array(v2), np.array(owners)
+
+
+class Scene(object):
+    '''the triangles of a list of convex polygons in a BVH'''
+
+    def __init__(self, polygon_list, leaf_size=LEAF_SIZE):
+        v0, v1, v2, owners = triangulate(polygon_list)
+        self.leaf_size = leaf_size
+        self.order = np.arange(len(owners))
+        # the nodes of the BVH: bounding boxes, children (-1 for leaves)
+        # and the range of self.order covered by the node
+        self.lower = []
+        self.upper = []
+        self.children = []
+        self.ranges = []
+        corners = np.concatenate([v0[:, np.newaxis], v1[:, np.newaxis],
+                                  v2[:, np.newaxis]], axis=1)
+        if len(owners):
+            self.build(corners, corners.mean(axis=1), 0, len(owners))
+        self.lower = np.array(self.lower).reshape(-1, 3)
+        self.upper = np.array(self.upper).reshape(-1, 3)
+        # the triangles, in the order of the leaves
+        self.v0 = v0[self.order]
+        self.e1 = (v1 - v0)[self.order]
+        self.e2 = (v2 - v0)[self.order]
+        self.owners = owners[self.order]
+        normals = np.cross(self.e1, self.e2)
+        self.normal_lengths = np.sqrt((normals * normals).sum(axis=1))
+
+    def build(self, corners, centroids, start, end):
+        '''add the node for the triangles self.order[start:end], splitting
+        them at the median along the longest axis of their centroids.
+        returns the index of the node.'''
+        triangles = self.order[start:end]
+        node = len(self.children)
+        box = corners[triangles].reshape(-1, 3)
+        # a little bigger, for rounding errors and flat boxes
+        padding = 1e-7 * (1 + np.abs(box).max())
+        self.lower.append(box.min(axis=0) - padding)
+        self.upper.append(box.max(axis=0) + padding)
+        self.ranges.append((start, end))
+        self.children.append(None)
+        if end - start <= self.leaf_size:
+            return node
+        extent = centroids[triangles].max(axis=0) - centroids[
+            triangles].min(axis=0)
+        axis = int(np.argmax(extent))
+        middle = (end - start) // 2
+        split = np.argpartition(centroids[triangles, axis], middle)
+        self.order[start:end] = triangles[split]
+        left = self.build(corners, centroids, start, start + middle)
+        right = self.build(corners, centroids, start + middle, end)
+        self.children[node] = (left, right)
+        return node
+
+    def first_hits(self, origins, directions, exclude=None):
+        '''return (hits, ts) for the rays: the index of the first polygon
+        hit by each ray (-1 for none) and the distance along the ray
+        (in units of the direction). rays don't hit the polygon
+        exclude[i] (e.g. the polygon they start on).'''
+        origins = np.asarray(origins, dtype=float).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        if exclude is None:
+            exclude = -np.ones(len(origins), dtype=int)
+        exclude = np.asarray(exclude)
+        hits = -np.ones(len(origins), dtype=int)
+        ts = np.empty(len(origins))
+        ts.fill(np.inf)
+        for start in range(0, len(origins), PACKET_SIZE):
+            packet = slice(start, start + PACKET_SIZE)
+            hits[packet], ts[packet] = self.trace(
+                origins[packet], directions[packet], exclude[packet])
+        return hits, ts
+
+    def trace(self, origins, directions, exclude):
+        '''first_hits for a single packet of rays'''
+        best = np.empty(len(origins))
+        best.fill(np.inf)
+        hits = -np.ones(len(origins), dtype=int)
+        if not len(self.children) or not len(origins):
+            return hits, best
+        with np.errstate(divide='ignore'):
+            inverse = 1.0 / directions
+        lengths = np.sqrt((directions * directions).sum(axis=1))
+        stack = [(0, np.arange(len(origins)))]
+        while stack:
+            node, rays = stack.pop()
+            rays = rays[self.enter(node, origins[rays], inverse[rays],
+                                   best[rays])]
+            if not len(rays):
+                continue
+            if self.children[node] is not None:
+                stack.extend((child, rays) for child in self.children[node])
+                continue
+            start, end = self.ranges[node]
+            t = self.intersect(origins[rays], directions[rays],
+                               lengths[rays], start, end)
+            t[self.owners[start:end][np.newaxis, :]
+              == exclude[rays][:, np.newaxis]] = np.inf
+            nearest = np.argmin(t, axis=1)
+            t = t[np.arange(len(rays)), nearest]
+            closer = t < best[rays]
+            best[rays[closer]] = t[closer]
+            hits[rays[closer]] = self.owners[start:end][nearest[closer]]
+        return hits, best
+
+    def enter(self, node, origins, inverse, best):
+        '''return a boolean array telling which of the rays enter the
+        bounding box of the node before `best`'''
+        with np.errstate(invalid='ignore'):
+            t1 = (self.lower[node] - origins) * inverse
+            t2 = (self.upper[node] - origins) * inverse
+        # nan (0 * inf) means the ray is parallel to that slab and starts
+        # on its boundary, fmin/fmax ignore these
+        near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+        far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+        return (far >= np.maximum(near, 0)) & (near <= best)
+
+    def intersect(self, origins, directions, lengths, start, end):
+        '''return the distances along the rays to the triangles start:end
+        as a (rays, triangles) array, inf where the ray misses'''
+        e1 = self.e1[start:end][np.newaxis]
+        e2 = self.e2[start:end][np.newaxis]
+        d = directions[:, np.newaxis]
+        p = np.cross(d, e2)
+        det = (e1 * p).sum(axis=2)
+        parallel = (np.abs(det) <= PARALLEL_TOLERANCE * lengths[:, np.newaxis]
+                    * self.normal_lengths[start:end][np.newaxis])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / det
+            s = origins[:, np.newaxis] - self.v0[start:end][np.newaxis]
+            u = (s * p).sum(axis=2) * inverse
+            q = np.cross(s, e1)
+            v = (d * q).sum(axis=2) * inverse
+            t = (e2 * q).sum(axis=2) * inverse
+            hit = (~parallel & (u >= -EDGE_TOLERANCE)
+                   & (v >= -EDGE_TOLERANCE)
+                   & (u + v <= 1 + EDGE_TOLERANCE) & (t >= 0))
+        return np.where(hit, t, np.inf)
+
+
+def sample_points(polygon, samples=1):
+    '''
+    return samples x samples points on the convex polygon as an (n, 3)
+    array. for samples=1, this is the middle of the polygon (the average of
+    the vertices). otherwise, quadrilaterals are sampled at the middle of
+    the cells of a samples x samples grid, other polygons at the middle of
+    the samples x samples sub-triangles of each triangle of the fan from
+    the first vertex.
+    '''
+    polygon = np.asarray(polygon, dtype=float).reshape(-1, 3)
+    if samples == 1:
+        return polygon.mean(axis=0)[np.newaxis]
+    steps = (np.arange(samples) + 0.5) / samples
+    if len(polygon) == 4:
+        s, t = [grid.reshape(-1, 1) for grid in np.meshgrid(steps, steps)]
+        p0, p1, p2, p3 = polygon
+        return ((1 - s) * (1 - t) * p0 + s * (1 - t) * p1 + s * t * p2
+                + (1 - s) * t * p3)
+    # barycentric coordinates of the middles of the sub-triangles
+    weights = [((i + 1 / 3.0) / samples, (j + 1 / 3.0) / samples)
+               for i in range(samples) for j in range(samples - i)]
+    weights += [((i + 2 / 3.0) / samples, (j + 2 / 3.0) / samples)
+                for i in range(samples) for j in range(samples - i - 1)]
+    weights = np.array(weights)
+    points = []
+    for k in range(1, len(polygon) - 1):
+        e1 = polygon[k] - polygon[0]
+        e2 = polygon[k + 1] - polygon[0]
+        points.append(polygon[0] + weights[:, :1] * e1 + weights[:, 1:] * e2)
+    return np.concatenate(points)
+
+
+def candidate_pairs(sources, targets, min_elevation=None, two_sided=False,
+                    tolerance=CULL_TOLERANCE):
+    '''
+    return an (m, k) boolean array telling which of the m source polygons
+    and k target polygons can see each other. the pairs that can't are
+    those where
+        - the target is behind the plane of the source (the normals of
+          polygons point to the side they are seen from, outwards for
+          building surfaces),
+        - the source is behind the plane of the target (they face away from
+          each other), unless two_sided is True (targets seen from both
+          sides, e.g. free-standing shading),
+        - with min_elevation (in degrees), the highest point of the target
+          is below that elevation angle seen from the lowest point of the
+          source, at the shortest horizontal distance between their
+          bounding circles.
+    polygons with less than three vertices or collinear first vertices are
+    never culled.
+    '''
+    source_vertices, source_offsets = polygons.pack(sources)
+    target_vertices, target_offsets = polygons.pack(targets)
+    source_normals = geometrymemo.properties(sources).normal
+    target_normals = geometrymemo.properties(targets).normal
+    with np.errstate(invalid='ignore'):
+        pairs = ~(plane_distances(source_normals, source_vertices[
+            source_offsets[:-1]], target_vertices, target_offsets)
+            <= tolerance)
+        if not two_sided:
+            pairs &= ~(plane_distances(target_normals, target_vertices[
+                target_offsets[:-1]], source_vertices, source_offsets).T
+                <= tolerance)
+    if min_elevation is not None:
+        source_bounds = horizontal_bounds(source_vertices, source_offsets)
+        target_bounds = horizontal_bounds(target_vertices, target_offsets)
+        centres = (source_bounds[0][:, np.newaxis]
+                   - target_bounds[0][np.newaxis])
+        distances = np.maximum(
+            np.sqrt((centres * centres).sum(axis=2))
+            - source_bounds[1][:, np.newaxis]
+            - target_bounds[1][np.newaxis], 0)
+        heights = (target_bounds[3][np.newaxis]
+                   - source_bounds[2][:, np.newaxis])
+        pairs &= np.degrees(np.arctan2(heights, distances)) >= min_elevation
+    return pairs
+
+
+def plane_distances(normals, points, vertices, offsets):
+    '''return an (m, k) array with the largest signed distance from each
+    of the m planes (unit normals and a point on each) to the vertices of
+    each of the k polygons'''
+    distances = np.empty((len(normals), len(offsets) - 1))
+    if not distances.size:
+        return distances
+    rows = max(1, BLOCK_SIZE // len(vertices))
+    for start in range(0, len(normals), rows):
+        block = slice(start, start + rows)
+        along = np.dot(normals[block], vertices.T) - (
+            normals[block] * points[block]).sum(axis=1)[:, np.newaxis]
+        distances[block] = np.maximum.reduceat(along, offsets[:-1], axis=1)
+    return distances
+
+
+def horizontal_bounds(vertices, offsets):
+    '''return (centres, radii, lowest, highest) of the polygons: the
+    centre (x, y) and radius of a horizontal circle around each polygon and
+    the lowest and highest z of its vertices'''
+    starts = offsets[:-1]
+    centres = polygons.batch_centroids(vertices, offsets)[:, :2]
+    away = vertices[:, :2] - np.repeat(centres, np.diff(offsets), axis=0)
+    radii = np.sqrt(np.maximum.reduceat((away * away).sum(axis=1), starts))
+    return (centres, radii, np.minimum.reduceat(vertices[:, 2], starts),
+            np.maximum.reduceat(vertices[:, 2], starts))
+
+
+def hits_between(scene, sources, targets, processes=1, pairs=None):
+    '''
+    return the set of the polygons of the scene hit first by the rays from
+    each point of each source to each point of each target. sources is a
+    list of (index of the source polygon in the scene, (n, 3) array of
+    points), the rays don't hit their source polygon. targets is a list of
+    (n, 3) arrays of points. pairs is an optional (sources, targets)
+    boolean array (see candidate_pairs), only the rays of the pairs that
+    are True are traced. with processes > 1, the sources are split between
+    a pool of that many processes.
+    '''
+    if not sources or not targets:
+        return set()
+    target_points = np.concatenate(targets)
+    target_owners = np.repeat(np.arange(len(targets)),
+                              [len(points) for points in targets])
+    tasks = [(index, points, None if pairs is None else pairs[i])
+             for i, (index, points) in enumerate(sources)]
+    if processes <= 1:
+        return trace_sources(scene, tasks, target_points, target_owners)
+    size = max(1, len(tasks) // (4 * processes))
+    chunks = [tasks[i:i + size] for i in range(0, len(tasks), size)]
+    pool = multiprocessing.Pool(processes, initializer=_start_worker,
+                                initargs=(scene, target_points,
+                                          target_owners))
+    try:
+        hit = set()
+        for chunk_hit in pool.imap_unordered(_trace_in_worker, chunks):
+            hit.update(chunk_hit)
+    finally:
+        pool.terminate()
+        pool.join()
+    return hit
+
+
+def trace_sources(scene, tasks, target_points, target_owners):
+    '''hits_between for a single process, tasks is a list of (index,
+    points, row of pairs or None)'''
+    hit = set()
+    origins, directions, exclude = [], [], []
+    count = 0
+    for i, (index, points, row) in enumerate(tasks):
+        ends = (target_points if row is None
+                else target_points[row[target_owners]])
+        ray_origins = np.repeat(points, len(ends), axis=0)
+        origins.append(ray_origins)
+        directions.append(np.tile(ends, (len(points), 1)) - ray_origins)
+        exclude.append(np.repeat(index, len(ray_origins)))
+        count += len(ray_origins)
+        if count >= PACKET_SIZE or i == len(tasks) - 1:
+            hits, _ = scene.first_hits(np.concatenate(origins),
+                                       np.concatenate(directions),
+                                       np.concatenate(exclude))
+            hit.update(hits[hits >= 0].tolist())
+            origins, directions, exclude = [], [], []
+            count = 0
+    return hit
+
+
+def _start_worker(scene, target_points, target_owners):
+    _worker['scene'] = scene
+    _worker['targets'] = target_points
+    _worker['owners'] = target_owners
+
+
+def _trace_in_worker(tasks):
+    return trace_sources(_worker['scene'], tasks, _worker['targets'],
+                         _worker['owners'])
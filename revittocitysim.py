@@ -13,10 +13,10 @@ revittocitysim.py
 Export a DPV ModelSnapshot to CitySim for simulation.
 '''
 from xml.etree import ElementTree
+import collections
+import horizon
+import lod
 import magictree as mt
-import clr
-
-clr.AddReference('System.Xml.Linq')
 
 # Default values used for exporting...
 #DEFAULT_INFILTRATION = 0.4
@@ -30,6 +30,14 @@ DEFAULT_SHORT_WAVE_REFLECTANCE = 0.2
 DEFAULT_OPENABLE_RATIO = 0.5
 DEFAULT_ZONE_PSI = 0.3
 
+# a point of the simplified shading buildings (see lod.py), with the same
+# attributes as DesignPerformanceViewer.Model.Point
+XYZ = collections.namedtuple('XYZ', ['X', 'Y', 'Z'])
+# the keyword arguments of build_citysim_xml that can be given in a
+# revittocitysim request (see export_options)
+EXPORT_OPTIONS = ('near_distance', 'far_distance', 'horizon_distance',
+                  'horizon_resolution')
+
 
 def next_id():
     """create unique ids
@@ -53,10 +61,15 @@ def id_map(key):
     return id_map.__map[key]
 
 
-def build_citysim_xml(snapshot):
+def build_citysim_xml(snapshot, near_distance=None, far_distance=None,
+                      horizon_distance=None, horizon_resolution=10.0):
     """Builds a CitySim XML file based on the ModelSnapshot.
     The structure follows the "XML guide for the CitySim Solver"
     document.
+    The shading buildings further away than near_distance / far_distance
+    are simplified (see export_shading_surfaces). Those further away than
+    horizon_distance are left out and make up the far field obstructions
+    instead (see export_far_field_obstructions).
     """
     # FIXME: this is the place to enable the multi-zone export!
     # (just comment out the following line...)
@@ -68,7 +81,8 @@ def build_citysim_xml(snapshot):
     # The district
     district = mt.District()
     citysim.append(district)
-    district.append(export_far_field_obstructions())
+    district.append(export_far_field_obstructions(
+        snapshot, horizon_distance, horizon_resolution))
     district.append(export_default_wall_type(snapshot))
     district.append(export_default_roof_type(snapshot))
     district.append(export_default_floor_type(snapshot))
@@ -77,19 +91,61 @@ def build_citysim_xml(snapshot):
     append_range(district, export_floor_types(snapshot))
     # FIXME: append a dummy walltype for shading objects (the other buildings)
     district.append(export_building(snapshot))
-    for building in export_shading_surfaces(snapshot):
+    for building in export_shading_surfaces(snapshot, near_distance,
+                                            far_distance, horizon_distance):
         district.append(building)
     return prettify(citysim)
 
 
+def export_options(args):
+    """return the keyword arguments for build_citysim_xml given in the
+    arguments of a revittocitysim request (see r2cs_server.py) as
+    name=value, e.g. /revittocitysim/near_distance=50/far_distance=200.
+    Other arguments are ignored.
+    """
+    options = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        if name in EXPORT_OPTIONS:
+            options[name] = float(value)
+    return options
+
+
 def append_range(element, seq):
     for e in seq:
         element.append(e)
 
 
-def export_shading_surfaces(snapshot):
+def export_shading_surfaces(snapshot, near_distance=None, far_distance=None,
+                            horizon_distance=None):
     """collect the shading surfaces back into buildings by their
-    mass object id and export them as buildings with default values.
+    mass object id and export them as buildings with default values
+    (see group_shading_surfaces).
+    The level of detail of each building (see lod.level) depends on its
+    distance to the main building and its height. The buildings further
+    away than horizon_distance are not exported.
+    """
+    target = None
+    if (near_distance is not None or far_distance is not None
+            or horizon_distance is not None):
+        target = snapshot_bounds(snapshot)
+    for shading_building in group_shading_surfaces(snapshot):
+        level = lod.DETAILED
+        if target is not None:
+            bounds = lod.bounds(surface_points(shading_building))
+            distance = lod.distance(bounds, target)
+            if horizon_distance is not None and distance > horizon_distance:
+                continue
+            level = lod.level(distance,
+                              bounds[1][2] - target[0][2],
+                              target[1][2] - target[0][2],
+                              near_distance, far_distance)
+        yield export_shading_building(shading_building, level)
+
+
+def group_shading_surfaces(snapshot):
+    """yield the shading surfaces of the snapshot grouped into buildings
+    (lists of surfaces) by their mass object id.
     Each shading surface in the snapshot has an id like
     "DpvShadingSurface:1158832:0" - the middle id ("1158832") here is the
     name of the building.
@@ -105,22 +161,50 @@ def export_shading_surfaces(snapshot):
         """
         return value.Id.split(':')[1]
     for id, shading_building in groupby(snapshot.ShadingSurfaces, gbkey):
-        yield export_shading_building(list(shading_building))
+        yield list(shading_building)
 
 
-def export_shading_building(shading_building):
+def snapshot_bounds(snapshot):
+    """the bounding box (see lod.bounds) of the main building"""
+    return lod.bounds(surface_points(
+        surface for surfaces in (snapshot.Walls, snapshot.Roofs,
+                                 snapshot.Floors)
+        for surface in surfaces))
+
+
+def surface_points(surfaces):
+    """the points of all the surfaces as (x, y, z) tuples"""
+    return [(p.X, p.Y, p.Z) for surface in surfaces for p in surface.Points]
+
+
+def export_shading_building(shading_building, level=lod.DETAILED):
     """use a list of DpvShadingSurface objects to build a dummy building
-    in CitySim xml format.
-    """
-    walls = [w for w in shading_building
-             if abs(w.Orientation.Z) < 0.001]
-    roof = max((r for r in shading_building
-                if abs(r.Orientation.Z) > 0.001),
-               key=lambda s: s.Points[0].Z)
-    floor = min((f for f in shading_building
-                 if abs(f.Orientation.Z) > 0.001),
-                key=lambda s: s.Points[0].Z)
-    building_id = int(roof.Id.split(':')[1])
+    in CitySim xml format. for the other levels of detail, the building is
+    the envelope of the surfaces (see lod.py).
+    """
+    building_id = int(shading_building[0].Id.split(':')[1])
+    if level == lod.DETAILED:
+        walls = [(w.Id, w.Points) for w in shading_building
+                 if abs(w.Orientation.Z) < 0.001]
+        roof = max((r for r in shading_building
+                    if abs(r.Orientation.Z) > 0.001),
+                   key=lambda s: s.Points[0].Z)
+        floor = min((f for f in shading_building
+                     if abs(f.Orientation.Z) > 0.001),
+                    key=lambda s: s.Points[0].Z)
+        volume = calculate_volume(roof, floor)
+        roof = (roof.Id, roof.Points)
+        floor = (floor.Id, floor.Points)
+    else:
+        wall_points, roof_points, floor_points = lod.envelope(
+            surface_points(shading_building), level)
+        prefix = 'DpvShadingSurface:%i:L%i' % (building_id, level)
+        walls = [('%sW%i' % (prefix, i), [XYZ(*p) for p in points])
+                 for i, points in enumerate(wall_points)]
+        roof = (prefix + 'R', [XYZ(*p) for p in roof_points])
+        floor = (prefix + 'F', [XYZ(*p) for p in floor_points])
+        volume = (lod.area([p[:2] for p in roof_points])
+                  * (roof_points[0][2] - floor_points[0][2]))
     building = mt.Building(Ninf=str(DEFAULT_INFILTRATION),
                            Tmax=str(DEFAULT_TMAX),
                            Tmin=str(DEFAULT_TMIN),
@@ -130,37 +214,37 @@ def export_shading_building(shading_building):
     building.append(export_cool_tank(building_id))
     building.append(export_heat_source(building_id))
     zone = mt.Zone(GroundFloor="true", Psi=str(DEFAULT_ZONE_PSI),
-                   volume=str(calculate_volume(roof, floor)),
+                   volume=str(volume),
                    id=str(building_id))
     building.append(zone)
-    for wall in walls:
+    for wall_id, points in walls:
         zone.append(
             mt.Wall(
-                *export_vertices(wall.Points),
+                *export_vertices(points),
                 GlazingGValue=str(DEFAULT_GLAZING_G_VALUE),
                 GlazingRatio=str(DEFAULT_GLAZING_RATIO),
                 GlazingUValue=str(DEFAULT_GLAZING_U_VALUE),
                 OpenableRatio=str(DEFAULT_OPENABLE_RATIO),
                 ShortWaveReflectance=str(DEFAULT_SHORT_WAVE_REFLECTANCE),
                 id=str(next_id()),
-                ep_id=wall.Id,
+                ep_id=wall_id,
                 type=str(id_map("DEFAULT_WALL_TYPE"))))
     zone.append(
         mt.Roof(
-            *export_vertices(roof.Points),
+            *export_vertices(roof[1]),
             GlazingGValue="0.0",
             GlazingRatio="0.0",
             GlazingUValue="0.0",
             OpenableRatio="0.0",
             ShortWaveReflectance=str(DEFAULT_SHORT_WAVE_REFLECTANCE),
             id=str(next_id()),
-            ep_id=roof.Id,
+            ep_id=roof[0],
             type=str(id_map("DEFAULT_ROOF_TYPE"))))
     zone.append(
         mt.Floor(
-            *export_vertices(floor.Points),
+            *export_vertices(floor[1]),
             id=str(next_id()),
-            ep_id=floor.Id,
+            ep_id=floor[0],
             type=str(id_map("DEFAULT_FLOOR_TYPE"))))
     return building
 
@@ -478,11 +562,30 @@ def export_occupants(snapshot):
     return occupants
 
 
-def export_far_field_obstructions():
-    """Returns a dummy version of the Far Field Obstruction profile
-    """
+def export_far_field_obstructions(snapshot=None, horizon_distance=None,
+                                  resolution=10.0):
+    """Returns the Far Field Obstruction profile: the horizon (see
+    horizon.py) of the shading buildings further away than
+    horizon_distance, seen from the middle of the main building, every
+    `resolution` degrees. Without a horizon_distance, this is a dummy
+    profile.
+    """
+    if horizon_distance is None:
+        return mt.FarFieldObstructions(
+            *[mt.Point(phi="%d.0" % i, theta="2.0")
+              for i in range(0, 360, 10)])
+    target = snapshot_bounds(snapshot)
+    centre = tuple((lower + upper) / 2.0 for lower, upper in zip(*target))
+    far_field = []
+    for shading_building in group_shading_surfaces(snapshot):
+        points = surface_points(shading_building)
+        if lod.distance(lod.bounds(points), target) > horizon_distance:
+            far_field.append(points)
+    thetas = horizon.horizon(far_field, centre, resolution)
+    step = 360.0 / len(thetas)
     return mt.FarFieldObstructions(
-        *[mt.Point(phi="%d.0" % i, theta="2.0") for i in range(0, 360, 10)])
+        *[mt.Point(phi=str(i * step), theta="%.2f" % theta)
+          for i, theta in enumerate(thetas)])
 
 
 def export_default_wall_type(snapshot):
@@ -559,6 +662,8 @@ def export_construction_layers(construction):
 def prettify(elem):
     """Return a pretty-printed XML string for the Element.
     """
+    import clr
+    clr.AddReference('System.Xml.Linq')
     from System.Xml.Linq import XDocument
     doc = XDocument.Parse(ElementTree.tostring(elem, 'utf-8'))
     return doc.ToString()
@@ -575,6 +680,7 @@ def take_snapshot():
     """Use the DesignPerformanceViewer libraries to create a
     ModelSnapshot object
     """
+    import clr
     clr.AddReferenceToFile('DpvApplication.dll')
     clr.AddReferenceToFile('DesignPerformanceViewer.dll')
     from DesignPerformanceViewer import DpvApplication
@@ -4,59 +4,183 @@ shading.py
 Simplify shading surfaces in the EnergyPlus model
 by joining rectangular adjacent, coplanar surfaces
 '''
-from eppy.geometry.surface import tilt, angle2vecs
 import numpy as np
 import itertools
+import coplanar
+import geometrycache
+import geometrymemo
+import shadingstore
+import vertextable
 
+MODES = ('stacks', 'coplanar')
 
-def simplify(idf):
-    to_delete = simplify_one_level(collect_shading_walls(idf))
-    while len(to_delete):
-        for shading in to_delete:
-            idf.removeidfobject(idf.getobject('SHADING:BUILDING:DETAILED',
-                                              shading))
+
+def simplify(idf, mode='stacks', tolerance=coplanar.TOLERANCE,
+             cache_folder=None):
+    '''
+    simplify the shading surfaces of the idf. the modes are:
+        stacks: merge vertical rectangles stacked on top of each other
+        coplanar: merge any surfaces in the same plane that share edges
+                  into convex surfaces (see coplanar.py), vertices closer
+                  than tolerance (in metres) are the same.
+    with a cache_folder (e.g. geometrycache.CACHE_FOLDER), the simplified
+    shading surfaces are stored there and used again for the same shading
+    geometry, mode and tolerance, see geometrycache.py.
+    '''
+    assert mode in MODES, 'unknown mode: %s' % mode
+    key = None
+    if cache_folder is not None:
+        key = geometrycache.geometry_hash(
+            'simplify', [(shadingstore.KEY, s.Name, shadingstore.vertices(s))
+                         for s in shadingstore.shading_surfaces(idf)],
+            (mode, tolerance))
+        simplified = geometrycache.load(key, cache_folder)
+        if simplified is not None:
+            print 'simplify cached', key
+            apply_simplified(idf, simplified)
+            return idf
+    if mode == 'coplanar':
+        merge_coplanar(idf, tolerance)
+    else:
         to_delete = simplify_one_level(collect_shading_walls(idf))
+        while len(to_delete):
+            shadingstore.remove_shading(idf, to_delete)
+            to_delete = simplify_one_level(collect_shading_walls(idf))
+    if key is not None:
+        geometrycache.store(
+            key, [('%s' % s.Name, shadingstore.vertices(s).ravel().tolist())
+                  for s in shadingstore.shading_surfaces(idf)], cache_folder)
     return idf
 
 
+def apply_simplified(idf, simplified):
+    '''
+    make the shading surfaces of the idf the simplified ones, a list of
+    (name, flat list of coordinates) stored by simplify: the other shading
+    surfaces are removed and the vertices of these are set.
+    '''
+    coordinates = dict((name.upper(), c) for name, c in simplified)
+    to_delete = []
+    for s in shadingstore.shading_surfaces(idf):
+        c = coordinates.get(('%s' % s.Name).upper())
+        if c is None:
+            to_delete.append(s.Name)
+        elif shadingstore.vertices(s).ravel().tolist() != c:
+            shadingstore.set_vertices(s, np.reshape(c, (-1, 3)))
+    shadingstore.remove_shading(idf, to_delete)
+
+
+def merge_coplanar(idf, tolerance=coplanar.TOLERANCE):
+    '''
+    replace each group of coplanar shading surfaces by the convex pieces
+    of their union (if that is fewer surfaces). the pieces take the
+    names of the first surfaces of the group.
+    returns the number of shading surfaces removed.
+    '''
+    shading_surfaces = shadingstore.shading_surfaces(idf)
+    polygon_list = [get_polygon(s) for s in shading_surfaces]
+    to_delete = set()
+    for group in coplanar.group_by_plane(polygon_list, tolerance):
+        pieces = coplanar.union([polygon_list[i] for i in group], tolerance)
+        if pieces is None or len(pieces) >= len(group):
+            continue
+        for i, piece in zip(group, pieces):
+            set_polygon(shading_surfaces[i], piece)
+        to_delete.update(shading_surfaces[i].Name
+                         for i in group[len(pieces):])
+        print 'merge_coplanar', len(group), len(pieces)
+    return shadingstore.remove_shading(idf, to_delete)
+
+
 def simplify_one_level(shading_surfaces):
     '''
-    run one pass of simplifications - this needs to be repeated until
-    no more simplifications are found
+    run one pass of simplifications - simplify repeats this until
+    no more simplifications are found.
+    each stack of rectangles (see find_stacks) is merged into the topmost
+    rectangle of the stack.
     to_delete is a set of names of shading surfaces that were simplified.
     '''
-    to_delete = set()
     print 'simplify_one_level', len(shading_surfaces)
-    for sa, sb in itertools.combinations(shading_surfaces, 2):
-        if sa.Name in to_delete or sb.Name in to_delete:
-            # one of these has already been merged!
+    to_delete = set()
+    for stack in find_stacks([get_polygon(s) for s in shading_surfaces]):
+        (bottom, pb), (top, pa) = stack[0], stack[-1]
+        to_delete.update(shading_surfaces[i].Name for i, _ in stack[:-1])
+        set_polygon(shading_surfaces[top], [pb[0], pa[1], pa[2], pb[3]])
+        print '-', shading_surfaces[top].Name, shading_surfaces[bottom].Name
+    return to_delete
+
+
+def find_stacks(polygon_list):
+    '''
+    return the stacks of rectangles in polygon_list, where the
+    bottom edge of a rectangle is the top edge of the rectangle below. each
+    stack is a list of (index into polygon_list, canonically rotated polygon)
+    from the bottom to the top. the shared edges are found with a hash of
+    the vertices, so this is linear in the number of polygons.
+    '''
+    rectangles = {}  # index into polygon_list -> canonical polygon
+    for i, polygon in enumerate(polygon_list):
+        try:
+            rectangles[i] = canonical_rotation(polygon)
+        except AssertionError:
+            # not a rectangle with horizontal edges, can't be stacked
             continue
-        pa = get_polygon(sa)
-        pb = get_polygon(sb)
-        if len(points_in_common(pa, pb)) != 2:
-            # ignore these as they can't possibly share an edge
+    vertex_ids = VertexIds(max([tolerance(p) for p in rectangles.values()]
+                               or [0]))
+
+    def edge(a, b):
+        return vertex_ids(a), vertex_ids(b)
+
+    # a0 ----- a3 is the bottom edge, a1 ----- a2 the top edge. the edges
+    # are directed, so only rectangles facing the same way are stacked:
+    # a1 ----- a2
+    # |        |
+    # |        |
+    # a0 ----- a3
+    bottom_edges = {}
+    for i in sorted(rectangles):
+        polygon = rectangles[i]
+        bottom_edges.setdefault(edge(polygon[0], polygon[3]), i)
+    above = {}  # i -> the rectangle on top of i
+    below = {}  # i -> the rectangle below i
+    for i in sorted(rectangles):
+        polygon = rectangles[i]
+        j = bottom_edges.get(edge(polygon[1], polygon[2]))
+        if j is None or j == i or j in below:
             continue
-        pa = canonical_rotation(pa)
-        pb = canonical_rotation(pb)
-        if np.isclose(pa[0][2], pb[0][2]):
-            # not above each other...
+        above[i] = j
+        below[j] = i
+    stacks = []
+    for i in sorted(above):
+        if i in below:
+            # not the bottom of a stack
             continue
-        # swap the two polygons so that pa is the upper and pb the lower
-        # polygon - that way we can always index them the same:
-        # a1 ----- a2
-        # |        |
-        # |        |
-        # a0 ----- a3 (a0 == b1, a3 == b2)
-        # |        |
-        # |        |
-        # b0 ----- b3
-        if pa[0][2] < pb[0][2]:
-            sa, sb = sb, sa
-            pa, pb = pb, pa
-        set_polygon(sa, [pb[0], pa[1], pa[2], pb[3]])
-        to_delete.add(sb.Name)
-        print '-', sa.Name, sb.Name
-    return to_delete
+        stack = [(i, rectangles[i])]
+        while stack[-1][0] in above:
+            j = above[stack[-1][0]]
+            stack.append((j, rectangles[j]))
+        stacks.append(stack)
+    return stacks
+
+
+def tolerance(polygon):
+    '''the largest distance (per coordinate) at which is_same_vertex
+    considers a vertex of the polygon the same as another vertex'''
+    return 1e-08 + 1e-05 * max(abs(c) for v in polygon for c in v)
+
+
+class VertexIds(vertextable.VertexTable):
+    '''
+    give each vertex an id, the same id for vertices that are the same
+    according to is_same_vertex (see vertextable.py). `cell` must be at
+    least the tolerance of is_same_vertex.
+    '''
+
+    def __init__(self, cell):
+        vertextable.VertexTable.__init__(self, cell, is_same_vertex)
+
+    def __call__(self, vertex):
+        return self.add(vertex)
 
 
 def canonical_rotation(polygon):
@@ -75,7 +199,7 @@ def canonical_rotation(polygon):
     def only_two_z_values(polygon):
         zs = set(v[2] for v in polygon)
         for z0, z1 in itertools.combinations(zs, 2):
-            if np.isclose(z0, z1) and z0 in zs:
+            if is_close(z0, z1) and z0 in zs:
                 zs.remove(z0)
         return len(zs) == 2
     assert only_two_z_values(polygon), 'only two z-values allowed! %s' % set(v[2] for v in polygon) # noqa
@@ -83,8 +207,8 @@ def canonical_rotation(polygon):
     def is_canonical(polygon):
         a, b, c, d = polygon
         return all((a[2] < b[2],
-                    np.isclose(a[2], d[2]),
-                    np.isclose(b[2], c[2]),
+                    is_close(a[2], d[2]),
+                    is_close(b[2], c[2]),
                     c[2] > d[2]))
     for i in range(4):  # make sure we don't loop forever on bad data!
         if is_canonical(polygon):
@@ -93,26 +217,13 @@ def canonical_rotation(polygon):
     assert False, 'polygon bad: %s' % polygon
 
 
-def array_contains(array, item):
-    return any([is_same_vertex(item, x) for x in array])
+def is_close(a, b):
+    # same as np.isclose(a, b) for two numbers, without the numpy overhead
+    return abs(a - b) <= 1e-08 + 1e-05 * abs(b)
 
 
 def is_same_vertex(v0, v1):
-    return np.isclose(v0, v1).all()
-
-
-def points_in_common(a, b):
-    '''
-    a: [array(x1, y1, z1), ... array(xn, yn, zn)]
-    b: [array(x1, y1, z1), ... array(xn, yn, zn)]
-    --> [array(xk, yk, zk), ... array(xl, yl, zl)]
-    with k and l being vertices in both polygons.
-    '''
-    result = []
-    for vertex in a:
-        if array_contains(b, vertex):
-            result.append(vertex)
-    return result
+    return all(is_close(c0, c1) for c0, c1 in zip(v0, v1))
 
 
 def get_number_of_vertices(obj):
@@ -127,46 +238,36 @@ def collect_shading_walls(idf):
     '''return the Shading:Building:Detailed objects
     that are walls (vertical) and have 4 vertices
     and rectangular'''
-    result = []
-    for shading in idf.idfobjects['SHADING:BUILDING:DETAILED']:
-        if get_number_of_vertices(shading) != 4:
-            # ignore this one
-            continue
-        polygon = get_polygon(shading)
-        try:
-            if not np.isclose(90.0, tilt(polygon)):
-                # ignore this one too
-                continue
-        except:
-            print 'bad polygon:', shading.Name, polygon
-            continue
-        vectors = [line[0] - line[1]
-                   for line in zip(polygon, rotate(polygon))]
-        if not all([np.isclose(90.0, angle2vecs(v[0], v[1]))
-                    for v in zip(vectors, rotate(vectors))]):
-            # not rectangular
-            continue
-        # meets criteria
-        result.append(shading)
-    return result
+    shadings = [shading for shading in shadingstore.shading_surfaces(idf)
+                if get_number_of_vertices(shading) == 4]
+    walls = vertical_rectangles(
+        [shadingstore.vertices(shading) for shading in shadings])
+    return [shading for shading, wall in zip(shadings, walls) if wall]
+
+
+def vertical_rectangles(quads):
+    '''return a boolean array telling for each polygon with 4 vertices
+    in quads if it is vertical and rectangular (using the same tests as
+    eppy.geometry.surface.tilt and angle2vecs, see geometrymemo.py)'''
+    if not len(quads):
+        return np.zeros(0, dtype=bool)
+    properties = geometrymemo.properties(quads)
+    return np.isclose(90.0, properties.tilt) & properties.rectangular
 
 
 def get_polygon(shading):
     '''
     return a polygon representign the shading surface.
-    each vertices is an np.array.
+    each vertices is an np.array (read-only, see surfacevertices.py).
     '''
-    vertices_index = shading.objls.index('Number_of_Vertices') + 1
-    return get_vertices(shading.obj[vertices_index:])
+    return list(shadingstore.vertices(shading))
 
 
 def set_polygon(shading, polygon):
     '''
     set the vertices of a polygon.
     '''
-    coordinates = [c for v in polygon for c in v]
-    vertices_index = shading.objls.index('Number_of_Vertices') + 1
-    shading.obj[vertices_index:] = coordinates
+    shadingstore.set_vertices(shading, polygon)
 
 
 def rotate(lst):
@@ -0,0 +1,310 @@
+'''
+shadingstore.py
+
+A compact store for the SHADING:BUILDING:DETAILED surfaces of an IDF model.
+
+District models contain a shading surface for every wall and roof of every
+neighbouring building. As eppy objects, each of these is a dict with a list
+of field names, a list of field values and a handful of helper objects. The
+ShadingStore keeps only the names and the vertices in a flat array of
+floats, with the offset of each surface into that array:
+
+    store = shadingstore.shading_store(idf)
+    store.extend([('ShadingB1W2', [(x0, y0, z0), (x1, y1, z1), ...]), ...])
+
+idfwriter.py writes the stored surfaces directly as IDF text. Code that
+knows about the store (shading.py, removeshading.py, mapepgeom.py) reads
+them through `shading_surfaces` and `find_shading`, which return the eppy
+objects and light-weight views (StoredShading) of the stored surfaces.
+Anything else that accesses the shading surfaces through eppy (e.g.
+`idf.idfobjects['SHADING:BUILDING:DETAILED']`, `idf.idfstr()`) turns the
+stored surfaces into eppy objects first, so the model always looks the same
+from eppy's point of view.
+'''
+import contextlib
+from array import array
+import numpy as np
+import idfclone
+import idfindex
+import surfacevertices
+
+KEY = 'SHADING:BUILDING:DETAILED'
+
+
+def stored(idf):
+    '''return the ShadingStore attached to the idf or None'''
+    return idf.__dict__.get('_shadingstore')
+
+
+def shading_store(idf):
+    '''return the ShadingStore attached to the idf, attaching an empty one
+    if necessary'''
+    store = stored(idf)
+    if store is None:
+        store = ShadingStore(idf)
+    return store
+
+
+def shading_surfaces(idf):
+    '''return a list of all shading surfaces of the idf: the eppy objects
+    followed by a StoredShading for each stored surface.'''
+    store = stored(idf)
+    if store is None:
+        return list(idf.idfobjects[KEY])
+    with store.holding():
+        objects = list(idf.idfobjects[KEY])
+    return objects + [StoredShading(store, i) for i in range(len(store))]
+
+
+def find_shading(idf, name):
+    '''return the shading surface called `name` (an eppy object or a
+    StoredShading) or None.'''
+    store = stored(idf)
+    if store is None:
+        return idfindex.getobject(idf, KEY, name)
+    i = store.find(name)
+    if i is not None:
+        return StoredShading(store, i)
+    with store.holding():
+        return idfindex.getobject(idf, KEY, name)
+
+
+def remove_shading(idf, names):
+    '''remove the shading surfaces with a Name in `names` from the idf.
+    returns the number of surfaces removed.'''
+    names = set(('%s' % name).upper() for name in names)
+    store = stored(idf)
+    if store is None:
+        return len(idfindex.removeidfobjects(
+            idf, ((KEY, name) for name in names)))
+    removed = store.remove(names)
+    with store.holding():
+        removed += len(idfindex.removeidfobjects(
+            idf, ((KEY, name) for name in names)))
+    return removed
+
+
+def vertices(surface):
+    '''return the vertices of a surface (an eppy object or a StoredShading)
+    as a read-only (n, 3) array, see surfacevertices.py'''
+    if isinstance(surface, StoredShading):
+        return surface.vertices()
+    return surfacevertices.vertices(surface)
+
+
+def set_vertices(surface, vertices):
+    '''set the vertices of a shading surface (an eppy object or a
+    StoredShading), vertices is a sequence of (x, y, z).'''
+    if isinstance(surface, StoredShading):
+        surface.set_vertices(vertices)
+    else:
+        surfacevertices.set_vertices(surface, vertices)
+
+
+def flush(idf):
+    '''turn the stored shading surfaces of the idf into eppy objects'''
+    store = stored(idf)
+    if store is not None:
+        store.flush()
+
+
+class ShadingStore(object):
+    '''the shading surfaces of an idf as names and a flat array of vertex
+    coordinates. Use `shading_store` instead of instantiating this.'''
+
+    def __init__(self, idf):
+        from eppy.modeleditor import newrawobject, obj2bunch
+        self.idf = idf
+        self.names = []
+        self.coordinates = array('d')  # x0, y0, z0, x1, y1, z1, ...
+        self.offsets = array('l', [0])  # surface i: offsets[i]:offsets[i+1]
+        self.edits = {}  # i -> new coordinates, not yet in coordinates
+        self.index = None  # NAME -> i, built on demand
+        self.holds = 0
+        # a new eppy object of the class, used for formatting
+        self.prototype = obj2bunch(idf.model, idf.idd_info,
+                                   newrawobject(idf.model, idf.idd_info, KEY))
+        self.objls = self.prototype.objls
+        self.name_index = self.objls.index('Name')
+        self.vertices_index = self.objls.index('Number_of_Vertices') + 1
+        self.attach(idf)
+
+    def attach(self, idf):
+        '''hook into the idfobjects and model.dt of the idf, so the stored
+        surfaces are turned into eppy objects before eppy sees them'''
+        self.previous = None
+        if isinstance(idf.idfobjects, idfclone.SharedObjects):
+            self.previous = idf.idfobjects.owner
+            idf.idfobjects.owner = self
+            idf.model.dt.owner = self
+        else:
+            idf.idfobjects = idfclone.SharedObjects(
+                self, idf.idfobjects.items())
+            idf.model.dt = idfclone.SharedObjects(self, idf.model.dt.items())
+        idf.__dict__['_shadingstore'] = self
+
+    def materialize(self, key):
+        if self.previous is not None:
+            self.previous.materialize(key)
+        if key == KEY and not self.holds and self.names:
+            self.flush()
+
+    @contextlib.contextmanager
+    def holding(self):
+        '''don't flush the store while in the with-block'''
+        self.holds += 1
+        try:
+            yield self
+        finally:
+            self.holds -= 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, vertices):
+        '''add a shading surface, vertices is a sequence of (x, y, z)'''
+        self.extend([(name, vertices)])
+
+    def extend(self, surfaces):
+        '''add the shading surfaces, a sequence of (name, vertices)'''
+        for name, vertices in surfaces:
+            if self.index is not None:
+                self.index.setdefault(('%s' % name).upper(), len(self.names))
+            self.names.append(name)
+            self.coordinates.extend(float(c) for v in vertices for c in v)
+            self.offsets.append(len(self.coordinates))
+
+    def find(self, name):
+        '''return the index of the first surface called `name` or None'''
+        if self.index is None:
+            self.index = {}
+            for i, n in enumerate(self.names):
+                self.index.setdefault(('%s' % n).upper(), i)
+        return self.index.get(('%s' % name).upper())
+
+    def surface_coordinates(self, i):
+        '''return the coordinates of surface i, x0, y0, z0, x1, ...'''
+        coordinates = self.edits.get(i)
+        if coordinates is None:
+            coordinates = self.coordinates[self.offsets[i]:self.offsets[i + 1]]
+        return coordinates
+
+    def vertices(self, i):
+        '''return the vertices of surface i as a read-only (n, 3) array'''
+        vertices = np.array(self.surface_coordinates(i)).reshape(-1, 3)
+        vertices.flags.writeable = False
+        return vertices
+
+    def set_vertices(self, i, vertices):
+        '''set the vertices of surface i. the change is kept aside until
+        `apply_edits`, so changing many surfaces doesn't move the
+        coordinates of the following surfaces each time.'''
+        self.edits[i] = array('d', [float(c) for v in vertices for c in v])
+
+    def apply_edits(self):
+        '''move the changed vertices into coordinates and offsets, in one
+        pass over the store'''
+        if not self.edits:
+            return
+        offsets = np.array(self.offsets, dtype=np.int64)
+        counts = np.diff(offsets)
+        coordinates = array('d')
+        start = 0
+        for i in sorted(self.edits):
+            coordinates.extend(self.coordinates[offsets[start]:offsets[i]])
+            coordinates.extend(self.edits[i])
+            counts[i] = len(self.edits[i])
+            start = i + 1
+        coordinates.extend(self.coordinates[offsets[start]:])
+        offsets[1:] = np.cumsum(counts)
+        self.coordinates = coordinates
+        self.offsets = array('l', offsets.tolist())
+        self.edits = {}
+
+    def remove(self, names):
+        '''remove the surfaces with an upper-cased name in the set `names`,
+        returns the number of surfaces removed.'''
+        self.apply_edits()
+        keep = [i for i, name in enumerate(self.names)
+                if ('%s' % name).upper() not in names]
+        removed = len(self.names) - len(keep)
+        if removed:
+            coordinates = array('d')
+            offsets = array('l', [0])
+            for i in keep:
+                coordinates.extend(
+                    self.coordinates[self.offsets[i]:self.offsets[i + 1]])
+                offsets.append(len(coordinates))
+            self.names = [self.names[i] for i in keep]
+            self.coordinates = coordinates
+            self.offsets = offsets
+            self.index = None
+        return removed
+
+    def fields(self, i):
+        '''return the field values of surface i as they would be in
+        the eppy object'''
+        values = self.prototype.obj[:self.vertices_index]
+        values[self.name_index] = self.names[i]
+        coordinates = self.surface_coordinates(i)
+        values[self.vertices_index - 1] = len(coordinates) // 3
+        values.extend(repr(c) for c in coordinates)
+        return values
+
+    def flush(self):
+        '''turn the stored surfaces into eppy objects and empty the store'''
+        with self.holding():
+            objects = self.idf.idfobjects[KEY]
+            dt = self.idf.model.dt[KEY]
+            for i in range(len(self)):
+                obj = self.prototype.__class__(
+                    self.fields(i), self.objls, self.prototype.objidd)
+                objects.append(obj)
+                dt.append(obj.obj)
+        self.names = []
+        self.coordinates = array('d')
+        self.offsets = array('l', [0])
+        self.edits = {}
+        self.index = None
+
+    def copy_to(self, idf):
+        '''attach a copy of the store to another idf (e.g. a clone)'''
+        self.apply_edits()
+        store = shading_store(idf)
+        store.names = list(self.names)
+        store.coordinates = array('d', self.coordinates)
+        store.offsets = array('l', self.offsets)
+        return store
+
+
+class StoredShading(object):
+    '''a read-only view of a surface in a ShadingStore that looks enough
+    like an eppy object for reading the Name and the vertices (`obj`,
+    `objls`). Views are invalidated by removing surfaces from the store.'''
+    key = KEY
+
+    def __init__(self, store, i):
+        self.store = store
+        self.i = i
+        self.cached = None
+
+    @property
+    def Name(self):
+        return self.store.names[self.i]
+
+    @property
+    def obj(self):
+        return self.store.fields(self.i)
+
+    @property
+    def objls(self):
+        return self.store.objls
+
+    def vertices(self):
+        if self.cached is None:
+            self.cached = self.store.vertices(self.i)
+        return self.cached
+
+    def set_vertices(self, vertices):
+        self.store.set_vertices(self.i, vertices)
+        self.cached = None
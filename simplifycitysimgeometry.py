@@ -7,13 +7,32 @@ building and zone and have the same construction information.
 
 Take special care with opacity...
 '''
-from eppy.geometry.surface import tilt, angle2vecs, area
+from eppy.geometry.surface import area
 from lxml import etree
 import numpy as np
 import itertools
+import coplanar
+import geometrymemo
+import shading
 
+# the attributes merged by merge_windows
+GLAZING_ATTRIBUTES = ['GlazingRatio',
+                      'GlazingGValue',
+                      'GlazingUValue',
+                      'ShortWaveReflectance',
+                      'Uvalue']
 
-def simplify(citysim_xml):
+
+def simplify(citysim_xml, mode='stacks', tolerance=coplanar.TOLERANCE):
+    '''
+    simplify the walls (and roofs) of the CitySim scene, see
+    shading.simplify for the modes. in the coplanar mode, the roofs are
+    merged too.
+    '''
+    assert mode in shading.MODES, 'unknown mode: %s' % mode
+    if mode == 'coplanar':
+        merge_coplanar(citysim_xml, tolerance)
+        return citysim_xml
     to_delete = simplify_one_level(collect_walls(citysim_xml))
     while len(to_delete):
         for wall in to_delete:
@@ -24,51 +43,83 @@ def simplify(citysim_xml):
 
 def simplify_one_level(walls):
     '''
-    run one pass of simplifications - this needs to be repeated until
-    no more simplifications are found
-    to_delete is a set of names of shading surfaces that were simplified.
+    run one pass of simplifications - simplify repeats this until
+    no more simplifications are found.
+    the walls are grouped by zone and construction first, the stacks of
+    walls in each group (see shading.find_stacks) are merged into the
+    topmost wall of the stack.
+    to_delete is a set of the wall nodes that were simplified.
     '''
     to_delete = set()
     print 'simplify_one_level', len(walls)
-    for wa, wb in itertools.combinations(walls, 2):
-        if not same_zone(wa, wb):
-            continue
-        if not same_construction(wa, wb):
-            continue
-        if wa in to_delete or wb in to_delete:
-            # one of these has already been merged!
-            continue
-        pa = get_polygon(wa)
-        pb = get_polygon(wb)
-        if len(points_in_common(pa, pb)) != 2:
-            # ignore these as they can't possibly share an edge
-            continue
-        pa = canonical_rotation(pa)
-        pb = canonical_rotation(pb)
-        if np.isclose(pa[0][2], pb[0][2]):
-            # not above each other...
-            continue
-        # swap the two polygons so that pa is the upper and pb the lower
-        # polygon - that way we can always index them the same:
-        # a1 ----- a2
-        # |        |
-        # |        |
-        # a0 ----- a3 (a0 == b1, a3 == b2)
-        # |        |
-        # |        |
-        # b0 ----- b3
-        if pa[0][2] < pb[0][2]:
-            wa, wb = wb, wa
-            pa, pb = pb, pa
-        pnew = [pb[0], pa[1], pa[2], pb[3]]
-        set_polygon(wa, pnew)
-        wa.set('Area', str(area(pnew)))
-        merge_windows(wa, wb)
-        to_delete.add(wb)
-        print '-', wa.get('id'), wb.get('id')
+    for bucket in group_walls(walls):
+        bucket_polygons = [get_polygon(wall) for wall in bucket]
+        stacks = shading.find_stacks(bucket_polygons)
+        if stacks:
+            areas = geometrymemo.properties(bucket_polygons).area
+        for stack in stacks:
+            (bottom, pb), (top, pa) = stack[0], stack[-1]
+            stack_walls = [bucket[i] for i, _ in stack]
+            pnew = [pb[0], pa[1], pa[2], pb[3]]
+            set_polygon(bucket[top], pnew)
+            bucket[top].set('Area', str(area(pnew)))
+            merge_windows(bucket[top], stack_walls,
+                          [areas[i] for i, _ in stack])
+            to_delete.update(stack_walls[:-1])
+            print '-', bucket[top].get('id'), bucket[bottom].get('id')
     return to_delete
 
 
+def merge_coplanar(citysim_xml, tolerance=coplanar.TOLERANCE):
+    '''
+    replace each group of coplanar walls (or roofs) of the same zone and
+    construction by the convex pieces of their union (if that is fewer
+    surfaces). the pieces take the ids of the first surfaces of the group
+    and the area weighted glazing attributes of the whole group.
+    returns the number of surfaces removed.
+    '''
+    surfaces = [s for s in citysim_xml.findall('/District/Building/Zone/*')
+                if s.tag in ('Wall', 'Roof')]
+    polygon_list = [get_polygon(s) for s in surfaces]
+    keys = [(s.getparent(), s.tag, s.get('type')) for s in surfaces]
+    to_delete = []
+    for group in coplanar.group_by_plane(polygon_list, tolerance, keys):
+        pieces = coplanar.union([polygon_list[i] for i in group], tolerance)
+        if pieces is None or len(pieces) >= len(group):
+            continue
+        group_surfaces = [surfaces[i] for i in group]
+        areas = geometrymemo.properties(
+            [polygon_list[i] for i in group]).area
+        merge_windows(group_surfaces[0], group_surfaces, areas)
+        for surface, piece in zip(group_surfaces, pieces):
+            set_polygon(surface, piece)
+            surface.set('Area', str(area(piece)))
+            for attrib in GLAZING_ATTRIBUTES:
+                surface.set(attrib, group_surfaces[0].get(attrib))
+        to_delete.extend(group_surfaces[len(pieces):])
+        print 'merge_coplanar', len(group), len(pieces)
+    for surface in to_delete:
+        surface.getparent().remove(surface)
+    return len(to_delete)
+
+
+def group_walls(walls):
+    '''
+    return the walls grouped by Building/Zone (the parent element) and
+    construction (the type attribute), only walls in the same group can be
+    merged. walls sharing a horizontal edge are in the same plane anyway.
+    '''
+    groups = {}
+    order = []
+    for wall in walls:
+        key = (wall.getparent(), wall.get('type'))
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(wall)
+    return [groups[key] for key in order]
+
+
 def canonical_rotation(polygon):
     '''
     for our algorithm, a canonically rotated polygon
@@ -103,28 +154,6 @@ def canonical_rotation(polygon):
     assert False, 'polygon bad: %s' % polygon
 
 
-def array_contains(array, item):
-    return any([is_same_vertex(item, x) for x in array])
-
-
-def is_same_vertex(v0, v1):
-    return np.isclose(v0, v1).all()
-
-
-def points_in_common(a, b):
-    '''
-    a: [array(x1, y1, z1), ... array(xn, yn, zn)]
-    b: [array(x1, y1, z1), ... array(xn, yn, zn)]
-    --> [array(xk, yk, zk), ... array(xl, yl, zl)]
-    with k and l being vertices in both polygons.
-    '''
-    result = []
-    for vertex in a:
-        if array_contains(b, vertex):
-            result.append(vertex)
-    return result
-
-
 def get_number_of_vertices(obj):
     '''
     return the number of vertices - autocalculate,
@@ -137,28 +166,15 @@ def collect_walls(citysim_xml):
     '''return the Wall nodes objects
     that are walls (vertical) and have 4 vertices
     and rectangular'''
-    result = []
+    walls = []
+    polygons = []
     for wall in citysim_xml.findall('/District/Building/Zone/Wall'):
-        if get_number_of_vertices(wall) != 4:
-            # ignore this one
-            continue
         polygon = get_polygon(wall)
-        try:
-            if not np.isclose(90.0, tilt(polygon)):
-                # ignore this one too
-                continue
-        except:
-            print 'bad polygon:', 'Wall@id=%s' % wall.get('id'), polygon
-            continue
-        vectors = [line[0] - line[1]
-                   for line in zip(polygon, rotate(polygon))]
-        if not all([np.isclose(90.0, angle2vecs(v[0], v[1]))
-                    for v in zip(vectors, rotate(vectors))]):
-            # not rectangular
-            continue
-        # meets criteria
-        result.append(wall)
-    return result
+        if len(polygon) == 4:
+            walls.append(wall)
+            polygons.append(polygon)
+    vertical = shading.vertical_rectangles(polygons)
+    return [wall for wall, meets in zip(walls, vertical) if meets]
 
 
 def get_polygon(wall):
@@ -200,18 +216,7 @@ def rotate(lst):
     return result
 
 
-def same_zone(wa, wb):
-    '''return True, if wa and wb are both children of the
-    same Building/Zone'''
-    return wa.getparent() == wb.getparent()
-
-
-def same_construction(wa, wb):
-    '''return True, if wa and wb share construction information'''
-    return wa.get('type') == wb.get('type')
-
-
-def merge_windows(wa, wb):
+def merge_windows(wall, walls, areas):
     '''
     update the attributes for the glazing / windows e.g.:
         GlazingRatio="0.43"
@@ -219,21 +224,17 @@ def merge_windows(wa, wb):
         GlazingUValue="1.1"
         ShortWaveReflectance="0.2"
         Uvalue="0.5331238918939453"
-    using a weighted average for each value.
+    of `wall` using the average of each value over `walls`, weighted
+    by `areas` (the areas of the walls before merging them).
     FIXME: is this physically correct?!
     '''
-    aa = area(get_polygon(wa))
-    ab = area(get_polygon(wb))
-    attributes = ['GlazingRatio',
-                  'GlazingGValue',
-                  'GlazingUValue',
-                  'ShortWaveReflectance',
-                  'Uvalue']
-    for attrib in attributes:
-        wa.set(attrib, str(weighted_average(
-            get_float(wa, attrib),
-            get_float(wb, attrib),
-            aa, ab)))
+    for attrib in GLAZING_ATTRIBUTES:
+        value = get_float(walls[0], attrib)
+        total = areas[0]
+        for w, a in zip(walls[1:], areas[1:]):
+            value = weighted_average(value, get_float(w, attrib), total, a)
+            total += a
+        wall.set(attrib, str(value))
 
 
 def get_float(element, attribute):
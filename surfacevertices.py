@@ -0,0 +1,80 @@
+'''
+surfacevertices.py
+
+Cached numeric vertices of eppy surface objects (walls, roofs, shading...).
+
+The vertices of a surface are stored by eppy as the trailing fields of the
+object after `Number_of_Vertices`, as strings or floats. Parsing them into
+numpy arrays over and over (e.g. for every pair of shading surfaces in
+shading.simplify) is most of the cost of the geometry code. `vertices`
+parses them once and keeps the (n, 3) float64 array with the object. The
+array is reused for as long as the vertex fields of the object don't change
+and is read-only, so callers can't change it by accident. Use
+`set_vertices` to change the vertices, which writes them back to the fields:
+
+    v = surfacevertices.vertices(wall)  # array([[x0, y0, z0], ...])
+    surfacevertices.set_vertices(wall, v[::-1])
+
+The position of the first vertex field is computed once per IDD class.
+'''
+import numpy as np
+
+# id(objidd) -> (objidd, index of the first vertex field)
+_offsets = {}
+
+# the cache is stored in the EpBunch (a dict) under this key
+CACHE_KEY = '__vertices'
+
+
+def vertices_index(obj):
+    '''return the index of the first vertex field (the field after
+    Number_of_Vertices) of the eppy object'''
+    # eppy shares the objidd (the IDD info) between all objects of a class
+    objidd = dict.__getitem__(obj, 'objidd')
+    known = _offsets.get(id(objidd))
+    if known is None or known[0] is not objidd:
+        known = (objidd, obj.objls.index('Number_of_Vertices') + 1)
+        _offsets[id(objidd)] = known
+    return known[1]
+
+
+def fields(obj):
+    '''return the field values of the eppy object (obj.obj, without going
+    through the EpBunch attribute lookup)'''
+    return dict.__getitem__(obj, 'obj')
+
+
+def vertices(obj):
+    '''return the vertices of the eppy surface object as a read-only
+    (n, 3) float64 array.'''
+    raw = fields(obj)[vertices_index(obj):]
+    cached = dict.get(obj, CACHE_KEY)
+    if cached is not None and cached[0] == raw:
+        return cached[1]
+    array = to_array(raw)
+    dict.__setitem__(obj, CACHE_KEY, (raw, array))
+    return array
+
+
+def set_vertices(obj, new_vertices):
+    '''set the vertices of the eppy surface object, new_vertices is a
+    sequence of (x, y, z). Number_of_Vertices is updated if the number of
+    vertices changes (unless it is autocalculated).'''
+    array = np.array(new_vertices, dtype=float).reshape(-1, 3)
+    array.flags.writeable = False
+    values = fields(obj)
+    start = vertices_index(obj)
+    autocalculate = str(values[start - 1]).strip().lower() == 'autocalculate'
+    if not autocalculate and len(array) != (len(values) - start) // 3:
+        values[start - 1] = len(array)
+    values[start:] = list(array.ravel())
+    dict.__setitem__(obj, CACHE_KEY, (values[start:], array))
+
+
+def to_array(raw):
+    '''convert the vertex fields to a read-only (n, 3) array, ignoring
+    an incomplete vertex at the end'''
+    raw = raw[:len(raw) - len(raw) % 3]
+    array = np.array([float(c) for c in raw], dtype=float).reshape(-1, 3)
+    array.flags.writeable = False
+    return array
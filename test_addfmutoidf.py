@@ -0,0 +1,22 @@
+import addfmutoidf
+
+
+def test_manifest(read_model):
+    idf = read_model()
+    manifest = addfmutoidf.generate_interface(idf)
+    names = [v['name'] for v in manifest]
+    assert len(names) == len(set(names))
+    walls = [w.Name for w in addfmutoidf.exterior_walls(idf)]
+    assert '%s::Outside Surface Temperature' % walls[0] in names
+    assert '%s::Henv' % walls[0] in names
+    inputs = [v for v in manifest if v['causality'] == 'input']
+    assert all(v['initial_value'] for v in inputs)
+    assert 'Outdoor Drybulb' in [v['name'] for v in inputs]
+
+
+def test_generate_interface_twice(read_model):
+    idf = read_model()
+    addfmutoidf.generate_interface(idf)
+    first = idf.idfstr()
+    addfmutoidf.generate_interface(idf)
+    assert idf.idfstr() == first
@@ -3,6 +3,7 @@ from eppy import modeleditor
 from lxml import etree
 import os
 import polygons
+import shadingstore
 from decimal import Decimal
 
 
@@ -233,6 +234,106 @@ def test_add_windows():
                 ratio)
 
 
+def test_add_windows_concave_wall():
+    # an L-shaped wall, the windows must stay inside it
+    l_shape = [(0, 0), (4, 0), (4, 1), (1, 1), (1, 3), (0, 3)]
+    building_xml = etree.XML(
+        '<Building id="1"><Zone id="1"><Wall id="1" type="1" '
+        'GlazingRatio="0.8" GlazingUValue="1.1" GlazingGValue="0.6">%s'
+        '</Wall></Zone></Building>' % ''.join(
+            '<V%i x="%s" y="0" z="%s"/>' % (i, x, z)
+            for i, (x, z) in enumerate(l_shape)))
+    idf = construct_empty_idf()
+    citysimtoenergyplus.add_walls(building_xml, idf, {'1': 'WALL'})
+    citysimtoenergyplus.add_windows(building_xml, idf)
+    windows = idf.idfobjects['FENESTRATIONSURFACE:DETAILED']
+    assert len(windows) > 1
+    area = 0
+    for window in windows:
+        assert window.Building_Surface_Name == 'Wall1'
+        assert window.Number_of_Vertices <= 4
+        coordinates = [float(c) for c in
+                       window.obj[window.Number_of_Vertices * -3:]]
+        vertices = zip(coordinates[0::3], coordinates[1::3],
+                       coordinates[2::3])
+        area += polygons.area(vertices)
+        for x, y, z in vertices:
+            assert 0 < x < 4 and 0 < z < 3 and (x < 1 or z < 1)
+    assert abs(area - 0.8 * 6) < 1e-6
+
+
+def test_select_neighbours():
+    citysim = get_district()
+    buildings = citysim.findall('/*/Building')
+    target = buildings[0]
+
+    def ids(**policy):
+        return [b.get('id') for b in citysimtoenergyplus.select_neighbours(
+            buildings, target, **policy)]
+    assert ids() == ['B', 'C', 'D']
+    assert ids(max_distance=60) == ['B', 'C']
+    assert ids(min_height_ratio=0.5) == ['B', 'C']
+    assert ids(min_solid_angle=0.15) == ['B']
+    assert ids(min_solid_angle=0.05) == ['B', 'C']
+    assert ids(max_distance=10, min_height_ratio=0.5) == ['B']
+
+
+def test_add_shading_max_distance():
+    citysim = get_district()
+    target = citysimtoenergyplus.find_building('A', citysim)
+    idf = construct_empty_idf()
+    citysimtoenergyplus.add_shading(citysim, target, idf, max_distance=60)
+    names = [s.Name for s in shadingstore.shading_surfaces(idf)]
+    assert len(names) == 4 + 4 + 3
+    assert set(name[:len('ShadingBX')] for name in names
+               if not name.endswith('R0')) == set(['ShadingBB', 'ShadingBC'])
+    assert [name for name in names if name.endswith('R0')] == [
+        'ShadingBAR0', 'ShadingBBR0', 'ShadingBCR0']
+
+
+def test_add_shading_levels():
+    citysim = get_district()
+    target = citysimtoenergyplus.find_building('A', citysim)
+    idf = construct_empty_idf()
+    citysimtoenergyplus.add_shading(citysim, target, idf, near_distance=10,
+                                    far_distance=100)
+    names = [s.Name for s in shadingstore.shading_surfaces(idf)]
+    # B is low (3 m for 10 m), so it is simplified beyond 3 m. C is high
+    # (30 m), so it is a hull, not a box, at 50 m. D is a box.
+    assert [name for name in names if 'W' in name] == [
+        'ShadingBBL1W0', 'ShadingBBL1W1', 'ShadingBBL1W2', 'ShadingBBL1W3',
+        'ShadingBCL1W0', 'ShadingBCL1W1', 'ShadingBCL1W2', 'ShadingBCL1W3',
+        'ShadingBDL2W0', 'ShadingBDL2W1', 'ShadingBDL2W2', 'ShadingBDL2W3']
+    assert [name for name in names if 'W' not in name] == [
+        'ShadingBAR0', 'ShadingBBL1R', 'ShadingBCL1R', 'ShadingBDL2R']
+    d = shadingstore.find_shading(idf, 'ShadingBDL2R')
+    assert abs(polygons.area(shadingstore.vertices(d).tolist()) - 100) < 1e-6
+
+
+def get_district():
+    """four box buildings in a row along the x axis, A is 10 m high"""
+    def box(id, x, size, height):
+        corners = [(x, 0), (x + size, 0), (x + size, size), (x, size)]
+        walls = []
+        for i in range(4):
+            (x0, y0), (x1, y1) = corners[i], corners[(i + 1) % 4]
+            walls.append((i, [(x1, y1, height), (x0, y0, height),
+                              (x0, y0, 0), (x1, y1, 0)]))
+        roof = [(cx, cy, height) for cx, cy in corners]
+
+        def surface(tag, id, vertices):
+            return '<%s id="%s">%s</%s>' % (tag, id, ''.join(
+                '<V%i x="%s" y="%s" z="%s"/>' % ((i,) + v)
+                for i, v in enumerate(vertices)), tag)
+        return '<Building id="%s"><Zone id="%s">%s%s</Zone></Building>' % (
+            id, id, ''.join(surface('Wall', i, v) for i, v in walls),
+            surface('Roof', 0, roof))
+    return etree.ElementTree(etree.XML(
+        '<CitySim><District>%s</District></CitySim>' % ''.join([
+            box('A', 0, 10, 10), box('B', 15, 10, 3),
+            box('C', 60, 10, 30), box('D', 200, 10, 10)])))
+
+
 def close_enough(f1, f2):
     return abs(f1 - f2) < 0.01
 
@@ -0,0 +1,72 @@
+import coplanar
+import numpy as np
+
+
+def square(x, y, width=1, height=1):
+    return [(x, y, 0), (x + width, y, 0), (x + width, y + height, 0),
+            (x, y + height, 0)]
+
+
+def shoelace(polygon):
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0, _), (x1, y1, _)
+                   in zip(polygon, polygon[1:] + polygon[:1]))) / 2.0
+
+
+def test_group_by_plane():
+    above = [(0, 0, 1), (1, 0, 1), (1, 1, 1)]
+    facing_down = [(0, 0, 0), (0, 1, 0), (1, 0, 0)]
+    line = [(0, 0, 0), (1, 0, 0), (2, 0, 0)]
+    groups = coplanar.group_by_plane(
+        [square(0, 0), above, square(5, 5), facing_down, line])
+    assert groups == [[0, 2]]
+    assert coplanar.group_by_plane([square(0, 0), square(1, 0)],
+                                   keys=['a', 'b']) == []
+
+
+def test_union_side_by_side():
+    pieces = coplanar.union([square(0, 0), square(1, 0), square(2, 0)])
+    assert pieces == [[(0, 0, 0), (3, 0, 0), (3, 1, 0), (0, 1, 0)]]
+
+
+def test_union_l_shape_with_t_junction():
+    pieces = coplanar.union([square(0, 0), square(1, 0, 2), square(0, 1)])
+    assert len(pieces) == 2
+    assert sum(shoelace(piece) for piece in pieces) == 4
+    for piece in pieces:
+        assert coplanar.is_convex(range(len(piece)), PointsOf(piece))
+
+
+def test_union_leaves_overlaps_and_holes():
+    assert coplanar.union([square(0, 0, 2, 2), square(1, 1)]) is None
+    ring = [square(x, y) for x, y in [(0, 0), (1, 0), (2, 0), (0, 1),
+                                       (2, 1), (0, 2), (1, 2), (2, 2)]]
+    assert coplanar.union(ring) is None
+
+
+def test_union_tolerance():
+    nearly = [(1.001, 0, 0), (2, 0, 0), (2, 1, 0), (1.001, 1, 0)]
+    assert len(coplanar.union([square(0, 0), nearly])) == 1
+    # not touching at this tolerance
+    assert len(coplanar.union([square(0, 0), nearly],
+                              tolerance=0.0001)) == 2
+
+
+def test_split():
+    l_shape = [(0, 0, 0), (4, 0, 0), (4, 1, 0), (1, 1, 0), (1, 3, 0),
+               (0, 3, 0)]
+    pieces = coplanar.split(l_shape)
+    assert len(pieces) == 2
+    assert sum(shoelace(piece) for piece in pieces) == 6
+    for piece in pieces:
+        assert coplanar.is_convex(range(len(piece)), PointsOf(piece))
+    assert coplanar.split(square(0, 0)) == [square(0, 0)]
+
+
+class PointsOf(coplanar.PlanePoints):
+    '''the points of a single polygon in the xy plane'''
+
+    def __init__(self, polygon):
+        coplanar.PlanePoints.__init__(self, (0, 0, 0), np.array((0, 0, 1.0)),
+                                      coplanar.TOLERANCE)
+        for vertex in polygon:
+            self.add(vertex)
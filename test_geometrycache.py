@@ -0,0 +1,35 @@
+import geometrycache
+import os
+import time
+
+
+def square(x):
+    return [(x, 0, 0), (x, 1, 0), (x, 1, 1), (x, 0, 1)]
+
+
+def test_geometry_hash():
+    surfaces = [('Wall', 'A', square(0)), ('Shading', 'B', square(1))]
+    key = geometrycache.geometry_hash('test', surfaces, (1, 'x'))
+    noisy = [('SHADING', 'b', [(1 + 1e-6, 0, 0)] + square(1)[1:]),
+             ('WALL', 'a', square(0))]
+    assert geometrycache.geometry_hash('test', noisy, (1, 'x')) == key
+    moved = [('Wall', 'A', square(0)), ('Shading', 'B', square(2))]
+    assert geometrycache.geometry_hash('test', moved, (1, 'x')) != key
+    assert geometrycache.geometry_hash('test', surfaces, (2, 'x')) != key
+    assert geometrycache.geometry_hash('other', surfaces, (1, 'x')) != key
+
+
+def test_load_store_evict(tmpdir):
+    folder = str(tmpdir)
+    assert geometrycache.load('a', folder) is None
+    for key in 'abc':
+        geometrycache.store(key, [key, 1.5], folder, max_entries=2)
+        # file times must differ for the least recently used order
+        used = time.time() - 1000 + ord(key)
+        os.utime(geometrycache.cache_path(key, folder), (used, used))
+    assert geometrycache.load('a', folder) is None
+    assert geometrycache.load('b', folder) == ['b', 1.5]
+    # 'b' was used last, so 'c' is evicted
+    geometrycache.store('d', [], folder, max_entries=2)
+    assert geometrycache.load('c', folder) is None
+    assert geometrycache.load('b', folder) == ['b', 1.5]
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import geometrycheck
+import iddregistry
+import lod
+import polygons
+import shadingstore
+from lxml import etree
+
+square = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+
+
+def test_check():
+    duplicate = [(0, 0, 0), (1, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+    collinear = [(0, 0, 0), (0.5, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+    bent = [(0, 0, 0), (1, 0, 0), (1, 1, 0.1), (0, 1, 0)]
+    crossed = [(0, 0, 0), (2, 2, 0), (2, 0, 0), (0, 1, 0)]
+    line = [(0, 0, 0), (1, 0, 0), (2, 0, 0)]
+    flags = geometrycheck.check(*polygons.pack(
+        [square, duplicate, collinear, bent, crossed, line, []]))
+    assert flags.tolist() == [0,
+                              geometrycheck.DUPLICATE_VERTICES,
+                              geometrycheck.COLLINEAR_VERTICES,
+                              geometrycheck.NON_PLANAR,
+                              geometrycheck.SELF_INTERSECTING,
+                              geometrycheck.DEGENERATE
+                              | geometrycheck.COLLINEAR_VERTICES,
+                              geometrycheck.DEGENERATE]
+
+
+def test_winding():
+    walls, roof, floor = lod.prism([(0, 0), (4, 0), (4, 3), (0, 3)], 0, 3)
+    surfaces = walls + [roof, floor]
+    surfaces[1] = surfaces[1][::-1]
+    flags = geometrycheck.check(*polygons.pack(surfaces), zones=['z'] * 6)
+    assert flags.tolist() == [0, geometrycheck.WRONG_WINDING, 0, 0, 0, 0]
+    # no zones, no winding
+    assert not geometrycheck.check(*polygons.pack(surfaces)).any()
+
+
+def test_check_polygons_repair():
+    duplicate = [(0, 0, 0), (1, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+    collinear = [(0, 0, 0), (0.5, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0)]
+    bent = [(0, 0, 0), (1, 0, 0), (1, 1, 0.1), (0, 1, 0)]
+    line = [(0, 0, 0), (1, 0, 0), (2, 0, 0)]
+    report, repaired = geometrycheck.check_polygons(
+        [duplicate, collinear, bent, line], keys='abcd', repair=True)
+    assert report.removed == ['d']
+    assert report.invalid() == ['d']
+    assert report.problems()['b'] == ['collinear vertices']
+    assert repaired[0].tolist() == [list(v) for v in square]
+    assert repaired[1].tolist() == [list(v) for v in square]
+    assert not geometrycheck.check(*polygons.pack([repaired[2]])).any()
+    assert 'removed: d' in str(report)
+
+
+def test_check_citysim():
+    with open(os.path.join('testing', 'RevitModel.xml'), 'r') as f:
+        citysim = etree.parse(f)
+    # the floors of these buildings face into the zones
+    report = geometrycheck.check_citysim(citysim)
+    assert sorted(report.problems()) == [
+        ('1158832', 'Floor', '28'), ('1158897', 'Floor', '37'),
+        ('1158958', 'Floor', '46'), ('1159017', 'Floor', '55')]
+    before = [v.get('x') for v in citysim.find(
+        '/District/Building/Zone/Floor[@id="28"]')]
+    report = geometrycheck.check_citysim(citysim, repair=True)
+    after = [v.get('x') for v in citysim.find(
+        '/District/Building/Zone/Floor[@id="28"]')]
+    assert after == before[::-1]
+    assert not geometrycheck.check_citysim(citysim).problems()
+
+
+def test_check_idf():
+    idf = iddregistry.read_idf('', os.path.join('testing', 'Energy+.idd'))
+    shadingstore.shading_store(idf).extend([
+        ('Good', square), ('Line', [(0, 0, 0), (1, 0, 0), (2, 0, 0)]),
+        ('Duplicate', square + square[-1:])])
+    report = geometrycheck.check_idf(idf, repair=True)
+    assert report.removed == [(shadingstore.KEY, 'Line')]
+    assert sorted(s.Name for s in shadingstore.shading_surfaces(idf)) == [
+        'Duplicate', 'Good']
+    assert np.allclose(shadingstore.vertices(
+        shadingstore.find_shading(idf, 'Duplicate')), square)
@@ -0,0 +1,55 @@
+import numpy as np
+import geometrymemo
+
+floor = [(0, 0, 0), (2, 0, 0), (2, 3, 0), (0, 3, 0)]
+south_wall = [(0, 0, 0), (4, 0, 0), (4, 0, 2.5), (0, 0, 2.5)]
+gable = [(0, 0, 0), (4, 0, 0), (4, 0, 2), (2, 0, 3), (0, 0, 2)]
+
+
+def test_properties():
+    memo = geometrymemo.GeometryMemo()
+    props = memo.properties([floor, south_wall, gable])
+    assert np.allclose(props.area, [6, 10, 10])
+    assert np.allclose(props.normal[1], [0, -1, 0])
+    assert np.allclose(props.tilt, [0, 90, 90])
+    assert props.rectangular.tolist() == [True, True, False]
+    assert (memo.hits, memo.misses) == (0, 3)
+    # only the same vertices find the same polygon
+    noisy = [(x + 1e-9, y, z) for x, y, z in south_wall]
+    again = memo.properties([noisy, floor, np.array(south_wall)])
+    assert (memo.hits, memo.misses) == (2, 4)
+    assert np.allclose(again.area, [10, 6, 10])
+    assert memo.properties([]).area.shape == (0,)
+
+
+def test_lru():
+    memo = geometrymemo.GeometryMemo(max_entries=2)
+    memo.properties([floor, south_wall])
+    memo.properties([floor])  # south_wall is the least recently used
+    memo.properties([gable])
+    assert len(memo) == 2
+    memo.properties([floor])
+    assert memo.stats() == {'hits': 2, 'misses': 3, 'size': 2}
+    memo.properties([south_wall])
+    assert memo.misses == 4
+    memo.clear()
+    assert memo.stats() == {'hits': 0, 'misses': 0, 'size': 0}
+
+
+def test_area():
+    memo = geometrymemo.GeometryMemo()
+    assert np.isclose(memo.area(gable), 10)
+    assert (len(memo), memo.misses) == (1, 1)  # only the area is computed
+    assert np.isclose(memo.area(np.array(gable)), 10)
+    assert (memo.hits, memo.misses) == (1, 1)
+    # the other properties are computed when they are needed
+    props = memo.properties([gable, floor])
+    assert np.allclose(props.area, [10, 6])
+    assert np.allclose(props.tilt, [90, 0])
+    assert (memo.hits, memo.misses) == (1, 3)
+    assert np.isclose(memo.area(floor), 6)
+    assert (len(memo), memo.hits) == (2, 2)
+    memo = geometrymemo.GeometryMemo(max_entries=1)
+    memo.area(gable)
+    memo.area(floor)
+    assert len(memo) == 1
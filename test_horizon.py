@@ -0,0 +1,40 @@
+import horizon
+import math
+
+
+def box(x, y, width, depth, height):
+    return [(x + dx, y + dy, z) for dx in (0, width) for dy in (0, depth)
+            for z in (0, height)]
+
+
+def test_horizon():
+    # 100 m north and 50 m east, seen from 10 m above the ground
+    north = box(-5, 100, 10, 10, 30)
+    east = box(50, -10, 10, 20, 30)
+    thetas = horizon.horizon([north, east], (0, 0, 10), 10)
+    assert len(thetas) == 36
+    assert abs(thetas[0] - math.degrees(math.atan2(20, 100))) < 1e-9
+    assert abs(thetas[9] - math.degrees(math.atan2(20, 50))) < 1e-9
+    assert thetas[18] == 0
+    assert [i for i, theta in enumerate(thetas) if theta > 0] == [
+        0, 8, 9, 10]
+
+
+def test_horizon_sectors():
+    # a narrow building on the border between two sectors is in both
+    angle = math.radians(5)
+    narrow = box(100 * math.sin(angle), 100 * math.cos(angle), 0.5, 0.5, 10)
+    thetas = horizon.horizon([narrow], (0, 0, 0), 10)
+    assert thetas[0] > 0 and thetas[1] > 0
+    # the closest point in the sector counts, not the middle
+    wide = box(-30, 50, 60, 10, 10)
+    thetas = horizon.horizon([wide], (0, 0, 0), 10)
+    assert abs(thetas[3] - math.degrees(math.atan2(
+        10, 50 / math.cos(math.radians(25))))) < 1e-9
+    assert abs(thetas[3] - thetas[-3]) < 1e-9
+
+
+def test_horizon_ignored():
+    around = box(-10, -10, 20, 20, 30)
+    low = box(50, 0, 10, 10, 5)
+    assert horizon.horizon([around, low, []], (0, 0, 10), 30) == [0] * 12
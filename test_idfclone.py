@@ -0,0 +1,35 @@
+import idfclone
+
+
+def test_clone_leaves_template_alone(read_model):
+    template = read_model()
+    before = template.idfstr()
+    idf = idfclone.clone(template)
+    assert idf.idfstr() == before
+    idf.idfobjects['ZONE'][0].Name = 'Renamed'
+    idf.newidfobject('ZONE').Name = 'New'
+    idf.removeidfobject(idf.idfobjects['FENESTRATIONSURFACE:DETAILED'][0])
+    idf.newidfobject('SHADING:BUILDING:DETAILED').Name = 'NewShading'
+    assert template.idfstr() == before
+    assert idf.idfstr() != before
+    assert [b.obj for b in idf.idfobjects['ZONE']] == idf.model.dt['ZONE']
+
+
+def test_clone_of_clone(read_model):
+    template = read_model()
+    idf = idfclone.clone(idfclone.clone(template))
+    assert idf.idfstr() == template.idfstr()
+    assert idf.idfobjects['ZONE'][0] is not template.idfobjects['ZONE'][0]
+
+
+def test_template_changes_stay_out_of_clone(read_model):
+    template = read_model()
+    idf = idfclone.clone(template)
+    before = idf.idfstr()
+    template.newidfobject('SCHEDULE:CONSTANT').Name = 'LeakTest'
+    template.idfobjects['ZONE'][0].Name = 'Renamed'
+    template.removeidfobject(
+        template.idfobjects['FENESTRATIONSURFACE:DETAILED'][0])
+    assert idf.idfstr() == before
+    assert not idf.idfobjects['SCHEDULE:CONSTANT']
+    assert template.idfobjects['SCHEDULE:CONSTANT'][0].Name == 'LeakTest'
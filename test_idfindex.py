@@ -0,0 +1,101 @@
+import idfindex
+import iddregistry
+import os
+
+
+def test_getobject_same_as_eppy(read_model):
+    idf = read_model()
+    for key, objects in idf.idfobjects.items():
+        for obj in objects:
+            if 'Name' in obj.objls:
+                assert idfindex.getobject(idf, key, obj.Name.lower()) is \
+                    idf.getobject(key, obj.Name)
+    assert idfindex.getobject(idf, 'ZONE', 'no such zone') is None
+
+
+def test_newidfobject_named_later(read_model):
+    idf = read_model()
+    assert not idfindex.getobject(idf, 'CONSTRUCTION', 'NewConstruction')
+    construction = idfindex.newidfobject(idf, 'CONSTRUCTION')
+    construction.Name = 'NewConstruction'
+    assert idfindex.getobject(idf, 'CONSTRUCTION',
+                              'NEWCONSTRUCTION') is construction
+
+
+def test_removeidfobject(read_model):
+    idf = read_model()
+    zone = idf.idfobjects['ZONE'][0]
+    assert idfindex.getobject(idf, 'ZONE', zone.Name) is zone
+    idfindex.removeidfobject(idf, zone)
+    assert idfindex.getobject(idf, 'ZONE', zone.Name) is None
+    assert zone not in idf.idfobjects['ZONE']
+
+
+def test_copyidfobject(read_model):
+    idf = read_model()
+    other = read_model()
+    zone = other.idfobjects['ZONE'][0]
+    idfindex.removeidfobject(idf, idfindex.getobject(idf, 'ZONE', zone.Name))
+    copy = idfindex.copyidfobject(idf, zone)
+    assert copy is not zone
+    assert idfindex.getobject(idf, 'ZONE', zone.Name) is copy
+
+
+def test_changes_behind_the_index(read_model):
+    idf = read_model()
+    assert idfindex.getobject(idf, 'CONSTRUCTION', 'Direct') is None
+    construction = idf.newidfobject('CONSTRUCTION')
+    construction.Name = 'Direct'
+    assert idfindex.getobject(idf, 'CONSTRUCTION', 'Direct') is construction
+    construction.Name = 'Renamed'
+    assert idfindex.getobject(idf, 'CONSTRUCTION', 'Direct') is None
+    assert idfindex.getobject(idf, 'CONSTRUCTION', 'Renamed') is construction
+
+
+def test_removeidfobjects(read_model):
+    idf = read_model()
+    zones = idf.idfobjects['ZONE']
+    zone = zones[0]
+    windows = idf.idfobjects['FENESTRATIONSURFACE:DETAILED']
+    nwindows = len(windows)
+    removed = idfindex.removeidfobjects(idf, [
+        ('zone', zone.Name.lower()),
+        ('FENESTRATIONSURFACE:DETAILED', windows[0].Name),
+        ('FENESTRATIONSURFACE:DETAILED', windows[1].Name),
+        ('ZONE', 'no such zone')])
+    assert len(removed) == 3
+    assert zone not in idf.idfobjects['ZONE']
+    assert len(idf.idfobjects['FENESTRATIONSURFACE:DETAILED']) == nwindows - 2
+    assert idfindex.getobject(idf, 'ZONE', zone.Name) is None
+    assert [o.obj for o in idf.idfobjects['FENESTRATIONSURFACE:DETAILED']] \
+        == idf.model.dt['FENESTRATIONSURFACE:DETAILED']
+
+
+def test_mergeidf(read_model):
+    left = read_model()
+    right = read_model()
+    for key in right.idfobjects:
+        if key not in ('ZONE', 'OUTPUT:VARIABLE'):
+            del right.idfobjects[key][:]
+            del right.model.dt[key][:]
+    zone = right.idfobjects['ZONE'][0]
+    zone.X_Origin = 42
+    nzones = len(left.idfobjects['ZONE'])
+    noutputs = len(left.idfobjects['OUTPUT:VARIABLE'])
+    idfindex.mergeidf(left, right)
+    assert len(left.idfobjects['ZONE']) == nzones
+    assert idfindex.getobject(left, 'ZONE', zone.Name).X_Origin == 42
+    assert idfindex.getobject(left, 'ZONE', zone.Name) is not zone
+    assert len(left.idfobjects['OUTPUT:VARIABLE']) == 2 * noutputs
+
+
+def test_mergeidf_unique_objects():
+    idd_path = os.path.join('testing', 'Energy+.idd')
+    with open(os.path.join('testing', 'test_template.idf'), 'r') as f:
+        left = iddregistry.read_idf(f.read(), idd_path)
+    right = iddregistry.read_idf('Version, 8.5; Timestep, 6;', idd_path)
+    idfindex.mergeidf(left, right)
+    assert [t.Number_of_Timesteps_per_Hour
+            for t in left.idfobjects['TIMESTEP']] == [6]
+    assert len(left.idfobjects['VERSION']) == 1
+    assert left.model.dt['TIMESTEP'] == [left.idfobjects['TIMESTEP'][0].obj]
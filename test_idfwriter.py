@@ -0,0 +1,26 @@
+import addfmutoidf
+import idfwriter
+from StringIO import StringIO
+
+
+def write(idf, buffer_size=idfwriter.BUFFER_SIZE):
+    out = StringIO()
+    idfwriter.write_idf(idf, out, buffer_size)
+    return out.getvalue()
+
+
+def test_same_as_idfstr(read_model):
+    idf = read_model()
+    assert write(idf) == idf.idfstr()
+    assert write(idf, buffer_size=1) == idf.idfstr()
+
+
+def test_same_as_idfstr_odd_objects(read_model):
+    idf = read_model()
+    addfmutoidf.generate_interface(idf)
+    idf.newidfobject('CONSTRUCTION')
+    window = idf.idfobjects['FENESTRATIONSURFACE:DETAILED'][0]
+    window.obj[-1] = 1.0 / 3
+    window.obj.append('extra')
+    idf.idfobjects['ZONE'][0].obj.append(0.1)
+    assert write(idf) == idf.idfstr()
@@ -0,0 +1,48 @@
+import lod
+import polygons
+
+
+def test_level():
+    assert lod.level(100, 10, 10) == lod.DETAILED
+    assert lod.level(10, 10, 10, 20, 50) == lod.DETAILED
+    assert lod.level(30, 10, 10, 20, 50) == lod.HULL
+    assert lod.level(60, 10, 10, 20, 50) == lod.SECTORS
+    # twice as high: keeps the detail twice as far
+    assert lod.level(30, 20, 10, 20, 50) == lod.DETAILED
+    assert lod.level(60, 20, 10, 20, 50) == lod.HULL
+    assert lod.level(60, 10, 10, far_distance=50) == lod.SECTORS
+
+
+def test_convex_hull():
+    points = [(0, 0, 0), (2, 0, 0), (1, 1, 5), (2, 2, 0), (0, 2, 3),
+              (2, 1, 0)]
+    assert lod.convex_hull(points) == [(0, 0), (2, 0), (2, 2), (0, 2)]
+
+
+def test_sector_footprint():
+    triangle = [(0, 0, 0), (4, 0, 0), (0, 3, 0)]
+    box = lod.sector_footprint(triangle)
+    assert len(box) == 4
+    assert all(lod.close(a, b, 1e-12)
+               for a, b in zip(box, [(4, 0), (4, 3), (0, 3), (0, 0)]))
+    octagon = lod.sector_footprint(triangle, 8)
+    assert len(octagon) <= 8
+    assert lod.area(octagon) < 12
+
+
+def test_envelope():
+    points = [(0, 0, 0), (4, 0, 0), (0, 3, 0), (0, 0, 10), (4, 0, 10),
+              (0, 3, 10)]
+    walls, roof, floor = lod.envelope(points, lod.HULL)
+    assert len(walls) == 3
+    assert roof == [(0, 0, 10), (4, 0, 10), (0, 3, 10)]
+    assert floor == [(0, 3, 0), (4, 0, 0), (0, 0, 0)]
+    # counterclockwise seen from outside: the normals point away
+    for polygon in walls + [roof, floor]:
+        normal = polygons.np_unit_normal(*polygon[:3])
+        middle = [sum(c) / len(polygon) for c in zip(*polygon)]
+        assert sum(n * (m - c) for n, m, c in zip(
+            normal, middle, (4 / 3.0, 1, 5))) > 0
+    walls, roof, floor = lod.envelope(points, lod.SECTORS)
+    assert len(walls) == 4
+    assert abs(lod.area([p[:2] for p in roof]) - 12) < 1e-12
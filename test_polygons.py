@@ -0,0 +1,65 @@
+import polygons
+import numpy as np
+
+
+floor = [(0, 0, 0), (2, 0, 0), (2, 3, 0), (0, 3, 0)]
+south_wall = [(0, 0, 0), (4, 0, 0), (4, 0, 2.5), (0, 0, 2.5)]
+west_wall = [(0, 1, 0), (0, 0, 0), (0, 0, 3), (0, 1, 3)]
+triangle = [(0, 0, 0), (1, 0, 0), (0, 1, 0)]
+line = [(0, 0, 0), (1, 1, 1), (2, 2, 2)]
+
+
+def test_batch_properties():
+    props = polygons.batch_properties(*polygons.pack(
+        [floor, south_wall, west_wall, triangle, line, []]))
+    assert np.allclose(props.area[:4], [6, 10, 3, 0.5])
+    assert np.isnan(props.area[4])
+    assert props.area[5] == 0
+    assert np.allclose(props.normal[1], [0, -1, 0])
+    assert np.allclose(props.centroid[1], [2, 0, 1.25])
+    assert np.allclose(props.tilt[:3], [0, 90, 90])
+    assert np.allclose(props.azimuth[1:3], [180, 270])
+
+
+def test_wrappers():
+    for polygon in (floor, south_wall, west_wall, triangle):
+        assert np.isclose(polygons.area(polygon),
+                          polygons.batch_areas(*polygons.pack([polygon]))[0])
+    assert np.allclose(polygons.np_unit_normal(*floor[:3]), (0, 0, 1))
+    assert polygons.np_poly_area(floor[:2]) == 0
+
+
+def test_batch_vertices_by_area_ratio():
+    gable = [(0, 0, 0), (4, 0, 0), (4, 0, 2), (2, 0, 3), (0, 0, 2)]
+    vertices, offsets = polygons.pack([floor, south_wall, gable])
+    windows = polygons.batch_vertices_by_area_ratio(
+        vertices, offsets, [0.25, 0.5, 0.3])
+    areas = polygons.batch_areas(windows, offsets)
+    assert np.allclose(areas, [1.5, 5, 3])
+    assert np.allclose(polygons.unpack(windows, offsets)[0],
+                       [(0.5, 0.75, 0), (1.5, 0.75, 0),
+                        (1.5, 2.25, 0), (0.5, 2.25, 0)])
+
+
+def test_batch_area_centroids():
+    quad = [(0, 0, 0), (3, 0, 0), (3, 0, 1), (0, 0, 3)]
+    vertices, offsets = polygons.pack([south_wall, triangle, quad, line])
+    centroids = polygons.batch_area_centroids(vertices, offsets)
+    assert np.allclose(centroids[:3], [(2, 0, 1.25), (1 / 3.0, 1 / 3.0, 0),
+                                       (1.25, 0, 13 / 12.0)])
+    # no area: the average of the vertices
+    assert np.allclose(centroids[3], (1, 1, 1))
+
+
+def test_fan_indices():
+    assert polygons.fan_indices(3) == [(0, 1, 2)]
+    assert polygons.fan_indices(4) == [(0, 1, 2, 3)]
+    assert polygons.fan_indices(5) == [(0, 1, 2, 3), (0, 3, 4)]
+    assert polygons.fan_indices(6) == [(0, 1, 2, 3), (0, 3, 4, 5)]
+
+
+def test_drop_collinear():
+    polygon = [(0, 0, 0), (1, 0, 0), (2, 0, 0), (2, 1, 0), (0, 1, 0)]
+    assert np.allclose(polygons.drop_collinear(polygon),
+                       [(0, 0, 0), (2, 0, 0), (2, 1, 0), (0, 1, 0)])
+    assert len(polygons.drop_collinear(triangle)) == 3
@@ -0,0 +1,120 @@
+import raycast
+import numpy as np
+
+
+def square(x):
+    return [(x, 0, 0), (x, 1, 0), (x, 1, 1), (x, 0, 1)]
+
+
+def test_first_hits():
+    scene = raycast.Scene([square(1), square(2), square(3)], leaf_size=1)
+    hits, ts = scene.first_hits([(0, 0.5, 0.5)] * 4,
+                                [(1, 0, 0), (-1, 0, 0), (1, 0, 0),
+                                 (1, 0, 0.9)],
+                                exclude=[-1, -1, 0, -1])
+    assert hits.tolist() == [0, -1, 1, -1]
+    assert ts[:3].tolist() == [1, np.inf, 2]
+
+
+def test_first_hits_edges():
+    # on the diagonal of the fan triangulation and on the outer edge
+    scene = raycast.Scene([square(1)])
+    hits, _ = scene.first_hits([(0, 0.5, 0.5), (0, 1, 0.5)],
+                               [(1, 0, 0), (1, 0, 0)])
+    assert hits.tolist() == [0, 0]
+
+
+def polygon_intersection(origin, direction, polygon):
+    """reference for first_hits: the distance along the ray to the plane of
+    the (convex) polygon, if the point there is on the polygon (the angles
+    to its vertices add up to 2 pi)"""
+    direction = direction / np.linalg.norm(direction)
+    normal = np.cross(polygon[0] - polygon[1], polygon[0] - polygon[2])
+    normal /= np.linalg.norm(normal)
+    if abs(np.dot(direction, normal)) < 1e-12:
+        return None
+    t = np.dot(normal, polygon[0] - origin) / np.dot(direction, normal)
+    if t < 0:
+        return None
+    point = origin + t * direction
+    angles = 0
+    for v1, v2 in zip(polygon, np.roll(polygon, -1, axis=0)):
+        v1, v2 = v1 - point, v2 - point
+        m = np.linalg.norm(v1) * np.linalg.norm(v2)
+        if m < 1e-12:
+            return t
+        angles += np.arccos(np.dot(v1, v2) / m)
+    return t if abs(angles - 2 * np.pi) < 1e-12 else None
+
+
+def test_same_as_polygon_intersection():
+    rnd = np.random.RandomState(0)
+    polygons = []
+    for i in range(50):
+        corner = rnd.uniform(-10, 10, 3)
+        a, b = rnd.uniform(-2, 2, 3), rnd.uniform(-2, 2, 3)
+        polygons.append(np.array([corner, corner + a, corner + a + b,
+                                  corner + b]))
+    scene = raycast.Scene(polygons, leaf_size=4)
+    origins = rnd.uniform(-10, 10, (200, 3))
+    directions = rnd.uniform(-1, 1, (200, 3))
+    hits, _ = scene.first_hits(origins, directions)
+    for origin, direction, hit in zip(origins, directions, hits):
+        ts = [(t, i) for i, t in
+              ((i, polygon_intersection(origin, direction, p))
+               for i, p in enumerate(polygons)) if t is not None]
+        assert hit == (min(ts)[1] if ts else -1)
+
+
+def test_sample_points():
+    middle = raycast.sample_points(square(1))
+    assert middle.tolist() == [[1, 0.5, 0.5]]
+    grid = raycast.sample_points(square(1), 2)
+    assert sorted(map(tuple, grid.tolist())) == [
+        (1, 0.25, 0.25), (1, 0.25, 0.75), (1, 0.75, 0.25), (1, 0.75, 0.75)]
+    triangle = raycast.sample_points([(0, 0, 0), (1, 0, 0), (0, 1, 0)], 3)
+    assert len(triangle) == 9
+    assert np.allclose(triangle.mean(axis=0), [1 / 3.0, 1 / 3.0, 0])
+
+
+def test_hits_between():
+    # square(2) is hidden from the middle of square(0) by the small square,
+    # not from the corners of square(0)
+    small = [(1, 0.4, 0.4), (1, 0.6, 0.4), (1, 0.6, 0.6), (1, 0.4, 0.6)]
+    polygons = [square(0), small, square(2)]
+    scene = raycast.Scene(polygons)
+    targets = [raycast.sample_points(polygons[2])]
+    middle = [(0, raycast.sample_points(polygons[0]))]
+    assert raycast.hits_between(scene, middle, targets) == set([1])
+    grid = [(0, raycast.sample_points(polygons[0], 2))]
+    assert raycast.hits_between(scene, grid, targets) == set([2])
+    assert raycast.hits_between(scene, middle + grid, targets,
+                                processes=2) == set([1, 2])
+
+
+def test_candidate_pairs():
+    # square(0) faces +x, square(2) faces -x, square(-1) is behind square(0)
+    facing = [(2, 0, 0), (2, 0, 1), (2, 1, 1), (2, 1, 0)]
+    low = [(5, 0, 0), (5, 0, 0.1), (5, 1, 0.1), (5, 1, 0)]
+    targets = [facing, square(2), square(-1), low]
+    pairs = raycast.candidate_pairs([square(0)], targets)
+    assert pairs.tolist() == [[True, False, False, True]]
+    pairs = raycast.candidate_pairs([square(0)], targets, two_sided=True)
+    assert pairs.tolist() == [[True, True, False, True]]
+    pairs = raycast.candidate_pairs([square(0)], targets, min_elevation=5)
+    assert pairs.tolist() == [[True, False, False, False]]
+
+
+def test_hits_between_pairs():
+    polygons = [square(0), square(1), square(2)]
+    scene = raycast.Scene(polygons)
+    sources = [(0, raycast.sample_points(polygons[0]))]
+    targets = [raycast.sample_points(p) for p in polygons[1:]]
+    assert raycast.hits_between(scene, sources, targets) == set([1])
+    pairs = np.array([[False, True]])
+    assert raycast.hits_between(scene, sources, targets, pairs=pairs) == set(
+        [1])
+    pairs = np.array([[False, False]])
+    assert raycast.hits_between(scene, sources, targets, processes=2,
+                                pairs=pairs) == set()
+
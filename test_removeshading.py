@@ -0,0 +1,42 @@
+import removeshading
+import shadingstore
+
+
+def add_boxes(idf):
+    '''add the walls and roofs of a ring of tall buildings around the
+    building of the model as shading surfaces'''
+    surfaces = []
+    for i, (x, y, height) in enumerate([
+            (-60, -40, 30), (-40, 30, 12), (10, 40, 25), (30, -20, 8),
+            (-10, -40, 20), (40, 20, 35), (-50, 0, 6), (20, -50, 15)]):
+        corners = [(x, y), (x + 8, y), (x + 8, y + 6), (x, y + 6)]
+        for j in range(4):
+            (x0, y0), (x1, y1) = corners[j], corners[(j + 1) % 4]
+            surfaces.append(('B%iW%i' % (i, j), [(x1, y1, height),
+                                                 (x0, y0, height),
+                                                 (x0, y0, 0), (x1, y1, 0)]))
+        surfaces.append(('B%iR' % i, [(cx, cy, height)
+                                      for cx, cy in corners]))
+    shadingstore.shading_store(idf).extend(surfaces)
+    return idf
+
+
+def kept(idf):
+    return sorted('%s' % s.Name for s in shadingstore.shading_surfaces(idf))
+
+
+def test_cull(read_model):
+    # the rays from the walls to the surfaces behind them leave through the
+    # roof of the building (not a building surface) and hit other surfaces,
+    # culling them keeps fewer surfaces, never others
+    for samples in (1, 2):
+        expected = kept(removeshading.remove_extra_shading(
+            add_boxes(read_model()), samples=samples))
+        assert 0 < len(expected) < len(kept(add_boxes(read_model())))
+        culled = [kept(removeshading.remove_extra_shading(
+            add_boxes(read_model()), samples=samples, cull=True, **options))
+            for options in [{}, {'two_sided': True}, {'min_elevation': 5}]]
+        for names in culled:
+            assert 0 < len(names) and set(names) <= set(expected)
+        assert set(culled[0]) <= set(culled[1])
+        assert set(culled[2]) <= set(culled[0])
@@ -0,0 +1,80 @@
+import collections
+import math
+import revittocitysim
+from revittocitysim import XYZ
+
+# stand-ins for the parts of a DPV ModelSnapshot used by the export
+Surface = collections.namedtuple('Surface', ['Id', 'Points', 'Orientation'])
+Snapshot = collections.namedtuple('Snapshot', ['Walls', 'Roofs', 'Floors',
+                                               'ShadingSurfaces'])
+
+
+def box(prefix, x0, y0, x1, y1, height):
+    '''the walls, roof and floor of a box as Surfaces'''
+    corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+    walls = []
+    for i in range(4):
+        (xa, ya), (xb, yb) = corners[i], corners[(i + 1) % 4]
+        walls.append(Surface('%s%i' % (prefix, i),
+                             [XYZ(xb, yb, height), XYZ(xa, ya, height),
+                              XYZ(xa, ya, 0), XYZ(xb, yb, 0)],
+                             XYZ(yb - ya, xa - xb, 0)))
+    roof = Surface('%s4' % prefix, [XYZ(x, y, height) for x, y in corners],
+                   XYZ(0, 0, 1))
+    floor = Surface('%s5' % prefix,
+                    [XYZ(x, y, 0) for x, y in reversed(corners)],
+                    XYZ(0, 0, -1))
+    return walls, roof, floor
+
+
+def snapshot(*shading):
+    '''a 10 x 10 x 10 m building at the origin with the shading buildings
+    (x0, y0, x1, y1, height)'''
+    walls, roof, floor = box('DpvWall:', 0, 0, 10, 10, 10)
+    surfaces = []
+    for i, bounds in enumerate(shading):
+        walls_i, roof_i, floor_i = box('DpvShadingSurface:%i:' % (i + 1),
+                                       *bounds)
+        surfaces.extend(walls_i + [roof_i, floor_i])
+    return Snapshot(walls, [roof], [floor], surfaces)
+
+
+def test_export_options():
+    assert revittocitysim.export_options([]) == {}
+    assert revittocitysim.export_options(
+        ['near_distance=50', 'far_distance=200.5', 'other=1', '',
+         'horizon_distance=500', 'horizon_resolution=5']) == {
+            'near_distance': 50.0, 'far_distance': 200.5,
+            'horizon_distance': 500.0, 'horizon_resolution': 5.0}
+
+
+def test_export_shading_surfaces_envelopes():
+    # 30 m and 90 m away: the convex hull and a box, the volume is the area
+    # of the roof times the height
+    buildings = list(revittocitysim.export_shading_surfaces(
+        snapshot((40, 0, 44, 6, 10), (100, 0, 102, 5, 10)),
+        near_distance=20, far_distance=60))
+    assert [b.get('id') for b in buildings] == ['1', '2']
+    for building, level, volume in zip(buildings, [1, 2], [240.0, 100.0]):
+        zone = building.find('Zone')
+        assert float(zone.get('volume')) == volume
+        prefix = 'DpvShadingSurface:%s:L%i' % (building.get('id'), level)
+        assert [w.get('ep_id') for w in zone.findall('Wall')] == [
+            '%sW%i' % (prefix, i) for i in range(4)]
+        assert zone.find('Roof').get('ep_id') == prefix + 'R'
+        assert [float(v.get('z')) for v in zone.find('Roof')] == [10.0] * 4
+        assert [float(v.get('z')) for v in zone.find('Floor')] == [0.0] * 4
+
+
+def test_export_far_field_obstructions():
+    dummy = revittocitysim.export_far_field_obstructions(snapshot())
+    assert [p.get('theta') for p in dummy] == ['2.0'] * 36
+    # the building 190 m east, 40 m higher than the middle of the building,
+    # is in the horizon. the one 30 m away isn't.
+    obstructions = revittocitysim.export_far_field_obstructions(
+        snapshot((40, 0, 44, 6, 50), (195, 0, 205, 10, 45)),
+        horizon_distance=100, resolution=10)
+    assert [float(p.get('phi')) for p in obstructions] == range(0, 360, 10)
+    thetas = [p.get('theta') for p in obstructions]
+    assert thetas[9] == '%.2f' % math.degrees(math.atan2(40, 190))
+    assert thetas[:9] + thetas[10:] == ['0.00'] * 35
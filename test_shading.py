@@ -0,0 +1,88 @@
+import random
+import iddregistry
+import shading
+import shadingstore
+import os
+
+
+idd_path = os.path.join('testing', 'Energy+.idd')
+
+
+def facade_grid(columns, storeys, width=1.0, height=3.0, seed=0):
+    '''return a list of (name, vertices) for the shading surfaces of
+    `columns` facades side by side, each a stack of `storeys` rectangles,
+    shuffled (see benchmarks/benchmark_shading.py)'''
+    surfaces = []
+    for i in range(columns):
+        x = 2 * width * i
+        for k in range(storeys):
+            z = height * k
+            surfaces.append(('Shading%iS%i' % (i, k),
+                             [(x, 50.0, z), (x, 50.0, z + height),
+                              (x + width, 50.0, z + height),
+                              (x + width, 50.0, z)]))
+    random.Random(seed).shuffle(surfaces)
+    return surfaces
+
+
+def model(surfaces):
+    idf = iddregistry.read_idf('', idd_path)
+    shadingstore.shading_store(idf).extend(surfaces)
+    return idf
+
+
+def test_simplify_merges_stacks():
+    idf = model(facade_grid(3, 4))
+    shading.simplify(idf)
+    surfaces = shadingstore.shading_surfaces(idf)
+    assert sorted(s.Name for s in surfaces) == [
+        'Shading0S3', 'Shading1S3', 'Shading2S3']
+    top = shadingstore.find_shading(idf, 'Shading1S3')
+    assert shadingstore.vertices(top).tolist() == [
+        [2, 50, 0], [2, 50, 12], [3, 50, 12], [3, 50, 0]]
+
+
+def test_simplify_keeps_gaps_and_orientation():
+    lower = [(0, 0, 0), (0, 0, 3), (1, 0, 3), (1, 0, 0)]
+    gap = [(0, 0, 4), (0, 0, 6), (1, 0, 6), (1, 0, 4)]
+    reversed_upper = [(1, 0, 3), (1, 0, 4), (0, 0, 4), (0, 0, 3)]
+    idf = model([('Lower', lower), ('Gap', gap),
+                 ('ReversedUpper', reversed_upper)])
+    shading.simplify(idf)
+    assert len(shadingstore.shading_surfaces(idf)) == 3
+
+
+def test_vertex_ids():
+    vertex_ids = shading.VertexIds(0.01)
+    a = vertex_ids((1.0, 2.0, 3.0))
+    assert vertex_ids((1.0, 2.0, 3.0 + 1e-9)) == a
+    assert vertex_ids((0.999999999, 2.0, 3.0)) == a  # neighbouring cube
+    assert vertex_ids((1.0, 2.0, 3.1)) != a
+
+
+def test_simplify_coplanar():
+    panels = [('Panel%i' % i, [(i, 0, 0), (i, 0, 3), (i + 1, 0, 3),
+                               (i + 1, 0, 0)]) for i in range(4)]
+    roof = [('Roof%i' % i, [(i, 0, 3), (i + 1, 0, 3), (i + 1, 1, 3),
+                            (i, 1, 3)]) for i in range(2)]
+    idf = model(panels + roof)
+    shading.simplify(idf, mode='coplanar')
+    surfaces = shadingstore.shading_surfaces(idf)
+    assert sorted(s.Name for s in surfaces) == ['Panel0', 'Roof0']
+    assert shadingstore.vertices(surfaces[0]).tolist() == [
+        [0, 0, 0], [0, 0, 3], [4, 0, 3], [4, 0, 0]]
+
+
+def test_simplify_cache(tmpdir, monkeypatch):
+    folder = str(tmpdir)
+    idf = model(facade_grid(3, 4))
+    shading.simplify(idf, cache_folder=folder)
+    expected = [(s.Name, shadingstore.vertices(s).tolist())
+                for s in shadingstore.shading_surfaces(idf)]
+    # the same geometry again: the stored result is applied
+    monkeypatch.setattr(shading, 'simplify_one_level', None)
+    again = model(facade_grid(3, 4))
+    shading.simplify(again, cache_folder=folder)
+    assert [(s.Name, shadingstore.vertices(s).tolist())
+            for s in shadingstore.shading_surfaces(again)] == expected
+
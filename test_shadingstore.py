@@ -0,0 +1,74 @@
+import idfclone
+import idfwriter
+import shadingstore
+from StringIO import StringIO
+
+
+def model_with_store(read_model):
+    idf = read_model()
+    shadingstore.shading_store(idf).extend(
+        ('ShadingB1W%i' % i, [(i, 0.1, 0), (i, 0.1, 3.5), (i + 1, 0.1, 3.5),
+                              (i + 1, 0.1, 0)])
+        for i in range(10))
+    return idf
+
+
+def write(idf):
+    out = StringIO()
+    idfwriter.write_idf(idf, out)
+    return out.getvalue()
+
+
+def test_write_without_flushing(read_model):
+    idf = model_with_store(read_model)
+    text = write(idf)
+    assert len(shadingstore.stored(idf)) == 10
+    assert 'ShadingB1W9' in text
+    assert text == idf.idfstr()  # flushes the store
+    assert len(shadingstore.stored(idf)) == 0
+    assert write(idf) == text
+
+
+def test_read_and_change_stored_shading(read_model):
+    idf = model_with_store(read_model)
+    nshading = len(read_model().idfobjects['SHADING:BUILDING:DETAILED'])
+    surfaces = shadingstore.shading_surfaces(idf)
+    assert len(surfaces) == nshading + 10
+    shading = shadingstore.find_shading(idf, 'shadingb1w3')
+    assert shading.Name == 'ShadingB1W3'
+    assert shading.vertices().shape == (4, 3)
+    shadingstore.set_vertices(shading, [(0, 0, 0), (0, 0, 1), (1, 0, 1)])
+    removed = shadingstore.remove_shading(
+        idf, ['ShadingB1W1', surfaces[0].Name])
+    assert removed == 2
+    assert len(shadingstore.stored(idf)) == 9
+    objects = idf.idfobjects['SHADING:BUILDING:DETAILED']
+    assert len(objects) == nshading + 8
+    names = [o.Name for o in objects]
+    assert 'ShadingB1W1' not in names
+    shading = objects[names.index('ShadingB1W3')]
+    assert shading.Number_of_Vertices == 3
+    assert [float(c) for c in shading.obj[-9:]] == [0, 0, 0, 0, 0, 1, 1, 0, 1]
+
+
+def test_clone_copies_store(read_model):
+    template = model_with_store(read_model)
+    idf = idfclone.clone(template)
+    assert write(idf) == write(template)
+    shadingstore.remove_shading(idf, ['ShadingB1W0'])
+    assert len(shadingstore.stored(template)) == 10
+
+
+def test_set_vertices_of_many_surfaces(read_model):
+    idf = model_with_store(read_model)
+    store = shadingstore.stored(idf)
+    for i in range(0, 10, 3):
+        store.set_vertices(i, [(i, 0, 0), (i, 0, 1), (i, 1, 1)])
+    assert store.vertices(3).tolist() == [[3, 0, 0], [3, 0, 1], [3, 1, 1]]
+    assert store.vertices(4).tolist()[0] == [4, 0.1, 0]
+    text = write(idf)
+    store.apply_edits()
+    assert not store.edits
+    assert len(store.coordinates) == 6 * 12 + 4 * 9
+    assert store.vertices(9).tolist()[2] == [9, 1, 1]
+    assert write(idf) == text
@@ -0,0 +1,53 @@
+import simplifycitysimgeometry
+from lxml import etree
+
+
+def scene(walls):
+    '''walls: a list of (type, GlazingRatio, z0, z1) for the walls of
+    a single zone, all in the same plane and stacked from z0 to z1'''
+    citysim = etree.Element('CitySim')
+    district = etree.SubElement(citysim, 'District')
+    zone = etree.SubElement(etree.SubElement(district, 'Building', id='1'),
+                            'Zone', id='1')
+    for i, (wall_type, ratio, z0, z1) in enumerate(walls):
+        wall = etree.SubElement(zone, 'Wall', id=str(i), type=wall_type,
+                                GlazingRatio=str(ratio))
+        for j, (x, z) in enumerate([(0, z0), (0, z1), (2, z1), (2, z0)]):
+            etree.SubElement(wall, 'V%i' % j, x=str(x), y='0', z=str(z))
+    return etree.ElementTree(citysim)
+
+
+def test_simplify():
+    citysim = scene([('1', 0.5, 3, 6), ('1', 0.2, 0, 3), ('1', 0.8, 6, 12),
+                     ('2', 0.5, 12, 15)])
+    simplifycitysimgeometry.simplify(citysim)
+    walls = citysim.findall('/District/Building/Zone/Wall')
+    assert [w.get('id') for w in walls] == ['2', '3']
+    merged = walls[0]
+    assert [float(v.get('z')) for v in merged] == [0, 12, 12, 0]
+    assert float(merged.get('Area')) == 24
+    # weighted by the areas of the walls: (3 * 0.5 + 3 * 0.2 + 6 * 0.8) / 12
+    assert abs(float(merged.get('GlazingRatio')) - 0.575) < 1e-9
+
+
+def test_group_walls():
+    citysim = scene([('1', 0, 0, 3), ('2', 0, 3, 6), ('1', 0, 6, 9)])
+    walls = citysim.findall('/District/Building/Zone/Wall')
+    groups = simplifycitysimgeometry.group_walls(walls)
+    assert [[w.get('id') for w in g] for g in groups] == [['0', '2'], ['1']]
+
+
+def test_simplify_coplanar():
+    citysim = scene([('1', 0.5, 0, 3), ('1', 0.2, 3, 6), ('1', 0.8, 6, 12)])
+    # a wall next to the stack, sharing part of its edge
+    zone = citysim.find('/District/Building/Zone')
+    wall = etree.SubElement(zone, 'Wall', id='3', type='1', GlazingRatio='0')
+    for j, (x, z) in enumerate([(2, 0), (2, 6), (4, 6), (4, 0)]):
+        etree.SubElement(wall, 'V%i' % j, x=str(x), y='0', z=str(z))
+    simplifycitysimgeometry.simplify(citysim, mode='coplanar')
+    walls = citysim.findall('/District/Building/Zone/Wall')
+    assert len(walls) == 2  # an L-shape, split into two convex pieces
+    assert sum(float(w.get('Area')) for w in walls) == 36
+    # (6 * 0.5 + 6 * 0.2 + 12 * 0.8 + 12 * 0) / 36
+    for w in walls:
+        assert abs(float(w.get('GlazingRatio')) - 13.8 / 36) < 1e-9
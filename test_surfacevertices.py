@@ -0,0 +1,31 @@
+import surfacevertices
+
+
+def test_vertices_cached(read_model):
+    idf = read_model()
+    wall = idf.idfobjects['WALL:DETAILED'][0]
+    vertices = surfacevertices.vertices(wall)
+    assert vertices.shape == (4, 3)
+    assert list(vertices[0]) == [float(c) for c in wall.obj[-12:-9]]
+    assert surfacevertices.vertices(wall) is vertices
+    assert not vertices.flags.writeable
+
+
+def test_vertices_follow_field_changes(read_model):
+    idf = read_model()
+    wall = idf.idfobjects['WALL:DETAILED'][0]
+    vertices = surfacevertices.vertices(wall)
+    wall.obj[-1] = '123.5'
+    changed = surfacevertices.vertices(wall)
+    assert changed is not vertices
+    assert changed[-1][2] == 123.5
+
+
+def test_set_vertices(read_model):
+    idf = read_model()
+    wall = idf.idfobjects['WALL:DETAILED'][0]
+    wall.Number_of_Vertices = 4
+    surfacevertices.set_vertices(wall, [(0, 0, 0), (1, 0, 0), (1, 0, 1)])
+    assert wall.Number_of_Vertices == 3
+    assert [float(c) for c in wall.obj[-9:]] == [0, 0, 0, 1, 0, 0, 1, 0, 1]
+    assert surfacevertices.vertices(wall).shape == (3, 3)
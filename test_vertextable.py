@@ -0,0 +1,13 @@
+import vertextable
+
+
+def test_add():
+    table = vertextable.VertexTable(0.01)
+    a = table.add((1.0, 2.0, 3.0))
+    assert table.add((1.0, 2.0, 3.005)) == a
+    assert table.add((0.999, 2.0, 3.0)) == a  # neighbouring cube
+    assert table.add((1.0, 2.0, 3.1)) != a
+    assert len(table) == 2
+    assert table.find((5, 5, 5)) is None
+    assert len(table) == 2
+
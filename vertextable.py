@@ -0,0 +1,79 @@
+'''
+vertextable.py
+
+A table of welded vertices.
+
+Surfaces of neighbouring buildings, stacked shading rectangles etc. share
+vertices, but their coordinates are only equal up to rounding. Comparing
+every vertex of a surface with every vertex of another (np.isclose) to
+find out whether they share an edge is quadratic. A VertexTable gives
+each distinct point an integer id instead: vertices closer than the
+tolerance get the same id, so shared vertices and edges can be compared
+as integers:
+
+    table = vertextable.VertexTable(tolerance)
+    ids = [table.add(vertex) for vertex in polygon]
+
+The vertices are hashed into cubes the size of the tolerance, so only the
+vertices in the same and the neighbouring cubes are compared.
+shading.find_stacks uses a VertexTable (shading.VertexIds) for the shading
+rectangles.
+'''
+import itertools
+import numpy as np
+
+# the distance (per coordinate, in m) below which vertices are the same
+TOLERANCE = 1e-4
+
+
+class VertexTable(object):
+    '''
+    give each vertex an integer id, the same id for vertices that are
+    closer than `tolerance` (per coordinate) or, if given, for which
+    same(vertex, other) is True. same must not match vertices further
+    apart than the tolerance. the first vertex added with an id is its
+    coordinates.
+    '''
+
+    def __init__(self, tolerance=TOLERANCE, same=None):
+        self.tolerance = tolerance
+        self.cell = tolerance or 1.0
+        self.same = same or self.within_tolerance
+        self.cubes = {}  # (i, j, k) -> [(vertex, id), ...]
+        self.points = []  # id -> vertex
+
+    def __len__(self):
+        return len(self.points)
+
+    def within_tolerance(self, vertex, other):
+        return all(abs(a - b) <= self.tolerance
+                   for a, b in zip(vertex, other))
+
+    def cube(self, vertex):
+        return tuple(int(np.floor(c / self.cell)) for c in vertex)
+
+    def add(self, vertex):
+        '''return the id of the vertex, adding it if it is new'''
+        vid = self.find(vertex)
+        if vid is None:
+            vid = len(self.points)
+            self.points.append(tuple(float(c) for c in vertex))
+            self.cubes.setdefault(self.cube(vertex), []).append((vertex,
+                                                                  vid))
+        return vid
+
+    def find(self, vertex):
+        '''return the id of the vertex or None if it isn't in the table'''
+        cube = self.cube(vertex)
+        vid = self.search(vertex, [cube])
+        if vid is None:
+            vid = self.search(vertex, itertools.product(
+                *[(c - 1, c, c + 1) for c in cube]))
+        return vid
+
+    def search(self, vertex, cubes):
+        for cube in cubes:
+            for other, vid in self.cubes.get(cube, ()):
+                if self.same(vertex, other):
+                    return vid
+        return None